@@ -3,17 +3,22 @@ from django.contrib import admin
 from .models import (
     Profile,
     ChatHistory,
+    ChatSummary,
     TikTokVideo,
+    TikTokBatch,
     TrackingLink,
     LocationLog,
-    ScrapeResult
+    ScrapeResult,
+    ScrapeBatch,
+    ExtractionCache,
+    BackgroundJob
 )
 
 # Register your models here to make them accessible in the Django admin site.
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'full_name')
+    list_display = ('user', 'full_name', 'scrape_monthly_cost_cap')
     search_fields = ('user__username', 'full_name')
 
 @admin.register(ChatHistory)
@@ -26,6 +31,11 @@ class ChatHistoryAdmin(admin.ModelAdmin):
         return (obj.content[:75] + '...') if len(obj.content) > 75 else obj.content
     content_preview.short_description = 'Content'
 
+@admin.register(ChatSummary)
+class ChatSummaryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'last_message_id', 'updated_at')
+    search_fields = ('user__username', 'content')
+
 @admin.register(TikTokVideo)
 class TikTokVideoAdmin(admin.ModelAdmin):
     list_display = ('user', 'author', 'description_preview', 'status', 'created_at')
@@ -36,6 +46,11 @@ class TikTokVideoAdmin(admin.ModelAdmin):
         return (obj.description[:75] + '...') if obj.description and len(obj.description) > 75 else obj.description
     description_preview.short_description = 'Description'
 
+@admin.register(TikTokBatch)
+class TikTokBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'creator', 'status', 'video_count', 'duplicate_count', 'fetch_failed_count', 'created_at', 'completed_at')
+    list_filter = ('status', 'user')
+
 @admin.register(TrackingLink)
 class TrackingLinkAdmin(admin.ModelAdmin):
     list_display = ('user', 'original_url', 'tracking_id', 'created_at', 'require_consent')
@@ -53,6 +68,23 @@ class LocationLogAdmin(admin.ModelAdmin):
 
 @admin.register(ScrapeResult)
 class ScrapeResultAdmin(admin.ModelAdmin):
-    list_display = ('user', 'url', 'status', 'created_at', 'completed_at')
+    list_display = ('user', 'url', 'status', 'failed_chunks', 'estimated_cost', 'total_cost', 'created_at', 'completed_at')
     list_filter = ('status', 'user')
-    search_fields = ('url',)
\ No newline at end of file
+    search_fields = ('url',)
+
+@admin.register(ScrapeBatch)
+class ScrapeBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'total_urls', 'completed_count', 'failed_count', 'created_at', 'completed_at')
+    list_filter = ('status', 'user')
+
+@admin.register(ExtractionCache)
+class ExtractionCacheAdmin(admin.ModelAdmin):
+    list_display = ('key', 'model', 'hit_count', 'size_bytes', 'created_at', 'last_used_at')
+    list_filter = ('model',)
+    search_fields = ('key',)
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job_type', 'status', 'attempts', 'run_after', 'locked_by', 'created_at')
+    list_filter = ('job_type', 'status')
+    search_fields = ('locked_by', 'last_error')
\ No newline at end of file
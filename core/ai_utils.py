@@ -1,17 +1,19 @@
 # File: Rita_All_Django/core/AI_utils.py
 import os
+import threading
 import google.generativeai as genai
 import pandas as pd
 from django.conf import settings
-from .models import ChatHistory
+from asgiref.sync import sync_to_async
+from .models import Profile
+from .history_utils import abuild_history_window
+from .gemini_pool import get_generative_model
+from . import outbound_loop
 import logging
 
 # Cấu hình logging
 logger = logging.getLogger(__name__)
 
-# Cấu hình API key từ settings
-genai.configure(api_key=settings.GEMINI_API_KEY)
-
 # Hướng dẫn hệ thống MỚI cho AI, kết hợp vai trò, kiến thức chuyên môn và cá tính
 SYSTEM_PROMPT_TEMPLATE = """
 # Bối cảnh & Vai trò
@@ -73,78 +75,200 @@ def read_csv_data():
         return "Lỗi: Không thể đọc file dữ liệu Data.csv."
 
 
-def get_gemini_response(user_input, user, files=None, search_web=False):
+class _SystemPromptCache:
     """
-    Lấy phản hồi từ Gemini, kết hợp vai trò, kiến thức chuyên môn, cá tính, và khả năng xử lý tệp hiện đại.
+    Cache phần thân system prompt đã render sẵn dữ liệu Data.csv.
+    Chỉ đọc lại file khi mtime hoặc kích thước thay đổi; mỗi request chỉ còn thay thế {user_name}.
     """
-    try:
-        # Lấy tên người dùng và dữ liệu CSV để đưa vào prompt
-        user_name = user.profile.full_name if hasattr(user, 'profile') and user.profile.full_name else user.username
-        csv_data = read_csv_data()
-
-        # Điền thông tin vào mẫu system prompt
-        final_system_prompt = SYSTEM_PROMPT_TEMPLATE.format(
-            user_name=user_name,
-            csv_data=csv_data
-        )
 
-        # Thiết lập model với system prompt đã được cá nhân hóa
-        model = genai.GenerativeModel(
-            model_name='gemini-2.5-flash',
-            system_instruction=final_system_prompt
-        )
+    USER_NAME_PLACEHOLDER = '{user_name}'
 
-        chat_session = model.start_chat(
-            history=[msg.to_gemini_format() for msg in ChatHistory.objects.filter(user=user)]
-        )
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signature = None
+        self._body = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _file_signature(file_path):
+        try:
+            stat = os.stat(file_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            # File không tồn tại: vẫn cache thông báo lỗi cho tới khi file xuất hiện.
+            return None
+
+    def get_body(self):
+        file_path = os.path.join(settings.BASE_DIR, 'Data.csv')
+        signature = self._file_signature(file_path)
+        with self._lock:
+            if self._body is not None and signature == self._signature:
+                self.hits += 1
+                return self._body
+            self.misses += 1
+            self._body = SYSTEM_PROMPT_TEMPLATE.format(
+                user_name=self.USER_NAME_PLACEHOLDER,
+                csv_data=read_csv_data()
+            )
+            self._signature = signature
+            return self._body
+
+    def render(self, user_name):
+        return self.get_body().replace(self.USER_NAME_PLACEHOLDER, user_name, 1)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'signature': self._signature}
+
+
+_system_prompt_cache = _SystemPromptCache()
+
+
+def get_system_prompt(user_name):
+    """Trả về system prompt hoàn chỉnh cho người dùng, dùng phần thân đã được cache."""
+    return _system_prompt_cache.render(user_name)
+
+
+def get_system_prompt_cache_stats():
+    """Số lần hit/miss của cache system prompt, dùng để kiểm tra cache hoạt động."""
+    return _system_prompt_cache.stats()
+
+
+ERROR_RESPONSE_TEXT = "Xin lỗi, đã có lỗi xảy ra khi xử lý yêu cầu của bạn. Vui lòng thử lại sau."
+EMPTY_PROMPT_TEXT = "Vui lòng cung cấp tin nhắn hoặc tệp."
+
+
+async def _aprepare_chat(user_input, user, files=None, exclude_message_id=None):
+    """
+    Chuẩn bị phiên chat (system prompt, lịch sử, tệp đính kèm).
+    Trả về (chat_session, prompt_parts); prompt_parts rỗng nếu không có gì để gửi.
+    """
+    # Lấy tên người dùng để đưa vào prompt
+    full_name = await Profile.objects.filter(user=user).values_list('full_name', flat=True).afirst()
+    user_name = full_name or user.username
+
+    # Lần render đầu (hoặc khi Data.csv đổi) đọc file CSV, nên chạy trong thread riêng thay vì trên event loop
+    system_prompt = await sync_to_async(get_system_prompt, thread_sensitive=False)(user_name)
+
+    # Model dùng chung từ pool; lời gọi async tới Gemini chạy trên outbound_loop
+    model = get_generative_model(
+        'gemini-2.5-flash',
+        system_instruction=system_prompt
+    )
+    # Chỉ gửi cửa sổ lịch sử giới hạn (N lượt / M token) kèm tóm tắt các lượt cũ
+    chat_session = model.start_chat(
+        history=await abuild_history_window(user, exclude_id=exclude_message_id)
+    )
 
-        prompt_parts = []
-        if user_input:
-            prompt_parts.append(user_input)
+    prompt_parts = []
+    if user_input:
+        prompt_parts.append(user_input)
 
-        if files:
-            for uploaded_file in files:
-                uploaded_file.seek(0)
-                file_for_api = genai.upload_file(
-                    path=uploaded_file.temporary_file_path(),
-                    display_name=uploaded_file.name
-                )
-                prompt_parts.append(file_for_api)
+    if files:
+        upload_file = sync_to_async(genai.upload_file, thread_sensitive=False)
+        for uploaded_file in files:
+            uploaded_file.seek(0)
+            file_for_api = await upload_file(
+                path=uploaded_file.temporary_file_path(),
+                display_name=uploaded_file.name
+            )
+            prompt_parts.append(file_for_api)
 
+    return chat_session, prompt_parts
+
+
+def _search_tools(search_web):
+    # Kích hoạt hoặc vô hiệu hóa tìm kiếm web
+    return [genai.Tool.from_google_search({})] if search_web else None
+
+
+def _format_citations(response):
+    """Trả về phần "Nguồn tham khảo" nếu phản hồi có trích dẫn tìm kiếm, ngược lại chuỗi rỗng."""
+    try:
+        citations = []
+        if response.citations_metadata and response.citations_metadata.citation_sources:
+            for attribution in response.citations_metadata.citation_sources:
+                citations.append({
+                    'url': attribution.uri,
+                    'title': attribution.title,
+                })
+
+        if citations:
+            citation_text = "\n\n**Nguồn tham khảo:**\n"
+            for cit in citations:
+                citation_text += f"- [{cit['title']}]({cit['url']})\n"
+            return citation_text
+
+    except (AttributeError, ValueError) as e:
+        logger.warning(f"Không thể xử lý citation metadata: {e}")
+    return ""
+
+
+async def aget_gemini_response(user_input, user, files=None, search_web=False, exclude_message_id=None):
+    """
+    Lấy phản hồi từ Gemini, kết hợp vai trò, kiến thức chuyên môn, cá tính, và khả năng xử lý tệp hiện đại.
+    exclude_message_id: id tin nhắn hiện tại đã được lưu, để không gửi trùng vào lịch sử.
+    Dùng send_message_async để không giữ thread khi chờ model.
+    """
+    try:
+        chat_session, prompt_parts = await _aprepare_chat(user_input, user, files, exclude_message_id)
         if not prompt_parts:
-            return "Vui lòng cung cấp tin nhắn hoặc tệp."
+            return EMPTY_PROMPT_TEXT
 
-        # Kích hoạt hoặc vô hiệu hóa tìm kiếm web
-        tools = [genai.Tool.from_google_search({})] if search_web else None
+        response = await outbound_loop.run(chat_session.send_message_async(
+            prompt_parts,
+            tools=_search_tools(search_web),
+        ))
+        return response.text + _format_citations(response)
+
+    except Exception as e:
+        logger.error(f"Error getting Gemini response: {e}", exc_info=True)
+        return ERROR_RESPONSE_TEXT
+
+
+async def astream_gemini_response(user_input, user, files=None, search_web=False, exclude_message_id=None):
+    """
+    Phiên bản streaming của aget_gemini_response.
+    Việc chuẩn bị (lịch sử, upload tệp) được await ngay khi gọi, trong vòng đời request;
+    kết quả là một async iterator sinh ra từng đoạn văn bản khi Gemini trả về.
+    """
+    try:
+        chat_session, prompt_parts = await _aprepare_chat(user_input, user, files, exclude_message_id)
+    except Exception as e:
+        logger.error(f"Error preparing Gemini stream: {e}", exc_info=True)
+        prompt_parts, error_text = None, ERROR_RESPONSE_TEXT
+    else:
+        error_text = None if prompt_parts else EMPTY_PROMPT_TEXT
 
-        response = chat_session.send_message(
+    async def gemini_chunks():
+        # Chạy trên outbound_loop, cùng loop với async client của model
+        response = await chat_session.send_message_async(
             prompt_parts,
-            tools=tools,
+            tools=_search_tools(search_web),
+            stream=True,
         )
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk không có phần văn bản (ví dụ chunk kết thúc)
+                continue
+            if text:
+                yield text
+        citation_text = _format_citations(response)
+        if citation_text:
+            yield citation_text
 
-        # Xử lý các trích dẫn tìm kiếm nếu có
+    async def chunks():
+        if error_text:
+            yield error_text
+            return
         try:
-            citations = []
-            if response.citations_metadata and response.citations_metadata.citation_sources:
-                for attribution in response.citations_metadata.citation_sources:
-                    citations.append({
-                        'url': attribution.uri,
-                        'title': attribution.title,
-                    })
-
-            if citations:
-                response_text = response.text
-                response_text += "\n\n**Nguồn tham khảo:**\n"
-                for cit in citations:
-                    response_text += f"- [{cit['title']}]({cit['url']})\n"
-                return response_text
-
-        except (AttributeError, ValueError) as e:
-            logger.warning(f"Không thể xử lý citation metadata: {e}")
-            pass
-
-        return response.text
+            async for text in outbound_loop.iterate(gemini_chunks()):
+                yield text
+        except Exception as e:
+            logger.error(f"Error streaming Gemini response: {e}", exc_info=True)
+            yield ERROR_RESPONSE_TEXT
 
-    except Exception as e:
-        logger.error(f"Error getting Gemini response: {e}", exc_info=True)
-        return "Xin lỗi, đã có lỗi xảy ra khi xử lý yêu cầu của bạn. Vui lòng thử lại sau."
\ No newline at end of file
+    return chunks()
@@ -5,4 +5,8 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'core'
\ No newline at end of file
+    name = 'core'
+
+    def ready(self):
+        # Register background job handlers so every process (web and workers) knows them
+        from . import tasks  # noqa: F401
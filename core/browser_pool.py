@@ -0,0 +1,152 @@
+# File: Rita_All_Django/core/browser_pool.py
+import atexit
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPoolTimeout(Exception):
+    """Không có trình duyệt rảnh trong thời gian chờ cho phép."""
+
+
+class _PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class BrowserPool:
+    """
+    Pool giới hạn các trình duyệt Selenium headless sống lâu.
+    Mỗi tác vụ checkout một driver; driver được làm sạch (cookie, storage, tab) khi trả về,
+    và được thay mới sau max_pages trang hoặc khi bị crash.
+    """
+
+    def __init__(self, factory, max_size, max_pages):
+        self._factory = factory
+        self.max_size = max(1, max_size)
+        self.max_pages = max(1, max_pages)
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _take_idle(self):
+        with self._lock:
+            return self._idle.pop() if self._idle else None
+
+    @staticmethod
+    def _quit(entry):
+        try:
+            entry.driver.quit()
+        except Exception as e:
+            logger.warning(f"Lỗi khi đóng trình duyệt: {e}")
+
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _frame_origins(frame_tree):
+        frame = frame_tree.get('frame', {})
+        origins = {frame.get('securityOrigin')}
+        for child in frame_tree.get('childFrames') or []:
+            origins |= BrowserPool._frame_origins(child)
+        return origins
+
+    @staticmethod
+    def _visited_origins(driver):
+        """
+        Các origin mà tác vụ vừa dùng có thể đã ghi storage: trang và iframe đang mở ở mọi tab,
+        cùng các domain đã đặt cookie (gồm cả các trang trung gian khi redirect).
+        """
+        origins = set()
+        for handle in driver.window_handles:
+            driver.switch_to.window(handle)
+            origins |= BrowserPool._frame_origins(driver.execute_cdp_cmd('Page.getFrameTree', {})['frameTree'])
+        for cookie in driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', []):
+            domain = cookie.get('domain', '').lstrip('.')
+            if domain:
+                origins |= {f"https://{domain}", f"http://{domain}"}
+        return {origin for origin in origins if origin and origin.startswith(('http://', 'https://'))}
+
+    @staticmethod
+    def _reset(driver):
+        """
+        Xóa cookie, cache, storage (localStorage, IndexedDB, cache storage...) và các tab thừa để tác vụ sau
+        không thấy dữ liệu của tác vụ trước. Storage.clearDataForOrigin cần origin cụ thể (không có wildcard)
+        nên xóa từng origin trong _visited_origins. Lỗi CDP (trình duyệt không phải Chrome) được raise để
+        _release thay driver mới, vì xóa một phần thì không đáng tin.
+        """
+        origins = BrowserPool._visited_origins(driver)
+        for origin in origins:
+            driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+        driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get('about:blank')
+
+    def _release(self, entry, healthy):
+        recycle = not healthy or self._closed or entry.pages >= self.max_pages
+        if not recycle:
+            try:
+                self._reset(entry.driver)
+            except Exception as e:
+                logger.warning(f"Không thể làm sạch trình duyệt, sẽ thay mới: {e}")
+                recycle = True
+        if recycle:
+            self._quit(entry)
+        else:
+            with self._lock:
+                self._idle.append(entry)
+        self._slots.release()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Mượn một driver trong khối `with`; chặn tối đa `timeout` giây nếu pool đã dùng hết."""
+        if not self._slots.acquire(timeout=timeout):
+            raise BrowserPoolTimeout(f"Không có trình duyệt rảnh sau {timeout} giây.")
+        try:
+            entry = self._take_idle() or _PooledDriver(self._factory())
+        except Exception:
+            self._slots.release()
+            raise
+
+        healthy = True
+        try:
+            yield entry.driver
+        except Exception:
+            # Lỗi trang (timeout, JS...) không nhất thiết làm hỏng trình duyệt; chỉ loại bỏ nếu driver đã chết
+            healthy = self._is_alive(entry.driver)
+            raise
+        finally:
+            entry.pages += 1
+            self._release(entry, healthy)
+
+    def shutdown(self):
+        self._closed = True
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._quit(entry)
+
+    def stats(self):
+        with self._lock:
+            return {'idle': len(self._idle), 'max_size': self.max_size, 'max_pages': self.max_pages}
+
+
+def create_browser_pool(factory, max_size, max_pages):
+    pool = BrowserPool(factory, max_size, max_pages)
+    atexit.register(pool.shutdown)
+    return pool
@@ -0,0 +1,231 @@
+# File: Rita_All_Django/core/export_utils.py
+import os
+import re
+import csv
+import json
+import zlib
+import shutil
+import logging
+import tempfile
+
+from django.core.files import File
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet là tùy chọn: thiếu pyarrow thì chỉ xuất JSON/CSV/NDJSON
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Định dạng xuất -> (tên FileField trên ScrapeResult/ScrapeBatch, content type)
+EXPORT_FORMATS = {
+    'json': ('json_result', 'application/json; charset=utf-8'),
+    'csv': ('csv_result', 'text/csv; charset=utf-8'),
+    'ndjson': ('ndjson_result', 'application/x-ndjson; charset=utf-8'),
+    'parquet': ('parquet_result', 'application/vnd.apache.parquet'),
+}
+# Các định dạng văn bản được ghi trực tiếp từng dòng; Parquet được dựng sau từ file NDJSON
+STREAMED_FORMATS = ('json', 'csv', 'ndjson')
+GZIP_SUFFIX = '.gz'
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class ListingExportWriter:
+    """
+    Ghi listing lần lượt từng dòng ra file JSON, CSV và NDJSON tạm, thay vì dựng toàn bộ kết quả
+    (chuỗi JSON, DataFrame, chuỗi CSV) trong bộ nhớ. Dùng trong khối `with` để file tạm luôn được dọn.
+    """
+
+    def __init__(self, container_key, fieldnames):
+        self.container_key = container_key
+        self.count = 0
+        self._dir = tempfile.mkdtemp(prefix='scrape_export_')
+        self.paths = {fmt: os.path.join(self._dir, f"result.{fmt}") for fmt in EXPORT_FORMATS}
+        self._json = open(self.paths['json'], 'w', encoding='utf-8')
+        self._ndjson = open(self.paths['ndjson'], 'w', encoding='utf-8')
+        self._csv_file = open(self.paths['csv'], 'w', encoding='utf-8', newline='')
+        self.fieldnames = list(fieldnames)
+        self._csv = csv.DictWriter(self._csv_file, fieldnames=fieldnames, restval='', extrasaction='ignore', lineterminator='\n')
+        self._csv.writeheader()
+        self._json.write('{' + json.dumps(container_key) + ': [')
+        self._closed = False
+
+    def write(self, listing):
+        row = json.dumps(listing, ensure_ascii=False)
+        self._json.write((',' if self.count else '') + '\n  ' + row)
+        self._ndjson.write(row + '\n')
+        if isinstance(listing, dict):
+            self._csv.writerow({key: _csv_value(value) for key, value in listing.items()})
+        self.count += 1
+
+    def write_many(self, listings):
+        for listing in listings:
+            self.write(listing)
+
+    def close(self):
+        if self._closed:
+            return
+        self._json.write('\n]}\n' if self.count else ']}\n')
+        for fh in (self._json, self._ndjson, self._csv_file):
+            fh.close()
+        self._closed = True
+
+    def save_to(self, instance, basename):
+        """
+        Gắn các file đã ghi vào json_result / csv_result / ndjson_result của instance (chưa gọi instance.save()),
+        cùng parquet_result nếu có pyarrow.
+        """
+        self.close()
+        formats = list(STREAMED_FORMATS)
+        if parquet_available():
+            try:
+                write_parquet(self.paths['ndjson'], self.paths['parquet'], self.fieldnames)
+                formats.append('parquet')
+            except (pa.ArrowException, ValueError) as e:
+                logger.warning(f"Không thể ghi file Parquet: {e}")
+        for fmt in formats:
+            field_name, _ = EXPORT_FORMATS[fmt]
+            with open(self.paths[fmt], 'rb') as fh:
+                getattr(instance, field_name).save(f"{basename}.{fmt}", File(fh), save=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+        return False
+
+
+# --- Parquet ---
+PARQUET_ROW_GROUP_SIZE = 10000
+# Số có số 0 ở đầu (mã bưu chính, số điện thoại...) được giữ là chuỗi
+INT_RE = re.compile(r'^[+-]?(0|[1-9]\d{0,17})$')
+FLOAT_RE = re.compile(r'^[+-]?((0|[1-9]\d*)(\.\d+)?|\.\d+)([eE][+-]?\d+)?$')
+BOOL_VALUES = {'true': True, 'false': False}
+# Kiểu hẹp nhất trước; một giá trị không khớp sẽ nới kiểu của cả cột
+TYPE_ORDER = ('bool', 'int', 'float', 'string')
+
+
+def parquet_available():
+    return pq is not None
+
+
+def _value_type(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, (dict, list)):
+        return 'string'
+    text = str(value).strip()
+    if text.lower() in BOOL_VALUES:
+        return 'bool'
+    if INT_RE.match(text):
+        return 'int'
+    if FLOAT_RE.match(text):
+        return 'float'
+    return 'string'
+
+
+def _widen(current, new):
+    if current is None:
+        return new
+    if current == new:
+        return current
+    if {current, new} == {'int', 'float'}:
+        return 'float'
+    return 'string'
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _iter_ndjson_path(path):
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            if line.strip():
+                row = json.loads(line)
+                if isinstance(row, dict):
+                    yield row
+
+
+def infer_column_types(rows, columns):
+    """Suy ra kiểu (bool/int/float/string) cho từng cột từ mọi giá trị không rỗng; cột toàn rỗng là string."""
+    types = dict.fromkeys(columns)
+    for row in rows:
+        for column in columns:
+            value = row.get(column)
+            if not _is_empty(value) and types[column] != 'string':
+                types[column] = _widen(types[column], _value_type(value))
+    return {column: kind or 'string' for column, kind in types.items()}
+
+
+def _convert(value, kind):
+    if _is_empty(value):
+        return None
+    if kind == 'string':
+        return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else str(value)
+    if kind == 'bool':
+        return value if isinstance(value, bool) else BOOL_VALUES[str(value).strip().lower()]
+    if kind == 'int':
+        return int(value) if not isinstance(value, str) else int(value.strip())
+    return float(value) if not isinstance(value, str) else float(value.strip())
+
+
+def write_parquet(ndjson_path, parquet_path, columns):
+    """
+    Dựng file Parquet từ file NDJSON theo hai lượt đọc: lượt đầu suy ra kiểu cột,
+    lượt sau ghi theo từng row group nên bộ nhớ chỉ giữ tối đa PARQUET_ROW_GROUP_SIZE dòng.
+    """
+    arrow_types = {'bool': pa.bool_(), 'int': pa.int64(), 'float': pa.float64(), 'string': pa.string()}
+    types = infer_column_types(_iter_ndjson_path(ndjson_path), columns)
+    schema = pa.schema([(column, arrow_types[types[column]]) for column in columns])
+
+    def to_table(rows):
+        return pa.Table.from_pydict(
+            {column: [_convert(row.get(column), types[column]) for row in rows] for column in columns}, schema=schema
+        )
+
+    with pq.ParquetWriter(parquet_path, schema, compression='zstd') as writer:
+        rows = []
+        for row in _iter_ndjson_path(ndjson_path):
+            rows.append(row)
+            if len(rows) >= PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(to_table(rows))
+                rows = []
+        if rows:
+            writer.write_table(to_table(rows))
+    return types
+
+
+def iter_ndjson(file_field):
+    """Đọc lần lượt từng listing từ một file NDJSON đã lưu."""
+    with file_field.open('rb') as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_gzip(file_obj, chunk_size=STREAM_CHUNK_SIZE):
+    """Nén gzip file theo từng khối khi tải xuống, không cần lưu thêm bản .gz."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with file_obj:
+        for chunk in iter(lambda: file_obj.read(chunk_size), b''):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
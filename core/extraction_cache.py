@@ -0,0 +1,76 @@
+# File: Rita_All_Django/core/extraction_cache.py
+import json
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import ExtractionCache
+
+logger = logging.getLogger(__name__)
+
+
+def extraction_cache_key(markdown_content, fields, model):
+    """Khóa nội dung: hash của Markdown đã làm sạch, danh sách trường (đã sắp xếp) và tên model."""
+    material = json.dumps([markdown_content, sorted(fields), model], ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def get_cached_extraction(key):
+    """Trả về (chuỗi JSON, token_counts gốc) nếu cache còn hạn, ngược lại None."""
+    if not settings.SCRAPER_EXTRACTION_CACHE_ENABLED:
+        return None
+    entry = ExtractionCache.objects.filter(key=key).first()
+    if entry is None:
+        return None
+    if entry.created_at < timezone.now() - timedelta(seconds=settings.SCRAPER_EXTRACTION_CACHE_TTL):
+        entry.delete()
+        return None
+    ExtractionCache.objects.filter(pk=entry.pk).update(hit_count=F('hit_count') + 1, last_used_at=timezone.now())
+    return entry.result_json, {"input_tokens": entry.input_tokens, "output_tokens": entry.output_tokens}
+
+
+def store_extraction(key, model, result_json, token_counts):
+    """Lưu kết quả trích xuất thành công rồi dọn cache theo TTL và kích thước."""
+    if not settings.SCRAPER_EXTRACTION_CACHE_ENABLED:
+        return
+    ExtractionCache.objects.update_or_create(
+        key=key,
+        defaults={
+            'model': model,
+            'result_json': result_json,
+            'input_tokens': token_counts.get("input_tokens", 0),
+            'output_tokens': token_counts.get("output_tokens", 0),
+            'size_bytes': len(result_json.encode('utf-8')),
+        },
+    )
+    evict_extraction_cache()
+
+
+def evict_extraction_cache():
+    """Xóa các mục hết hạn, sau đó xóa các mục ít được dùng gần đây nhất khi vượt giới hạn số lượng/dung lượng."""
+    expired_before = timezone.now() - timedelta(seconds=settings.SCRAPER_EXTRACTION_CACHE_TTL)
+    ExtractionCache.objects.filter(created_at__lt=expired_before).delete()
+
+    max_entries = settings.SCRAPER_EXTRACTION_CACHE_MAX_ENTRIES
+    overflow_ids = list(
+        ExtractionCache.objects.order_by('-last_used_at').values_list('id', flat=True)[max_entries:]
+    )
+    if overflow_ids:
+        ExtractionCache.objects.filter(pk__in=overflow_ids).delete()
+
+    max_bytes = settings.SCRAPER_EXTRACTION_CACHE_MAX_BYTES
+    total_bytes = ExtractionCache.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    if total_bytes <= max_bytes:
+        return
+    evict_ids = []
+    for entry_id, size in ExtractionCache.objects.order_by('last_used_at').values_list('id', 'size_bytes'):
+        if total_bytes <= max_bytes:
+            break
+        evict_ids.append(entry_id)
+        total_bytes -= size
+    ExtractionCache.objects.filter(pk__in=evict_ids).delete()
+    logger.info(f"Đã loại bỏ {len(evict_ids)} mục khỏi cache trích xuất do vượt dung lượng.")
@@ -0,0 +1,115 @@
+# File: Rita_All_Django/core/gemini_pool.py
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import google.generativeai as genai
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_configure_lock = threading.Lock()
+_configured = False
+
+
+def ensure_configured():
+    """Cấu hình API key cho google-generativeai đúng một lần trong mỗi process."""
+    global _configured
+    if _configured:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        api_key = getattr(settings, 'GEMINI_API_KEY', None) or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY/GOOGLE_API_KEY không được cấu hình.")
+        genai.configure(api_key=api_key)
+        _configured = True
+
+
+def _normalize_config_value(value):
+    """Chuyển giá trị trong generation_config thành dạng ổn định để làm khóa cache."""
+    if isinstance(value, type) and hasattr(value, 'model_json_schema'):
+        # Pydantic model động (response_schema): hai class cùng schema dùng chung một client
+        return json.dumps(value.model_json_schema(), sort_keys=True)
+    if isinstance(value, dict):
+        return {k: _normalize_config_value(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_config_value(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def _make_key(model_name, generation_config, system_instruction):
+    config_part = json.dumps(_normalize_config_value(generation_config or {}), sort_keys=True, default=str)
+    instruction_hash = hashlib.sha256((system_instruction or '').encode('utf-8')).hexdigest()
+    return (model_name, config_part, instruction_hash)
+
+
+class GenerativeModelPool:
+    """Registry dùng chung các genai.GenerativeModel, giới hạn kích thước bằng LRU."""
+
+    def __init__(self, max_size):
+        self.max_size = max(1, max_size)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name, generation_config=None, system_instruction=None):
+        ensure_configured()
+        key = _make_key(model_name, generation_config, system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return model
+            self.misses += 1
+
+        kwargs = {'model_name': model_name}
+        if generation_config:
+            kwargs['generation_config'] = generation_config
+        if system_instruction:
+            kwargs['system_instruction'] = system_instruction
+        model = genai.GenerativeModel(**kwargs)
+
+        with self._lock:
+            # Một thread khác có thể đã tạo model cùng khóa trong lúc chờ
+            existing = self._models.get(key)
+            if existing is not None:
+                self._models.move_to_end(key)
+                return existing
+            self._models[key] = model
+            while len(self._models) > self.max_size:
+                evicted_key, _ = self._models.popitem(last=False)
+                logger.debug(f"Loại bỏ GenerativeModel khỏi pool: {evicted_key[0]}")
+        return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._models), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+_pool = GenerativeModelPool(getattr(settings, 'GEMINI_MODEL_POOL_SIZE', 32))
+
+
+def get_generative_model(model_name, generation_config=None, system_instruction=None):
+    """
+    Lấy (hoặc tạo mới) một GenerativeModel dùng chung theo model, config và system instruction.
+    Các lời gọi async (generate_content_async, send_message_async) phải chạy trên outbound_loop:
+    model giữ async client grpc.aio mặc định của genai, gắn với loop đầu tiên dùng nó.
+    """
+    return _pool.get(model_name, generation_config=generation_config, system_instruction=system_instruction)
+
+
+def get_model_pool_stats():
+    return _pool.stats()
@@ -0,0 +1,187 @@
+# File: Rita_All_Django/core/history_utils.py
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChatHistory, ChatSummary
+from .gemini_pool import get_generative_model
+from .job_queue import enqueue, heartbeat, active_payload_values, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# Ước lượng thô: khoảng 4 ký tự cho mỗi token
+CHARS_PER_TOKEN = 4
+
+# Job nền cập nhật bản tóm tắt hội thoại (handler đăng ký trong tasks.py)
+JOB_TYPE_CHAT_SUMMARY = 'chat_summary'
+
+SUMMARY_PROMPT_TEMPLATE = """Bạn đang duy trì bản tóm tắt cuộc trò chuyện giữa người dùng và Rita (trợ lý AI).
+Hãy cập nhật bản tóm tắt dưới đây bằng các tin nhắn mới. Giữ lại các sự kiện, sở thích, yêu cầu và quyết định quan trọng.
+Viết ngắn gọn (tối đa khoảng 200 từ), không thêm lời dẫn.
+
+Bản tóm tắt hiện tại:
+{summary}
+
+Các tin nhắn mới:
+{messages}
+"""
+
+
+def estimate_tokens(text):
+    """Ước lượng số token của một đoạn văn bản mà không cần gọi API."""
+    return max(1, len(text or '') // CHARS_PER_TOKEN)
+
+
+def _recent_rows_queryset(user_id, exclude_id=None):
+    """Chỉ lấy các cột cần thiết (id, role, content) của N lượt gần nhất, mới nhất trước."""
+    max_messages = settings.CHAT_HISTORY_MAX_TURNS * 2
+    if max_messages <= 0:
+        return None
+    queryset = ChatHistory.objects.filter(user_id=user_id)
+    if exclude_id is not None:
+        queryset = queryset.exclude(pk=exclude_id)
+    return queryset.order_by('-id').values_list('id', 'role', 'content')[:max_messages]
+
+
+def _fetch_recent_rows(user_id, exclude_id=None):
+    queryset = _recent_rows_queryset(user_id, exclude_id)
+    if queryset is None:
+        return []
+    rows = list(queryset)
+    rows.reverse()
+    return rows
+
+
+async def _afetch_recent_rows(user_id, exclude_id=None):
+    queryset = _recent_rows_queryset(user_id, exclude_id)
+    if queryset is None:
+        return []
+    rows = [row async for row in queryset]
+    rows.reverse()
+    return rows
+
+
+def _apply_token_budget(rows, reserved_tokens=0):
+    """
+    Bỏ bớt các tin nhắn cũ nhất cho tới khi tổng token nằm trong ngân sách.
+    reserved_tokens (phần tóm tắt) được trừ trước để bản tóm tắt luôn có chỗ.
+    """
+    budget = settings.CHAT_HISTORY_MAX_TOKENS
+    if budget > 0:
+        budget = max(0, budget - reserved_tokens)
+        total = 0
+        start = len(rows)
+        for index in range(len(rows) - 1, -1, -1):
+            total += estimate_tokens(rows[index][2])
+            if total > budget:
+                break
+            start = index
+        rows = rows[start:]
+    # Lịch sử gửi cho Gemini nên bắt đầu bằng lượt của người dùng
+    while rows and rows[0][1] != 'user':
+        rows = rows[1:]
+    return rows
+
+
+def _pending_summary_queryset(user_id, last_message_id, window_start_id):
+    """Các tin nhắn đã rơi khỏi cửa sổ nhưng chưa được gộp vào tóm tắt (window_start_id=None: cửa sổ rỗng)."""
+    pending = ChatHistory.objects.filter(user_id=user_id, pk__gt=last_message_id)
+    if window_start_id is not None:
+        pending = pending.filter(pk__lt=window_start_id)
+    return pending
+
+
+def _summary_batch_queryset(pending):
+    return pending.order_by('id').values_list('id', 'role', 'content')[:settings.CHAT_HISTORY_SUMMARY_BATCH]
+
+
+def _summary_prompt(summary, rows):
+    messages = "\n".join(f"- {role}: {content}" for _, role, content in rows)
+    return SUMMARY_PROMPT_TEMPLATE.format(summary=summary.content or "(chưa có)", messages=messages)
+
+
+def refresh_summary(user_id):
+    """
+    Gộp toàn bộ tin nhắn đã rơi khỏi cửa sổ vào bản tóm tắt lưu trong DB.
+    Chạy trong job nền (JOB_TYPE_CHAT_SUMMARY), không nằm trên đường đi của request chat;
+    mỗi lần gọi Gemini chỉ xử lý tối đa CHAT_HISTORY_SUMMARY_BATCH tin nhắn để prompt luôn bị chặn.
+    """
+    summary, _ = ChatSummary.objects.get_or_create(user_id=user_id)
+    rows = _apply_token_budget(_fetch_recent_rows(user_id), _summary_reserved_tokens(summary))
+    window_start_id = rows[0][0] if rows else None
+
+    model = get_generative_model(settings.CHAT_SUMMARY_MODEL)
+    while True:
+        pending = _pending_summary_queryset(user_id, summary.last_message_id, window_start_id)
+        batch = list(_summary_batch_queryset(pending))
+        if not batch:
+            return summary
+
+        response = model.generate_content(_summary_prompt(summary, batch))
+        content = response.text.strip()
+        # Compare-and-set: nếu một job khác đã cập nhật tóm tắt trước thì dừng, không ghi đè
+        updated = ChatSummary.objects.filter(pk=summary.pk, last_message_id=summary.last_message_id).update(
+            content=content, last_message_id=batch[-1][0], updated_at=timezone.now(),
+        )
+        if not updated:
+            logger.info(f"Tóm tắt hội thoại của user #{user_id} đã được cập nhật bởi job khác.")
+            return summary
+        summary.content, summary.last_message_id = content, batch[-1][0]
+        logger.info(f"Đã cập nhật tóm tắt hội thoại cho user #{user_id} tới tin nhắn #{summary.last_message_id}")
+        heartbeat()
+
+
+def _schedule_summary(user_id):
+    """Đưa job tóm tắt vào hàng đợi, trừ khi user đã có một job đang chờ/đang chạy."""
+    if user_id in active_payload_values(JOB_TYPE_CHAT_SUMMARY, 'user_id'):
+        return
+    try:
+        enqueue(JOB_TYPE_CHAT_SUMMARY, {'user_id': user_id})
+    except QueueFullError as e:
+        # Tóm tắt là tùy chọn: lượt chat sau sẽ lên lịch lại
+        logger.warning(f"Không thể lên lịch tóm tắt hội thoại: {e}")
+
+
+_aschedule_summary = sync_to_async(_schedule_summary)
+
+
+def _summary_turns(summary):
+    if not summary or not summary.content:
+        return []
+    return [
+        {'role': 'user', 'parts': [f"(Tóm tắt các phần trước của cuộc trò chuyện)\n{summary.content}"]},
+        {'role': 'model', 'parts': ["Đã hiểu, tôi sẽ tiếp tục dựa trên bối cảnh này."]},
+    ]
+
+
+def _summary_reserved_tokens(summary):
+    return sum(estimate_tokens(turn['parts'][0]) for turn in _summary_turns(summary))
+
+
+def _assemble_history(summary, rows):
+    history = _summary_turns(summary)
+    history.extend({'role': role, 'parts': [content]} for _, role, content in rows)
+    return history
+
+
+async def abuild_history_window(user, exclude_id=None):
+    """
+    Trả về lịch sử (định dạng Gemini) giới hạn theo số lượt và ngân sách token,
+    luôn kèm bản tóm tắt các lượt cũ hơn nếu được bật (token của tóm tắt được trừ trước).
+    """
+    summary = None
+    if settings.CHAT_HISTORY_SUMMARY_ENABLED:
+        summary = await ChatSummary.objects.filter(user=user).afirst()
+    rows = _apply_token_budget(
+        await _afetch_recent_rows(user.pk, exclude_id=exclude_id), _summary_reserved_tokens(summary)
+    )
+
+    if settings.CHAT_HISTORY_SUMMARY_ENABLED:
+        window_start_id = rows[0][0] if rows else exclude_id
+        last_message_id = summary.last_message_id if summary else 0
+        if await _pending_summary_queryset(user.pk, last_message_id, window_start_id).aexists():
+            await _aschedule_summary(user.pk)
+
+    return _assemble_history(summary, rows)
@@ -0,0 +1,156 @@
+# File: Rita_All_Django/core/html_cleaning.py
+import re
+import logging
+from collections import Counter
+
+from lxml import etree
+from lxml import html as lxml_html
+
+logger = logging.getLogger(__name__)
+
+# Bỏ hẳn cùng nội dung: không bao giờ chứa dữ liệu listing
+STRIP_TAGS = ('script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'object', 'embed', 'select', 'link', 'meta')
+# Khung trang (menu, chân trang...): bỏ nếu không chứa các item lặp lại
+BOILERPLATE_TAGS = {'nav', 'footer', 'header', 'aside', 'dialog'}
+# So khớp với nguyên một class/id (không phải chuỗi con): "page has-sidebar" hay "card-header" không phải boilerplate
+BOILERPLATE_TOKENS = frozenset({
+    'nav', 'navbar', 'navigation', 'menu', 'main-nav', 'main-menu', 'site-nav', 'mobile-menu',
+    'footer', 'site-footer', 'header', 'site-header', 'sidebar', 'breadcrumb', 'breadcrumbs',
+    'cookie', 'cookies', 'cookie-banner', 'cookie-consent', 'consent', 'gdpr', 'banner',
+    'ad', 'ads', 'advert', 'advertisement', 'sponsor', 'sponsored', 'promo', 'popup', 'modal', 'overlay',
+    'newsletter', 'subscribe', 'social', 'share', 'comment', 'comments',
+    'skip-link', 'visually-hidden', 'sr-only',
+})
+# Bên trong một item chỉ bỏ các widget không mang dữ liệu (nút chia sẻ, so sánh...)
+ITEM_NOISE_TOKENS = frozenset({'share', 'social', 'wishlist', 'compare', 'sponsor', 'sponsored'})
+HIDDEN_STYLE_RE = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden', re.IGNORECASE)
+# Một nhóm anh em cùng tag + class được coi là danh sách item khi đủ số lượng và đủ nội dung
+MIN_REPEATED_ITEMS = 3
+MIN_ITEM_TEXT_CHARS = 30
+
+
+def _marker_tokens(element):
+    """Các class và id của phần tử, viết thường, mỗi giá trị là một token nguyên vẹn."""
+    return {token.lower() for token in f"{element.get('class') or ''} {element.get('id') or ''}".split()}
+
+
+def _signature(element):
+    return element.tag, " ".join(sorted((element.get('class') or '').split()))
+
+
+def _text_length(element):
+    return len(" ".join(element.text_content().split()))
+
+
+def _is_page_chrome(element):
+    """Khung trang xác định theo tag/role (nav, footer...): các cột link lặp lại ở đây không phải listing."""
+    return element.tag in BOILERPLATE_TAGS or element.get('role') in ('navigation', 'banner', 'contentinfo', 'dialog')
+
+
+def _protected_elements(root):
+    """
+    Tìm các container lặp lại (thẻ sản phẩm, dòng kết quả...). Trả về (items, kept): kept gồm các item
+    và mọi tổ tiên của chúng, để bước lọc boilerplate không xóa nhầm danh sách chỉ vì class như 'promo'
+    hay vì nằm trong <aside>.
+    """
+    items_found, kept = set(), set()
+    for parent in root.iter():
+        if not isinstance(parent.tag, str):
+            continue
+        children = [child for child in parent if isinstance(child.tag, str)]
+        if len(children) < MIN_REPEATED_ITEMS:
+            continue
+        if _is_page_chrome(parent) or any(_is_page_chrome(ancestor) for ancestor in parent.iterancestors()):
+            continue
+        for signature, count in Counter(_signature(child) for child in children).items():
+            if count < MIN_REPEATED_ITEMS:
+                continue
+            items = [child for child in children if _signature(child) == signature]
+            if sum(_text_length(item) for item in items) / len(items) < MIN_ITEM_TEXT_CHARS:
+                # Menu, danh sách tag ngắn... không phải listing
+                continue
+            items_found.update(items)
+            kept.update(items)
+            kept.add(parent)
+            kept.update(parent.iterancestors())
+    return items_found, kept
+
+
+def _is_hidden(element):
+    if element.get('hidden') is not None or element.get('aria-hidden') == 'true':
+        return True
+    return bool(HIDDEN_STYLE_RE.search(element.get('style') or ''))
+
+
+def _is_boilerplate(element):
+    if _is_page_chrome(element) or _is_hidden(element):
+        return True
+    return not BOILERPLATE_TOKENS.isdisjoint(_marker_tokens(element))
+
+
+def _own_text_length(element):
+    """Độ dài phần chữ nằm trực tiếp trong phần tử (không tính chữ của phần tử con)."""
+    parts = [element.text or ''] + [child.tail or '' for child in element]
+    return len(" ".join(" ".join(parts).split()))
+
+
+def _main_content_elements(root):
+    """
+    Vùng nội dung chính không bao giờ được xóa: <main>, role="main", <article> và khối chữ dài nhất trang,
+    cùng mọi tổ tiên của chúng (wrapper có class lạ không được kéo theo cả nội dung).
+    """
+    anchors = [
+        element for element in root.iter()
+        if isinstance(element.tag, str) and (element.tag in ('main', 'article') or element.get('role') == 'main')
+    ]
+    # Chữ dài nằm trong <footer>/<nav>... (điều khoản, danh mục) không phải nội dung chính
+    candidates = (
+        element for element in root.iter()
+        if isinstance(element.tag, str)
+        and not _is_page_chrome(element) and not any(_is_page_chrome(ancestor) for ancestor in element.iterancestors())
+    )
+    largest_block = max(candidates, key=_own_text_length, default=None)
+    if largest_block is not None and _own_text_length(largest_block):
+        anchors.append(largest_block)
+
+    protected = set()
+    for element in anchors:
+        protected.add(element)
+        protected.update(element.iterancestors())
+    return protected
+
+
+def clean_html(html_content):
+    """
+    Làm sạch HTML bằng lxml trước khi chuyển sang Markdown: bỏ script/style/nav/footer...,
+    lọc khung trang theo tag và class/id, nhưng giữ nguyên các container item lặp lại
+    cũng như main/article và khối chữ dài nhất (kèm các tổ tiên của chúng).
+    Trả về HTML (chuỗi) của phần body đã làm sạch.
+    """
+    document = lxml_html.document_fromstring(html_content)
+    etree.strip_elements(document, *STRIP_TAGS, with_tail=False)
+    etree.strip_elements(document, etree.Comment, etree.ProcessingInstruction, with_tail=False)
+
+    body = document.find('body')
+    root = body if body is not None else document
+    items, kept = _protected_elements(root)
+    kept |= _main_content_elements(root)
+
+    # Duyệt từ ngoài vào: khi một phần tử bị xóa thì con của nó không cần xét nữa
+    removed = set()
+    for element in list(root.iterdescendants()):
+        if not isinstance(element.tag, str) or element in kept:
+            continue
+        ancestors = list(element.iterancestors())
+        if any(ancestor in removed for ancestor in ancestors):
+            continue
+        if any(ancestor in items for ancestor in ancestors):
+            # Bên trong một item (ví dụ <header class="card-header"> chứa tiêu đề) chỉ bỏ phần bị ẩn hoặc widget
+            if _is_hidden(element) or not ITEM_NOISE_TOKENS.isdisjoint(_marker_tokens(element)):
+                removed.add(element)
+        elif _is_boilerplate(element):
+            removed.add(element)
+    for element in removed:
+        element.drop_tree()
+
+    return lxml_html.tostring(root, encoding='unicode')
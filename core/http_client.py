@@ -0,0 +1,89 @@
+# File: Rita_All_Django/core/http_client.py
+import random
+import asyncio
+import logging
+
+import httpx
+from django.conf import settings
+
+from . import outbound_loop
+
+try:
+    import h2  # noqa: F401  (httpx chỉ bật HTTP/2 khi có gói h2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+# Lỗi tạm thời từ phía server: đáng thử lại
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Một client cho cả process, chỉ dùng trên outbound_loop (kết nối của httpx gắn với loop đã tạo ra nó)
+_client = None
+
+
+def get_async_client():
+    """
+    httpx.AsyncClient dùng chung, giữ kết nối keep-alive (và HTTP/2 nếu có h2) giữa các request,
+    dù request đến từ ASGI, WSGI hay job. Chỉ gọi từ code chạy trên outbound_loop (xem aget).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(settings.HTTP_CLIENT_TIMEOUT, connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+            ),
+            headers={'User-Agent': USER_AGENT},
+            follow_redirects=True,
+        )
+    return _client
+
+
+async def _close_client():
+    if _client is not None:
+        await _client.aclose()
+
+outbound_loop.on_shutdown(_close_client)
+
+
+def _retry_delay(attempt, response=None):
+    """Exponential backoff kèm jitter; tôn trọng Retry-After (tính bằng giây) nếu server gửi."""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), settings.HTTP_CLIENT_MAX_BACKOFF)
+    base = settings.HTTP_CLIENT_BACKOFF_SECONDS * (2 ** attempt)
+    return min(base + random.uniform(0, base), settings.HTTP_CLIENT_MAX_BACKOFF)
+
+
+async def aget(url, params=None):
+    """
+    GET qua client dùng chung, thử lại tối đa HTTP_CLIENT_RETRIES lần khi lỗi kết nối/timeout
+    hoặc mã trạng thái tạm thời (429, 5xx). Raise httpx.HTTPError nếu vẫn thất bại.
+    Request chạy trên outbound_loop; response đã được đọc hết nên dùng được ở loop của người gọi.
+    """
+    return await outbound_loop.run(_aget(url, params))
+
+
+async def _aget(url, params):
+    client = get_async_client()
+    retries = settings.HTTP_CLIENT_RETRIES
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            response = await client.get(url, params=params)
+        except httpx.TransportError as e:
+            if attempt >= retries:
+                raise
+            logger.warning(f"Lỗi kết nối tới {url} ({e!r}), thử lại lần {attempt + 1}/{retries}.")
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                response.raise_for_status()
+                return response
+            logger.warning(f"{url} trả về {response.status_code}, thử lại lần {attempt + 1}/{retries}.")
+        await asyncio.sleep(_retry_delay(attempt, response))
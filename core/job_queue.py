@@ -0,0 +1,247 @@
+# File: Rita_All_Django/core/job_queue.py
+import random
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# job_type -> (handler, on_failure)
+_handlers = {}
+# Job đang chạy trên thread hiện tại, dùng cho heartbeat()
+_current = threading.local()
+
+
+class QueueFullError(Exception):
+    """Hàng đợi của loại job này đã đầy, caller nên yêu cầu người dùng thử lại sau."""
+
+
+class PermanentJobError(Exception):
+    """Lỗi mà thử lại cũng không khắc phục được (ví dụ vượt ngân sách): job thất bại ngay, không retry."""
+
+
+def job_handler(job_type, on_failure=None):
+    """
+    Decorator đăng ký hàm xử lý cho một loại job.
+    Handler nhận payload dưới dạng keyword arguments; exception sẽ khiến job được thử lại.
+    on_failure(payload, error_message) được gọi khi job thất bại hẳn (hết số lần thử).
+    """
+    def decorator(func):
+        _handlers[job_type] = (func, on_failure)
+        return func
+    return decorator
+
+
+def registered_job_types():
+    return list(_handlers)
+
+
+def queue_depth(job_type):
+    return BackgroundJob.objects.filter(job_type=job_type, status='PENDING').count()
+
+
+def enqueue(job_type, payload=None, max_attempts=None, delay_seconds=0):
+    """Thêm job vào hàng đợi; raise QueueFullError nếu vượt JOB_QUEUE_MAX_PENDING (backpressure)."""
+    max_pending = settings.JOB_QUEUE_MAX_PENDING
+    if max_pending and queue_depth(job_type) >= max_pending:
+        raise QueueFullError(f"Hàng đợi '{job_type}' đã đầy ({max_pending} job đang chờ).")
+    return BackgroundJob.objects.create(
+        job_type=job_type,
+        payload=payload or {},
+        max_attempts=max_attempts or settings.JOB_QUEUE_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay_seconds),
+    )
+
+
+# Bản async cho các view async: ORM chạy trong thread riêng, không chặn event loop
+aenqueue = sync_to_async(enqueue)
+
+
+def claim_next(job_type, worker_id):
+    """
+    Nhận (claim) job sẵn sàng tiếp theo bằng một UPDATE có điều kiện (compare-and-set),
+    an toàn giữa nhiều worker kể cả trên SQLite. Trả về None nếu không có job.
+    """
+    for _ in range(5):
+        now = timezone.now()
+        candidate_id = (
+            BackgroundJob.objects
+            .filter(job_type=job_type, status='PENDING', run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if candidate_id is None:
+            return None
+        claimed = BackgroundJob.objects.filter(pk=candidate_id, status='PENDING').update(
+            status='PROCESSING',
+            locked_by=worker_id,
+            lease_expires_at=now + timedelta(seconds=settings.JOB_QUEUE_LEASE_SECONDS),
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return BackgroundJob.objects.get(pk=candidate_id)
+        # Worker khác đã lấy job này trước, thử job kế tiếp
+    return None
+
+
+def _retry_delay(attempts):
+    """Exponential backoff kèm jitter."""
+    base = settings.JOB_QUEUE_RETRY_BACKOFF_SECONDS * (2 ** max(0, attempts - 1))
+    return base + random.uniform(0, base / 2)
+
+
+def _owned(job):
+    """
+    Job vẫn thuộc về worker đã claim nó. Nếu lease đã hết và worker khác đã nhận lại job,
+    mọi UPDATE lọc theo điều kiện này sẽ không ghi đè trạng thái của lần chạy mới.
+    """
+    return BackgroundJob.objects.filter(pk=job.pk, status='PROCESSING', locked_by=job.locked_by)
+
+
+def _fail_or_retry(job, error_message, retry=True):
+    now = timezone.now()
+    if retry and job.attempts < job.max_attempts:
+        delay = _retry_delay(job.attempts)
+        updated = _owned(job).update(
+            status='PENDING', locked_by='', lease_expires_at=None,
+            run_after=now + timedelta(seconds=delay), last_error=error_message, updated_at=now,
+        )
+        if not updated:
+            logger.warning(f"[JOB {job.pk}] Worker {job.locked_by} đã mất lease, bỏ qua việc thử lại.")
+            return
+        logger.warning(f"[JOB {job.pk}] Thử lại lần {job.attempts + 1}/{job.max_attempts} sau {delay:.0f}s.")
+        return
+
+    updated = _owned(job).update(
+        status='FAILED', locked_by='', lease_expires_at=None,
+        last_error=error_message, completed_at=now, updated_at=now,
+    )
+    if not updated:
+        logger.warning(f"[JOB {job.pk}] Worker {job.locked_by} đã mất lease, không đánh dấu thất bại.")
+        return
+    logger.error(f"[JOB {job.pk}] Thất bại sau {job.attempts} lần thử.")
+    _, on_failure = _handlers.get(job.job_type, (None, None))
+    if on_failure:
+        try:
+            on_failure(job.payload, error_message)
+        except Exception as e:
+            logger.error(f"[JOB {job.pk}] Lỗi trong on_failure: {e}", exc_info=True)
+
+
+def run_job(job):
+    """Chạy một job đã được claim và cập nhật trạng thái theo kết quả."""
+    handler, _ = _handlers.get(job.job_type, (None, None))
+    if handler is None:
+        _fail_or_retry(job, f"Không có handler cho loại job '{job.job_type}'.")
+        return
+
+    _current.job_id, _current.worker_id = job.pk, job.locked_by
+    try:
+        handler(**job.payload)
+    except PermanentJobError as e:
+        logger.error(f"[JOB {job.pk}] {job.job_type} lỗi không thể thử lại: {e}")
+        _fail_or_retry(job, str(e), retry=False)
+        return
+    except Exception as e:
+        logger.error(f"[JOB {job.pk}] {job.job_type} lỗi: {e}", exc_info=True)
+        _fail_or_retry(job, f"{e}\n{traceback.format_exc()}")
+        return
+    finally:
+        _current.job_id, _current.worker_id = None, None
+
+    now = timezone.now()
+    updated = _owned(job).update(
+        status='COMPLETE', locked_by='', lease_expires_at=None, completed_at=now, updated_at=now,
+    )
+    if not updated:
+        logger.warning(f"[JOB {job.pk}] Worker {job.locked_by} đã mất lease trước khi hoàn tất job.")
+
+
+def _extend_lease(job_id, worker_id):
+    now = timezone.now()
+    BackgroundJob.objects.filter(pk=job_id, status='PROCESSING', locked_by=worker_id).update(
+        lease_expires_at=now + timedelta(seconds=settings.JOB_QUEUE_LEASE_SECONDS), updated_at=now,
+    )
+
+
+def heartbeat():
+    """
+    Gia hạn lease của job đang chạy trên thread hiện tại.
+    Handler chạy lâu (ví dụ batch nhiều URL) gọi hàm này định kỳ để không bị coi là worker đã chết.
+    """
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is None:
+        return
+    _extend_lease(job_id, _current.worker_id)
+
+
+@contextmanager
+def keep_alive():
+    """
+    Gia hạn lease định kỳ trên một thread phụ trong khi khối lệnh chạy, cho các lời gọi chặn lâu
+    mà handler không thể tự chen heartbeat() vào (Selenium, Gemini). Ngoài job thì không làm gì.
+    """
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is None:
+        yield
+        return
+    worker_id = _current.worker_id
+    interval = max(1, settings.JOB_QUEUE_LEASE_SECONDS // 3)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                _extend_lease(job_id, worker_id)
+        except Exception as e:
+            logger.warning(f"[JOB {job_id}] Không thể gia hạn lease: {e}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"job-{job_id}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def recover_stale_jobs():
+    """Trả các job PROCESSING đã hết lease (worker chết giữa chừng) về hàng đợi hoặc đánh dấu thất bại."""
+    now = timezone.now()
+    stale_jobs = list(BackgroundJob.objects.filter(status='PROCESSING', lease_expires_at__lt=now))
+    for job in stale_jobs:
+        logger.warning(f"[JOB {job.pk}] Lease hết hạn (worker: {job.locked_by}), khôi phục job.")
+        _fail_or_retry(job, f"Lease hết hạn khi đang chạy trên worker {job.locked_by}.")
+    return len(stale_jobs)
+
+
+def active_payload_values(job_type, key):
+    """Tập giá trị payload[key] (hoặc các phần tử nếu là list) của các job đang chờ/đang chạy, dùng để tìm bản ghi mồ côi."""
+    payloads = BackgroundJob.objects.filter(
+        job_type=job_type, status__in=['PENDING', 'PROCESSING']
+    ).values_list('payload', flat=True)
+    values = set()
+    for payload in payloads:
+        if not isinstance(payload, dict):
+            continue
+        # Job xử lý theo lô lưu danh sách id (ví dụ video_pks)
+        value = payload.get(key)
+        if isinstance(value, list):
+            values.update(value)
+        else:
+            values.add(value)
+    return values
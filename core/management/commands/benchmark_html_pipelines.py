@@ -0,0 +1,54 @@
+# File: Rita_All_Django/core/management/commands/benchmark_html_pipelines.py
+import os
+import re
+import glob
+import time
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import scraper_utils
+from core.history_utils import estimate_tokens
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'benchmark_fixtures')
+LINK_RE = re.compile(r'\]\(([^)\s]+)')
+
+
+class Command(BaseCommand):
+    help = "So sánh thời gian và kích thước Markdown của các pipeline làm sạch HTML trên các trang mẫu đã lưu."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help="Các file HTML cần đo; mặc định là mọi file .html trong core/benchmark_fixtures/.")
+        parser.add_argument('--repeat', type=int, default=5, help="Số lần chạy mỗi pipeline (lấy trung vị).")
+        parser.add_argument('--pipeline', action='append', choices=scraper_utils.HTML_PIPELINES,
+                            help="Chỉ đo pipeline này (có thể lặp lại). Mặc định đo tất cả.")
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+        if not paths:
+            raise CommandError("Không có file HTML nào để đo.")
+        pipelines = options['pipeline'] or list(scraper_utils.HTML_PIPELINES)
+        repeat = max(1, options['repeat'])
+
+        for path in paths:
+            try:
+                with open(path, encoding='utf-8') as fh:
+                    html_content = fh.read()
+            except OSError as e:
+                raise CommandError(f"Không đọc được {path}: {e}")
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{os.path.basename(path)} ({len(html_content.encode('utf-8')) / 1024:.0f} KB HTML)"
+            ))
+            for pipeline in pipelines:
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    markdown_content = scraper_utils.html_to_markdown(html_content, pipeline)
+                    timings.append(time.perf_counter() - started)
+                # Số link khác nhau còn lại: thước đo thô cho việc các item listing có được giữ lại hay không
+                links = len(set(LINK_RE.findall(markdown_content)))
+                self.stdout.write(
+                    f"  {pipeline:<12} {statistics.median(timings) * 1000:8.1f} ms  {len(markdown_content):8d} ký tự  "
+                    f"~{estimate_tokens(markdown_content):6d} token  {links:4d} link"
+                )
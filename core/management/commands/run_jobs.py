@@ -0,0 +1,118 @@
+# File: Rita_All_Django/core/management/commands/run_jobs.py
+import os
+import time
+import socket
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from core import job_queue, scraper_utils, scraper_limits
+from core.tasks import recover_orphaned_rows, JOB_TYPE_SCRAPE, JOB_TYPE_SCRAPE_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Chạy worker xử lý hàng đợi job nền (scrape, phân tích TikTok...) lưu trong database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', action='append', default=[], metavar='JOB_TYPE=N',
+            help="Số job chạy song song cho mỗi loại job, ví dụ --concurrency scrape=2. "
+                 "Mặc định lấy từ settings.JOB_QUEUE_CONCURRENCY."
+        )
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_QUEUE_POLL_INTERVAL,
+                            help="Số giây chờ giữa các lần kiểm tra khi hàng đợi trống.")
+        parser.add_argument('--once', action='store_true',
+                            help="Xử lý hết các job đang sẵn sàng rồi thoát.")
+
+    def _parse_concurrency(self, values):
+        concurrency = dict(settings.JOB_QUEUE_CONCURRENCY)
+        for value in values:
+            job_type, _, count = value.partition('=')
+            if not count.isdigit():
+                raise CommandError(f"Giá trị --concurrency không hợp lệ: '{value}'")
+            concurrency[job_type] = int(count)
+        unknown = set(concurrency) - set(job_queue.registered_job_types())
+        if unknown:
+            raise CommandError(f"Loại job không được đăng ký: {', '.join(sorted(unknown))}")
+        return {job_type: count for job_type, count in concurrency.items() if count > 0}
+
+    def _worker_loop(self, job_type, worker_id, stop_event, poll_interval, once):
+        try:
+            while not stop_event.is_set():
+                close_old_connections()
+                job = job_queue.claim_next(job_type, worker_id)
+                if job is None:
+                    if once:
+                        return
+                    stop_event.wait(poll_interval)
+                    continue
+                logger.info(f"[{worker_id}] Bắt đầu job {job}.")
+                job_queue.run_job(job)
+        except Exception as e:
+            logger.error(f"[{worker_id}] Worker dừng do lỗi: {e}", exc_info=True)
+        finally:
+            connection.close()
+
+    def _recover(self):
+        stale = job_queue.recover_stale_jobs()
+        orphaned = recover_orphaned_rows()
+        if stale or orphaned:
+            self.stdout.write(f"Khôi phục {stale} job hết lease, {orphaned} bản ghi mồ côi.")
+
+    def _publish_metrics(self, worker_name):
+        try:
+            scraper_limits.publish_stats(worker_name)
+        except OSError as e:
+            logger.warning(f"Không ghi được số liệu giới hạn tốc độ: {e}")
+
+    def handle(self, *args, **options):
+        concurrency = self._parse_concurrency(options['concurrency'])
+        if not concurrency:
+            raise CommandError("Không có loại job nào được bật.")
+
+        if JOB_TYPE_SCRAPE in concurrency or JOB_TYPE_SCRAPE_BATCH in concurrency:
+            # Phân giải chromedriver ngay khi khởi động: thiếu driver thì dừng luôn thay vì lỗi ở từng tác vụ
+            try:
+                scraper_utils.get_chromedriver_path()
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+
+        self._recover()
+
+        stop_event = threading.Event()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        threads = []
+        for job_type, count in concurrency.items():
+            for index in range(count):
+                worker_id = f"{prefix}:{job_type}:{index}"
+                thread = threading.Thread(
+                    target=self._worker_loop, name=worker_id, daemon=True,
+                    args=(job_type, worker_id, stop_event, options['poll_interval'], options['once']),
+                )
+                thread.start()
+                threads.append(thread)
+        self.stdout.write(self.style.SUCCESS(
+            "Worker đã khởi động: " + ", ".join(f"{t}={c}" for t, c in concurrency.items())
+        ))
+
+        last_recovery = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(1)
+                if time.monotonic() - last_recovery >= settings.JOB_QUEUE_RECOVERY_INTERVAL:
+                    close_old_connections()
+                    self._recover()
+                    self._publish_metrics(prefix)
+                    last_recovery = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write("Đang dừng worker, chờ các job hiện tại hoàn tất...")
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS("Worker đã dừng."))
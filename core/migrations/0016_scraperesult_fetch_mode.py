@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scraperesult',
+            name='fetch_mode',
+            field=models.CharField(choices=[('auto', 'Auto (HTTP, browser fallback)'), ('http', 'HTTP only'), ('browser', 'Browser')], default='auto', max_length=10),
+        ),
+    ]
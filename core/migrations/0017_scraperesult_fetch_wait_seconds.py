@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_scraperesult_fetch_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scraperesult',
+            name='fetch_wait_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_scraperesult_fetch_wait_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scraperesult',
+            name='cache_hit',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ExtractionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model', models.CharField(max_length=100)),
+                ('result_json', models.TextField()),
+                ('input_tokens', models.IntegerField(default=0)),
+                ('output_tokens', models.IntegerField(default=0)),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Extraction Cache Entry',
+                'verbose_name_plural': 'Extraction Cache',
+                'ordering': ['-last_used_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_extractioncache_scraperesult_cache_hit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fields', models.CharField(max_length=1024)),
+                ('model', models.CharField(max_length=100)),
+                ('fetch_mode', models.CharField(choices=[('auto', 'Auto (HTTP, browser fallback)'), ('http', 'HTTP only'), ('browser', 'Browser')], default='auto', max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETE', 'Complete'), ('FAILED', 'Failed')], default='PENDING', max_length=15)),
+                ('total_urls', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('json_result', models.FileField(blank=True, null=True, upload_to='scrape_results/batch/json/')),
+                ('csv_result', models.FileField(blank=True, null=True, upload_to='scrape_results/batch/csv/')),
+                ('input_tokens', models.IntegerField(blank=True, null=True)),
+                ('output_tokens', models.IntegerField(blank=True, null=True)),
+                ('total_cost', models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Scrape Batch',
+                'verbose_name_plural': 'Scrape Batches',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='scraperesult',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='core.scrapebatch'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_scrapebatch_scraperesult_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scraperesult',
+            name='follow_pagination',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='scraperesult',
+            name='max_pages',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scraperesult',
+            name='pagination_time_budget',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scraperesult',
+            name='pages_scraped',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_scraperesult_pagination'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapebatch',
+            name='ndjson_result',
+            field=models.FileField(blank=True, null=True, upload_to='scrape_results/batch/ndjson/'),
+        ),
+        migrations.AddField(
+            model_name='scraperesult',
+            name='ndjson_result',
+            field=models.FileField(blank=True, null=True, upload_to='scrape_results/ndjson/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_scrape_ndjson_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapebatch',
+            name='parquet_result',
+            field=models.FileField(blank=True, null=True, upload_to='scrape_results/batch/parquet/'),
+        ),
+        migrations.AddField(
+            model_name='scraperesult',
+            name='parquet_result',
+            field=models.FileField(blank=True, null=True, upload_to='scrape_results/parquet/'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_scrape_parquet_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='scrape_monthly_cost_cap',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='scraperesult',
+            name='estimated_cost',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='scraperesult',
+            name='input_trimmed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_tiktokbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tiktokvideo',
+            name='analyzed_stats',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_tiktokvideo_analyzed_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scraperesult',
+            name='failed_chunks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_scraperesult_failed_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tiktokbatch',
+            name='existing_video_pks',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='tiktokbatch',
+            name='fetch_errors',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_tiktokbatch_existing_video_pks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tiktokbatch',
+            name='submitted_urls',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='tiktokbatch',
+            name='max_videos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,6 +1,7 @@
 # File: Rita_All_Django/core/models.py
 import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -12,6 +13,8 @@ class Profile(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     bio = models.TextField(blank=True, default='')
     avatar = models.ImageField(upload_to='avatars/', default='avatars/default.jpg')
+    # Monthly web-scraper spend cap in USD; empty falls back to SCRAPER_DEFAULT_MONTHLY_COST_CAP, 0 means unlimited
+    scrape_monthly_cost_cap = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
 
     def __str__(self):
         return self.user.username
@@ -38,6 +41,21 @@ class ChatHistory(models.Model):
     def __str__(self):
         return f'{self.user.username} ({self.role}): {self.content[:50]}'
 
+class ChatSummary(models.Model):
+    """Rolling summary of chat turns that have fallen out of the history window."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='chat_summary')
+    content = models.TextField(blank=True, default='')
+    # Highest ChatHistory id already folded into the summary
+    last_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Chat Summary"
+        verbose_name_plural = "Chat Summaries"
+
+    def __str__(self):
+        return f'Summary for {self.user.username} (up to #{self.last_message_id})'
+
 # --- TikTok Video Analysis ---
 class TikTokVideo(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tiktok_videos')
@@ -57,6 +75,8 @@ class TikTokVideo(models.Model):
     
     transcript = models.TextField(blank=True, null=True)
     analysis = models.JSONField(blank=True, null=True)
+    # Engagement stats the stored analysis was produced from; used to decide whether a resubmit can reuse it
+    analyzed_stats = models.JSONField(blank=True, null=True)
     
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -65,6 +85,8 @@ class TikTokVideo(models.Model):
         ('FAILED', 'Failed'),
     ]
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    # Set when the video was submitted as part of a bulk (URL list / creator feed) submission
+    batch = models.ForeignKey('TikTokBatch', on_delete=models.SET_NULL, null=True, blank=True, related_name='videos')
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -77,6 +99,35 @@ class TikTokVideo(models.Model):
     def __str__(self):
         return f"@{self.author}: {self.description[:50]}..."
 
+class TikTokBatch(models.Model):
+    """A bulk TikTok submission; its videos are analyzed by chunked background jobs and polled as one unit."""
+    STATUS_CHOICES = TikTokVideo.STATUS_CHOICES
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tiktok_batches')
+    # Creator username when the batch was built from a creator's feed
+    creator = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    submitted_count = models.PositiveIntegerField(default=0)
+    duplicate_count = models.PositiveIntegerField(default=0)
+    fetch_failed_count = models.PositiveIntegerField(default=0)
+    video_count = models.PositiveIntegerField(default=0)
+    # What was submitted, read by the metadata fetch job (and by crash recovery to re-queue it)
+    submitted_urls = models.JSONField(default=list, blank=True)
+    max_videos = models.PositiveIntegerField(default=0)
+    # Already-stored videos matching the submitted URLs; they are reported with the batch instead of re-analyzed
+    existing_video_pks = models.JSONField(default=list, blank=True)
+    # Metadata fetch errors ({'url' or 'creator', 'error'}), filled in by the fetch job
+    fetch_errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "TikTok Batch"
+        verbose_name_plural = "TikTok Batches"
+
+    def __str__(self):
+        return f"TikTok batch #{self.pk}: {self.video_count} videos ({self.status})"
+
 # --- Location Tracker ---
 class TrackingLink(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -119,21 +170,133 @@ class ScrapeResult(models.Model):
     url = models.URLField(max_length=2048)
     fields = models.CharField(max_length=1024)
     model = models.CharField(max_length=100)
+    FETCH_MODE_CHOICES = [
+        ('auto', 'Auto (HTTP, browser fallback)'),
+        ('http', 'HTTP only'),
+        ('browser', 'Browser'),
+    ]
+    fetch_mode = models.CharField(max_length=10, choices=FETCH_MODE_CHOICES, default='auto')
+    # Seconds spent waiting for the page to become ready (browser fetches), for per-site tuning
+    fetch_wait_seconds = models.FloatField(null=True, blank=True)
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
     json_result = models.FileField(upload_to='scrape_results/json/', null=True, blank=True)
     csv_result = models.FileField(upload_to='scrape_results/csv/', null=True, blank=True)
+    ndjson_result = models.FileField(upload_to='scrape_results/ndjson/', null=True, blank=True)
+    parquet_result = models.FileField(upload_to='scrape_results/parquet/', null=True, blank=True)
 
     input_tokens = models.IntegerField(null=True, blank=True)
     output_tokens = models.IntegerField(null=True, blank=True)
     total_cost = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    # Pre-flight estimate made before calling Gemini, and whether the content was cut to SCRAPER_MAX_INPUT_TOKENS_PER_TASK
+    estimated_cost = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    input_trimmed = models.BooleanField(default=False)
+    # Markdown chunks whose Gemini extraction failed; > 0 means the listings are only partial
+    failed_chunks = models.PositiveIntegerField(default=0)
     
     error_message = models.TextField(blank=True, null=True)
+    # True when the extraction was served from ExtractionCache (no Gemini tokens spent)
+    cache_hit = models.BooleanField(default=False)
+    # Pagination mode: follow "next" links from `url` up to max_pages / pagination_time_budget (seconds);
+    # empty limits fall back to SCRAPER_PAGINATION_MAX_PAGES / SCRAPER_PAGINATION_TIME_BUDGET
+    follow_pagination = models.BooleanField(default=False)
+    max_pages = models.PositiveIntegerField(null=True, blank=True)
+    pagination_time_budget = models.PositiveIntegerField(null=True, blank=True)
+    pages_scraped = models.PositiveIntegerField(null=True, blank=True)
+    # Set for the per-URL children of a ScrapeBatch; those are run by the batch job, not individually
+    batch = models.ForeignKey('ScrapeBatch', on_delete=models.CASCADE, null=True, blank=True, related_name='tasks')
 
     def __str__(self):
         return f"Scrape task for {self.url} ({self.status})"
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class ScrapeBatch(models.Model):
+    """Many URLs scraped with the same field schema; results are merged into one JSON/CSV artifact."""
+    STATUS_CHOICES = ScrapeResult.STATUS_CHOICES
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    fields = models.CharField(max_length=1024)
+    model = models.CharField(max_length=100)
+    fetch_mode = models.CharField(max_length=10, choices=ScrapeResult.FETCH_MODE_CHOICES, default='auto')
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='PENDING')
+    total_urls = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    json_result = models.FileField(upload_to='scrape_results/batch/json/', null=True, blank=True)
+    csv_result = models.FileField(upload_to='scrape_results/batch/csv/', null=True, blank=True)
+    ndjson_result = models.FileField(upload_to='scrape_results/batch/ndjson/', null=True, blank=True)
+    parquet_result = models.FileField(upload_to='scrape_results/batch/parquet/', null=True, blank=True)
+
+    input_tokens = models.IntegerField(null=True, blank=True)
+    output_tokens = models.IntegerField(null=True, blank=True)
+    total_cost = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+
+    error_message = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Scrape batch #{self.pk}: {self.total_urls} URLs ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Scrape Batch"
+        verbose_name_plural = "Scrape Batches"
+
+class ExtractionCache(models.Model):
+    """Gemini extraction result keyed by a hash of the cleaned markdown, sorted field list and model."""
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    result_json = models.TextField()
+    input_tokens = models.IntegerField(default=0)
+    output_tokens = models.IntegerField(default=0)
+    size_bytes = models.PositiveIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-last_used_at']
+        verbose_name = "Extraction Cache Entry"
+        verbose_name_plural = "Extraction Cache"
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]}… ({self.hit_count} hits)"
+
+# --- Background Jobs ---
+class BackgroundJob(models.Model):
+    """A unit of background work (scrape, TikTok analysis...) claimed by `manage.py run_jobs` workers."""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('COMPLETE', 'Complete'),
+        ('FAILED', 'Failed'),
+    ]
+    job_type = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+
+    # Lease held by the worker currently running the job
+    locked_by = models.CharField(max_length=255, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['job_type', 'status', 'run_after'], name='core_job_claim_idx')]
+        verbose_name = "Background Job"
+        verbose_name_plural = "Background Jobs"
+
+    def __str__(self):
+        return f"{self.job_type} #{self.pk} ({self.status})"
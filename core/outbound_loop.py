@@ -0,0 +1,76 @@
+# File: Rita_All_Django/core/outbound_loop.py
+import atexit
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_loop_lock = threading.Lock()
+# Coroutine function đóng tài nguyên gắn với loop (client httpx...), chạy khi process thoát
+_closers = []
+
+
+def get_loop():
+    """
+    Event loop sống lâu (chạy trên một thread riêng) cho mọi lời gọi mạng async ra ngoài.
+    Client httpx / grpc.aio gắn với loop tạo ra chúng; dùng chung một loop cho cả process thì
+    các request WSGI và job (async_to_sync, mỗi lần một loop mới) dùng lại cùng kết nối
+    thay vì mỗi lần tạo một client rồi bỏ đó không đóng.
+    """
+    global _loop
+    if _loop is not None:
+        return _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='outbound-loop', daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def on_shutdown(closer):
+    """Đăng ký coroutine function (không tham số) được chạy trên loop này khi process thoát."""
+    _closers.append(closer)
+
+
+async def run(coro):
+    """Chạy coroutine trên loop dùng chung và await kết quả từ loop hiện tại (hủy ở đây thì hủy luôn bên kia)."""
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+async def _anext(iterator):
+    try:
+        return True, await iterator.__anext__()
+    except StopAsyncIteration:
+        return False, None
+
+
+async def iterate(async_iterable):
+    """Duyệt một async iterator trên loop dùng chung, trả từng phần tử về loop hiện tại."""
+    iterator = aiter(async_iterable)
+    try:
+        while True:
+            has_item, item = await run(_anext(iterator))
+            if not has_item:
+                return
+            yield item
+    finally:
+        if hasattr(iterator, 'aclose'):
+            await run(iterator.aclose())
+
+
+@atexit.register
+def _shutdown():
+    if _loop is None:
+        return
+    for closer in _closers:
+        try:
+            asyncio.run_coroutine_threadsafe(closer(), _loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"Lỗi khi đóng tài nguyên của outbound loop: {e}")
+    _loop.call_soon_threadsafe(_loop.stop)
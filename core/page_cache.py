@@ -0,0 +1,207 @@
+# File: Rita_All_Django/core/page_cache.py
+import os
+import glob
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Dọn cache (duyệt cả thư mục) tối đa một lần mỗi khoảng này trong mỗi process
+SWEEP_INTERVAL_SECONDS = 300
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+@dataclass
+class CachedPage:
+    url: str
+    html: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    markdown: Optional[str] = None
+
+
+def _base_path(url):
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(settings.SCRAPER_PAGE_CACHE_DIR, digest[:2], digest)
+
+
+def _atomic_write(path, content):
+    """Ghi file qua file tạm + os.replace để worker khác không bao giờ đọc phải file ghi dở."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _markdown_path(base, pipeline):
+    # Mỗi pipeline làm sạch HTML cho ra Markdown khác nhau nên được cache riêng
+    return f"{base}.{pipeline}.md"
+
+
+def _entry_files(base):
+    return [base + '.json', base + '.html', *glob.glob(glob.escape(base) + '*.md')]
+
+
+def _remove_entry(base):
+    """Xóa một mục cache; file .json bị xóa trước để load() không đọc phải mục dở dang."""
+    for path in _entry_files(base):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _is_expired(mtime, now=None):
+    return (now or time.time()) - mtime > settings.SCRAPER_PAGE_CACHE_TTL
+
+
+def load(url, pipeline):
+    """Đọc trang đã cache (HTML + ETag/Last-Modified + Markdown của pipeline nếu có). Trả về None nếu chưa có."""
+    if not settings.SCRAPER_PAGE_CACHE_ENABLED:
+        return None
+    base = _base_path(url)
+    try:
+        if _is_expired(os.path.getmtime(base + '.json')):
+            _remove_entry(base)
+            return None
+    except OSError:
+        return None
+    meta_text, html = _read(base + '.json'), _read(base + '.html')
+    if meta_text is None or html is None:
+        return None
+    try:
+        meta = json.loads(meta_text)
+    except json.JSONDecodeError:
+        return None
+    return CachedPage(
+        url=url,
+        html=html,
+        etag=meta.get('etag'),
+        last_modified=meta.get('last_modified'),
+        markdown=_read(_markdown_path(base, pipeline)),
+    )
+
+
+def conditional_headers(page):
+    """Header If-None-Match / If-Modified-Since để server trả 304 nếu trang không đổi."""
+    headers = {}
+    if page is None:
+        return headers
+    if page.etag:
+        headers['If-None-Match'] = page.etag
+    if page.last_modified:
+        headers['If-Modified-Since'] = page.last_modified
+    return headers
+
+
+def store(url, html, etag=None, last_modified=None):
+    """Lưu HTML cùng validator; chỉ lưu khi server cung cấp ETag hoặc Last-Modified."""
+    if not settings.SCRAPER_PAGE_CACHE_ENABLED or not (etag or last_modified):
+        return
+    base = _base_path(url)
+    try:
+        _atomic_write(base + '.html', html)
+        # Markdown cũ (của mọi pipeline) không còn khớp với HTML mới
+        for markdown_path in glob.glob(glob.escape(base) + '*.md'):
+            os.remove(markdown_path)
+        _atomic_write(base + '.json', json.dumps({
+            'url': url, 'etag': etag, 'last_modified': last_modified,
+            'fetched_at': timezone.now().isoformat(),
+        }))
+    except OSError as e:
+        logger.warning(f"Không thể ghi cache trang cho {url}: {e}")
+    _maybe_sweep()
+
+
+def mark_used(url):
+    """Server xác nhận trang không đổi (304): gia hạn TTL và đánh dấu mục vừa được dùng (cho LRU)."""
+    if not settings.SCRAPER_PAGE_CACHE_ENABLED:
+        return
+    try:
+        os.utime(_base_path(url) + '.json')
+    except OSError:
+        pass
+
+
+def store_markdown(url, markdown_content, pipeline):
+    """Lưu Markdown đã chuyển đổi cho trang đang có trong cache (bỏ qua nếu trang không được cache)."""
+    if not settings.SCRAPER_PAGE_CACHE_ENABLED:
+        return
+    base = _base_path(url)
+    if not os.path.exists(base + '.json'):
+        return
+    try:
+        _atomic_write(_markdown_path(base, pipeline), markdown_content)
+    except OSError as e:
+        logger.warning(f"Không thể ghi cache Markdown cho {url}: {e}")
+
+
+def _maybe_sweep():
+    global _last_sweep
+    with _sweep_lock:
+        if time.monotonic() - _last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        _last_sweep = time.monotonic()
+    try:
+        sweep()
+    except OSError as e:
+        logger.warning(f"Không thể dọn cache trang: {e}")
+
+
+def sweep():
+    """
+    Xóa các mục hết hạn (không được dùng trong SCRAPER_PAGE_CACHE_TTL giây), sau đó xóa các mục
+    ít được dùng gần đây nhất cho tới khi tổng dung lượng <= SCRAPER_PAGE_CACHE_MAX_BYTES.
+    Trả về số mục đã xóa.
+    """
+    now = time.time()
+    removed = 0
+    entries = []
+    for meta_path in glob.glob(os.path.join(glob.escape(settings.SCRAPER_PAGE_CACHE_DIR), '*', '*.json')):
+        base = meta_path[:-len('.json')]
+        try:
+            last_used = os.path.getmtime(meta_path)
+            size = sum(os.path.getsize(path) for path in _entry_files(base) if os.path.exists(path))
+        except OSError:
+            continue
+        if _is_expired(last_used, now):
+            _remove_entry(base)
+            removed += 1
+            continue
+        entries.append((last_used, size, base))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    if total_bytes > settings.SCRAPER_PAGE_CACHE_MAX_BYTES:
+        for _, size, base in sorted(entries):
+            if total_bytes <= settings.SCRAPER_PAGE_CACHE_MAX_BYTES:
+                break
+            _remove_entry(base)
+            total_bytes -= size
+            removed += 1
+    if removed:
+        logger.info(f"Đã xóa {removed} mục khỏi cache trang.")
+    return removed
@@ -0,0 +1,111 @@
+# File: Rita_All_Django/core/scrape_budget.py
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import ScrapeResult
+from .job_queue import PermanentJobError
+from .scraper_utils import calculate_price
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT_STATUSES = ['PENDING', 'PROCESSING']
+
+
+class BudgetExceededError(PermanentJobError):
+    """Chi phí ước lượng vượt ngân sách scraper còn lại trong tháng của người dùng."""
+
+
+def _month_start():
+    return timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def monthly_cost_cap(user):
+    """Hạn mức chi phí/tháng (USD) của người dùng; None nghĩa là không giới hạn."""
+    cap = getattr(getattr(user, 'profile', None), 'scrape_monthly_cost_cap', None)
+    if cap is None:
+        cap = settings.SCRAPER_DEFAULT_MONTHLY_COST_CAP
+    cap = Decimal(str(cap)) if cap is not None else None
+    return cap if cap else None
+
+
+def monthly_spend(user):
+    """
+    Chi phí Gemini trong tháng của các tác vụ scraper (kể cả con của batch): chi phí đã trả (total_cost,
+    ghi ngay sau mỗi lời gọi Gemini nên gồm cả các lần chạy thất bại), cộng phần ước lượng còn giữ chỗ
+    (estimated_cost) của tác vụ đang chờ/đang chạy.
+    """
+    tasks = ScrapeResult.objects.filter(user=user, created_at__gte=_month_start())
+    totals = tasks.aggregate(
+        spent=Sum('total_cost'),
+        reserved=Sum('estimated_cost', filter=Q(status__in=IN_FLIGHT_STATUSES)),
+    )
+    return (totals['spent'] or Decimal('0')) + (totals['reserved'] or Decimal('0'))
+
+
+def remaining_budget(user):
+    """Ngân sách còn lại trong tháng (USD, có thể âm); None nếu người dùng không bị giới hạn."""
+    cap = monthly_cost_cap(user)
+    if cap is None:
+        return None
+    return cap - monthly_spend(user)
+
+
+def _lock_user_budget(user_id):
+    """
+    Khóa ngân sách của người dùng tới hết transaction bằng một lệnh ghi thật lên dòng User:
+    SQLite bỏ qua select_for_update(), còn một lệnh UPDATE thì giữ khóa ghi của cả database
+    (PostgreSQL/MySQL: khóa dòng), nên các transaction khác gọi hàm này phải chờ tới khi commit.
+    Phải là lệnh đầu tiên của transaction để không đọc dữ liệu cũ trước khi có khóa.
+    """
+    get_user_model().objects.filter(pk=user_id).update(is_active=F('is_active'))
+
+
+def reserve_budget(task, estimated_cost):
+    """
+    Giữ chỗ chi phí ước lượng trước khi gửi request tới Gemini: cộng vào estimated_cost của tác vụ và ghi ngay
+    xuống DB, nhờ đó các tác vụ chạy song song của cùng người dùng thấy phần đã giữ chỗ trong monthly_spend.
+    Kiểm tra và ghi diễn ra sau _lock_user_budget trong cùng transaction, nên hai tác vụ không thể cùng lọt qua ngưỡng.
+    Sau lời gọi Gemini, record_spend chuyển phần giữ chỗ thành chi phí thực tế.
+    Raise BudgetExceededError nếu chi phí ước lượng vượt ngân sách còn lại.
+    """
+    estimated_cost = Decimal(str(round(estimated_cost, 6)))
+    with transaction.atomic():
+        _lock_user_budget(task.user_id)
+        remaining = remaining_budget(task.user)
+        if remaining is not None and estimated_cost > remaining:
+            logger.warning(f"Người dùng {task.user_id}: chi phí ước lượng ${estimated_cost:.4f} vượt ngân sách còn lại ${remaining:.4f}.")
+            raise BudgetExceededError(
+                f"Estimated cost ${estimated_cost:.4f} exceeds your remaining monthly scraping budget (${max(remaining, 0):.4f})."
+            )
+        ScrapeResult.objects.filter(pk=task.pk).update(estimated_cost=Coalesce('estimated_cost', Decimal('0')) + estimated_cost)
+    task.refresh_from_db(fields=['estimated_cost'])
+    return estimated_cost
+
+
+def record_spend(task, tokens_count, reserved_cost):
+    """
+    Ghi chi phí thực tế của một lời gọi Gemini ngay khi đã trả tiền, trước khi kiểm tra phản hồi: cộng dồn token
+    và total_cost của tác vụ qua mọi lần chạy (kể cả lần thất bại rồi retry) và giải phóng phần đã giữ chỗ cho lời gọi đó.
+    """
+    input_tokens, output_tokens, cost = calculate_price(tokens_count, model=task.model)
+    cost = Decimal(str(round(cost, 6)))
+    ScrapeResult.objects.filter(pk=task.pk).update(
+        input_tokens=Coalesce('input_tokens', 0) + input_tokens,
+        output_tokens=Coalesce('output_tokens', 0) + output_tokens,
+        total_cost=Coalesce('total_cost', Decimal('0')) + cost,
+        estimated_cost=Greatest(Coalesce('estimated_cost', Decimal('0')) - reserved_cost, Decimal('0')),
+    )
+    task.refresh_from_db(fields=['input_tokens', 'output_tokens', 'total_cost', 'estimated_cost'])
+
+
+def release_reservation(task):
+    """Bỏ phần giữ chỗ còn sót lại từ lần chạy trước (lần đó đã dừng trước khi record_spend được gọi)."""
+    ScrapeResult.objects.filter(pk=task.pk).update(estimated_cost=None)
+    task.estimated_cost = None
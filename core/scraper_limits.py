@@ -0,0 +1,232 @@
+# File: Rita_All_Django/core/scraper_limits.py
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_domain_lock = threading.Lock()
+_domain_semaphores = {}
+
+
+def domain_of(url):
+    """Host (chữ thường, bỏ 'www.') dùng làm khóa giới hạn theo domain."""
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def _semaphore_for(domain):
+    with _domain_lock:
+        semaphore = _domain_semaphores.get(domain)
+        if semaphore is None:
+            overrides = getattr(settings, 'SCRAPER_PER_DOMAIN_CONCURRENCY_OVERRIDES', {})
+            limit = overrides.get(domain, settings.SCRAPER_PER_DOMAIN_CONCURRENCY)
+            semaphore = threading.BoundedSemaphore(max(1, limit))
+            _domain_semaphores[domain] = semaphore
+        return semaphore
+
+
+@contextmanager
+def domain_slot(url):
+    """
+    Giữ một slot fetch của domain trong khối `with`, để dù có bao nhiêu tác vụ/batch chạy song song,
+    mỗi domain chỉ nhận tối đa SCRAPER_PER_DOMAIN_CONCURRENCY request đồng thời từ process này.
+    """
+    domain = domain_of(url)
+    semaphore = _semaphore_for(domain)
+    if not semaphore.acquire(blocking=False):
+        logger.debug(f"Đang chờ slot fetch cho domain {domain}...")
+        semaphore.acquire()
+    try:
+        yield domain
+    finally:
+        semaphore.release()
+
+
+class TokenBucket:
+    """
+    Token bucket: tối đa `burst` request liền nhau, sau đó `rate` request/giây.
+    acquire() giữ chỗ một token rồi ngủ ngoài lock, nên các thread chờ được xếp hàng công bằng.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = max(rate, 0.001)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reconfigure(self, rate, burst):
+        with self._lock:
+            self.rate = max(rate, 0.001)
+            self.burst = max(1.0, float(burst))
+            self._tokens = min(self._tokens, self.burst)
+
+    def acquire(self):
+        """Lấy một token, chờ nếu cần. Trả về số giây đã chờ."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class _DomainStats:
+    def __init__(self):
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+_buckets = {}
+_stats = {}
+_robots_cache = {}  # domain -> (expires_at, crawl_delay or None)
+_limiter_lock = threading.Lock()
+
+
+def _fetch_crawl_delay(url):
+    """Đọc Crawl-delay (hoặc Request-rate) cho user-agent '*' trong robots.txt của host; None nếu không có."""
+    parsed = urlparse(url)
+    robots_url = f"{parsed.scheme or 'https'}://{parsed.netloc}/robots.txt"
+    try:
+        response = requests.get(robots_url, timeout=settings.SCRAPER_ROBOTS_TIMEOUT)
+        if response.status_code != 200:
+            return None
+        parser = RobotFileParser()
+        parser.parse(response.text.splitlines())
+        delay = parser.crawl_delay('*')
+        if delay is None:
+            request_rate = parser.request_rate('*')
+            if request_rate and request_rate.requests:
+                delay = request_rate.seconds / request_rate.requests
+        return float(delay) if delay else None
+    except (requests.RequestException, ValueError) as e:
+        logger.debug(f"Không đọc được {robots_url}: {e}")
+        return None
+
+
+def get_crawl_delay(url):
+    """Crawl-delay của domain, cache theo host trong SCRAPER_ROBOTS_CACHE_TTL giây."""
+    if not settings.SCRAPER_RESPECT_CRAWL_DELAY:
+        return None
+    domain = domain_of(url)
+    now = time.monotonic()
+    cached = _robots_cache.get(domain)
+    if cached and cached[0] > now:
+        return cached[1]
+    delay = _fetch_crawl_delay(url)
+    with _limiter_lock:
+        _robots_cache[domain] = (now + settings.SCRAPER_ROBOTS_CACHE_TTL, delay)
+    if delay:
+        logger.info(f"robots.txt của {domain} yêu cầu crawl-delay {delay:.1f}s.")
+    return delay
+
+
+def _bucket_params(domain, crawl_delay):
+    overrides = getattr(settings, 'SCRAPER_RATE_LIMIT_OVERRIDES', {}).get(domain, {})
+    rate = overrides.get('rate', settings.SCRAPER_RATE_LIMIT_PER_SECOND)
+    burst = overrides.get('burst', settings.SCRAPER_RATE_LIMIT_BURST)
+    if crawl_delay:
+        # Crawl-delay là khoảng cách tối thiểu giữa hai request: không cho phép burst
+        rate, burst = min(rate, 1.0 / crawl_delay), 1
+    return rate, burst
+
+
+def throttle(url):
+    """
+    Chờ tới lượt gửi request tới domain của `url` (token bucket dùng chung cho mọi tác vụ trong process).
+    Mọi đường fetch của scraper (HTTP, trình duyệt) gọi hàm này trước mỗi request. Trả về số giây đã chờ.
+    """
+    if not settings.SCRAPER_RATE_LIMIT_ENABLED:
+        return 0.0
+    domain = domain_of(url)
+    rate, burst = _bucket_params(domain, get_crawl_delay(url))
+    with _limiter_lock:
+        bucket = _buckets.get(domain)
+        if bucket is None:
+            bucket = _buckets[domain] = TokenBucket(rate, burst)
+        elif (bucket.rate, bucket.burst) != (max(rate, 0.001), max(1.0, float(burst))):
+            bucket.reconfigure(rate, burst)
+        stats = _stats.setdefault(domain, _DomainStats())
+
+    wait = bucket.acquire()
+    with _limiter_lock:
+        stats.requests += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+        if wait > 0:
+            stats.throttled += 1
+    if wait > 1:
+        logger.info(f"Giới hạn tốc độ: chờ {wait:.2f}s trước khi gửi request tới {domain}.")
+    return wait
+
+
+def get_rate_limit_stats():
+    """Số liệu chờ theo domain (số request, số lần bị chờ, tổng/trung bình/tối đa thời gian chờ)."""
+    with _limiter_lock:
+        result = {}
+        for domain, stats in _stats.items():
+            bucket = _buckets.get(domain)
+            crawl_delay = _robots_cache.get(domain, (None, None))[1]
+            result[domain] = {
+                'requests': stats.requests,
+                'throttled': stats.throttled,
+                'total_wait_seconds': round(stats.total_wait, 3),
+                'avg_wait_seconds': round(stats.total_wait / stats.requests, 3) if stats.requests else 0.0,
+                'max_wait_seconds': round(stats.max_wait, 3),
+                'rate_per_second': bucket.rate if bucket else None,
+                'crawl_delay': crawl_delay,
+            }
+        return result
+
+
+def publish_stats(worker_name):
+    """
+    Ghi snapshot số liệu giới hạn tốc độ của process này ra SCRAPER_METRICS_DIR.
+    Fetch chạy trong process worker (run_jobs), nên web process đọc số liệu qua các file này.
+    """
+    os.makedirs(settings.SCRAPER_METRICS_DIR, exist_ok=True)
+    snapshot = {'worker': worker_name, 'updated_at': time.time(), 'domains': get_rate_limit_stats()}
+    path = os.path.join(settings.SCRAPER_METRICS_DIR, f"{worker_name.replace(':', '_')}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=settings.SCRAPER_METRICS_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump(snapshot, tmp_file)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_published_stats(max_age_seconds=None):
+    """Đọc snapshot của các worker còn hoạt động (cập nhật trong max_age_seconds gần nhất)."""
+    directory = settings.SCRAPER_METRICS_DIR
+    if not os.path.isdir(directory):
+        return []
+    cutoff = time.time() - max_age_seconds if max_age_seconds else None
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as fh:
+                snapshot = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        if cutoff is None or snapshot.get('updated_at', 0) >= cutoff:
+            snapshots.append(snapshot)
+    return snapshots
@@ -1,15 +1,24 @@
 # File: Rita_All_Django/core/scraper_utils.py
 import os
+import re
 import random
 import time
 import json
+import threading
 import logging
-from typing import List, Type
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Type
+from urllib.parse import urlparse, urljoin, parse_qsl
 
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 from pydantic import BaseModel, create_model
 from readability import Document
+from lxml import etree
 import html2text
 
 from selenium import webdriver
@@ -17,8 +26,14 @@ from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 
-import google.generativeai as genai
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .gemini_pool import get_generative_model
+from .history_utils import estimate_tokens, CHARS_PER_TOKEN
+from .browser_pool import create_browser_pool
+from . import page_cache, html_cleaning
+from .scraper_limits import domain_slot, throttle
 
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO)
@@ -29,11 +44,15 @@ USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
 ]
+# Giá mặc định (USD cho mỗi 1 triệu token); bổ sung hoặc ghi đè bằng settings.SCRAPER_MODEL_PRICING
 PRICING = {
-    "gemini-1.5-flash": {
-        "input": 0.075 / 1_000_000,
-        "output": 0.30 / 1_000_000,
-    }
+    "gemini-1.5-flash": {"input": 0.075, "output": 0.30},
+    "gemini-1.5-flash-8b": {"input": 0.0375, "output": 0.15},
+    "gemini-1.5-pro": {"input": 1.25, "output": 5.00},
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40},
+    "gemini-2.0-flash-lite": {"input": 0.075, "output": 0.30},
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+    "gemini-2.5-pro": {"input": 1.25, "output": 10.00},
 }
 HEADLESS_OPTIONS = ["--headless=new", "--disable-gpu", "--disable-dev-shm-usage", "--window-size=1920,1080"]
 SYSTEM_MESSAGE = """You are an intelligent text extraction and conversion assistant. Your task is to extract structured information 
@@ -43,6 +62,34 @@ SYSTEM_MESSAGE = """You are an intelligent text extraction and conversion assist
                         Please process the following text and provide the output in pure JSON format with no words before or after the JSON:"""
 USER_MESSAGE = "Extract the following information from the provided text:\nPage content:\n\n"
 
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+def get_chromedriver_path():
+    """
+    Trả về đường dẫn chromedriver, chỉ phân giải một lần mỗi process.
+    Ưu tiên settings.CHROMEDRIVER_PATH (biến môi trường CHROMEDRIVER_PATH), nếu không thì dùng webdriver-manager.
+    """
+    global _chromedriver_path
+    if _chromedriver_path:
+        return _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path:
+            return _chromedriver_path
+        override = settings.CHROMEDRIVER_PATH
+        if override:
+            if not os.path.isfile(override):
+                raise ImproperlyConfigured(f"CHROMEDRIVER_PATH không tồn tại: {override}")
+            path = override
+        else:
+            try:
+                path = ChromeDriverManager().install()
+            except Exception as e:
+                raise ImproperlyConfigured(f"Không thể cài đặt/tìm chromedriver: {e}") from e
+        logger.info(f"Sử dụng chromedriver tại: {path}")
+        _chromedriver_path = path
+        return path
+
 def setup_selenium():
     """Khởi tạo và cấu hình trình duyệt ảo Selenium."""
     options = Options()
@@ -50,32 +97,303 @@ def setup_selenium():
     options.add_argument(f"user-agent={user_agent}")
     for option in HEADLESS_OPTIONS:
         options.add_argument(option)
-    service = ChromeService(ChromeDriverManager().install())
+    service = ChromeService(get_chromedriver_path())
     driver = webdriver.Chrome(service=service, options=options)
     return driver
 
+# --- Chiến lược lấy trang: HTTP thuần, trình duyệt, hoặc tự động ---
+FETCH_MODE_HTTP = 'http'
+FETCH_MODE_BROWSER = 'browser'
+FETCH_MODE_AUTO = 'auto'
+FETCH_MODES = (FETCH_MODE_HTTP, FETCH_MODE_BROWSER, FETCH_MODE_AUTO)
+
+# Pipeline làm sạch HTML trước khi chuyển sang Markdown
+HTML_PIPELINE_READABILITY = 'readability'
+HTML_PIPELINE_LXML = 'lxml'
+HTML_PIPELINES = (HTML_PIPELINE_READABILITY, HTML_PIPELINE_LXML)
+# Markdown ngắn hơn mức này sau pipeline lxml được coi là lọc nhầm và chuyển sang readability
+LXML_MIN_MARKDOWN_CHARS = 200
+
+@dataclass
+class FetchResult:
+    html: str
+    strategy: str
+    # Markdown đã được tính sẵn (ví dụ trong lúc chế độ auto kiểm tra nội dung)
+    markdown: Optional[str] = None
+    # Thời gian chờ trang sẵn sàng (chỉ với trình duyệt)
+    wait_seconds: float = 0.0
+    # True khi server trả 304 và HTML/Markdown được lấy từ cache trang
+    from_cache: bool = False
+    # Thời gian bị giới hạn tốc độ theo domain trước khi gửi request
+    throttle_seconds: float = 0.0
+
+# Pool trình duyệt dùng chung trong process: các tác vụ scrape đồng thời chia sẻ một số lượng Chrome cố định
+_browser_pool = create_browser_pool(
+    setup_selenium,
+    max_size=settings.SCRAPER_BROWSER_POOL_SIZE,
+    max_pages=settings.SCRAPER_BROWSER_MAX_PAGES,
+)
+
+def _readiness_options(url):
+    """Tham số chờ trang (có thể ghi đè theo từng domain qua SCRAPER_READINESS_OVERRIDES)."""
+    options = {
+        'deadline': settings.SCRAPER_READY_DEADLINE,
+        'quiet_seconds': settings.SCRAPER_READY_QUIET_SECONDS,
+        'max_scrolls': settings.SCRAPER_MAX_SCROLLS,
+    }
+    host = (urlparse(url).hostname or '').lower()
+    options.update(settings.SCRAPER_READINESS_OVERRIDES.get(host, {}))
+    return options
+
+PAGE_SNAPSHOT_SCRIPT = """
+return [
+    document.readyState,
+    document.getElementsByTagName('*').length,
+    performance.getEntriesByType('resource').length,
+    document.body ? document.body.scrollHeight : 0
+];
+"""
+
+def _wait_until_stable(driver, deadline, quiet_seconds, poll_interval=0.25):
+    """
+    Chờ tới khi trang 'yên': readyState complete, số phần tử DOM, số request tài nguyên
+    và chiều cao trang không đổi trong quiet_seconds. Trả về False nếu hết hạn trước.
+    """
+    last_snapshot = None
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        snapshot = driver.execute_script(PAGE_SNAPSHOT_SCRIPT)
+        now = time.monotonic()
+        if snapshot != last_snapshot:
+            last_snapshot, stable_since = snapshot, now
+        elif snapshot[0] == 'complete' and now - stable_since >= quiet_seconds:
+            return True
+        time.sleep(poll_interval)
+    return False
+
+def _scroll_until_exhausted(driver, deadline, quiet_seconds, max_scrolls):
+    """Cuộn dần xuống cuối trang cho tới khi chiều cao trang ngừng tăng (infinite scroll)."""
+    for _ in range(max_scrolls):
+        if time.monotonic() >= deadline:
+            break
+        height = driver.execute_script("return document.body ? document.body.scrollHeight : 0;")
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        _wait_until_stable(driver, deadline, quiet_seconds)
+        new_height = driver.execute_script("return document.body ? document.body.scrollHeight : 0;")
+        if new_height <= height:
+            break
+
 def fetch_html_selenium(url):
-    """Lấy nội dung HTML của một trang web sử dụng Selenium."""
-    driver = setup_selenium()
+    """
+    Lấy nội dung HTML của một trang web sử dụng Selenium (driver mượn từ pool).
+    Thay vì sleep cố định, chờ trang ổn định rồi cuộn cho tới khi không còn nội dung mới, trong một deadline chung.
+    Trả về FetchResult (kèm thời gian đã chờ) hoặc None.
+    """
+    options = _readiness_options(url)
     try:
-        driver.get(url)
-        time.sleep(2)
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
-        return driver.page_source
+        # Chờ lượt của domain trước khi mượn trình duyệt, để không giữ driver trong lúc bị giới hạn tốc độ
+        throttle_seconds = throttle(url)
+        with _browser_pool.checkout(timeout=settings.SCRAPER_BROWSER_CHECKOUT_TIMEOUT) as driver:
+            driver.set_page_load_timeout(options['deadline'])
+            started = time.monotonic()
+            deadline = started + options['deadline']
+            driver.get(url)
+            _wait_until_stable(driver, deadline, options['quiet_seconds'])
+            _scroll_until_exhausted(driver, deadline, options['quiet_seconds'], options['max_scrolls'])
+            wait_seconds = time.monotonic() - started
+            logger.info(f"Trang {url} sẵn sàng sau {wait_seconds:.2f}s.")
+            return FetchResult(html=driver.page_source, strategy=FETCH_MODE_BROWSER, wait_seconds=wait_seconds,
+                               throttle_seconds=throttle_seconds)
     except Exception as e:
         logger.error(f"Lỗi khi fetch HTML bằng Selenium: {e}")
         return None
-    finally:
-        driver.quit()
 
-def html_to_markdown(html_content):
-    """Chuyển đổi HTML thành Markdown, tập trung vào nội dung chính."""
-    doc = Document(html_content)
-    cleaned_html = doc.summary()
+def _create_http_session():
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET", "HEAD"))
+    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Session dùng chung: giữ kết nối keep-alive giữa các lần scrape
+_http_session = _create_http_session()
+
+def fetch_html_http(url, pipeline=None):
+    """
+    Lấy HTML bằng một request HTTP thường (không chạy JavaScript), có revalidate với cache trang:
+    gửi If-None-Match / If-Modified-Since và dùng lại HTML + Markdown đã cache khi server trả 304.
+    Trả về FetchResult hoặc None nếu thất bại.
+    """
+    cached = page_cache.load(url, resolve_html_pipeline(pipeline))
+    headers = {"User-Agent": random.choice(USER_AGENTS), "Accept": "text/html,application/xhtml+xml"}
+    headers.update(page_cache.conditional_headers(cached))
+    try:
+        throttle_seconds = throttle(url)
+        response = _http_session.get(url, headers=headers, timeout=settings.SCRAPER_HTTP_TIMEOUT)
+        if response.status_code == 304 and cached:
+            logger.info(f"Trang không thay đổi (304), dùng lại cache cho {url}")
+            page_cache.mark_used(url)
+            return FetchResult(html=cached.html, strategy=FETCH_MODE_HTTP, markdown=cached.markdown, from_cache=True,
+                               throttle_seconds=throttle_seconds)
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "")
+        if "html" not in content_type and "xml" not in content_type:
+            logger.warning(f"Nội dung không phải HTML ({content_type}) tại {url}")
+            return None
+        html = response.text
+        page_cache.store(url, html, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+        return FetchResult(html=html, strategy=FETCH_MODE_HTTP, throttle_seconds=throttle_seconds)
+    except requests.RequestException as e:
+        logger.warning(f"Lỗi khi fetch HTML bằng HTTP: {e}")
+        return None
+
+def _ensure_markdown(url, result, pipeline=None):
+    """Chuyển HTML sang Markdown nếu chưa có, và lưu lại vào cache trang cho lần revalidate sau."""
+    if result.markdown is None:
+        pipeline = resolve_html_pipeline(pipeline)
+        result.markdown = html_to_markdown(result.html, pipeline)
+        page_cache.store_markdown(url, result.markdown, pipeline)
+    return result
+
+def is_content_sufficient(markdown_content):
+    """Nội dung trích xuất có đủ dày để không cần render bằng trình duyệt hay không."""
+    return len((markdown_content or "").strip()) >= settings.SCRAPER_AUTO_MIN_CONTENT_CHARS
+
+def fetch_html(url, mode=FETCH_MODE_AUTO, pipeline=None):
+    """
+    Lấy trang theo chiến lược đã chọn. Chế độ auto thử HTTP trước,
+    chỉ dùng Selenium khi nội dung sau khi làm sạch quá mỏng (trang cần JavaScript).
+    Trả về FetchResult hoặc None.
+    """
+    if mode not in FETCH_MODES:
+        raise ValueError(f"Chế độ fetch không hợp lệ: {mode}")
+
+    with domain_slot(url):
+        return _fetch_with_strategy(url, mode, resolve_html_pipeline(pipeline))
+
+def _fetch_with_strategy(url, mode, pipeline):
+    if mode in (FETCH_MODE_HTTP, FETCH_MODE_AUTO):
+        result = fetch_html_http(url, pipeline)
+        if result:
+            _ensure_markdown(url, result, pipeline)
+            if mode == FETCH_MODE_HTTP or is_content_sufficient(result.markdown):
+                return result
+            logger.info(f"Nội dung HTTP quá mỏng tại {url}, chuyển sang trình duyệt.")
+        if mode == FETCH_MODE_HTTP:
+            return None
+
+    return fetch_html_selenium(url)
+
+def resolve_html_pipeline(pipeline=None):
+    """Pipeline làm sạch HTML được chọn (tham số hoặc settings.SCRAPER_HTML_PIPELINE)."""
+    pipeline = pipeline or settings.SCRAPER_HTML_PIPELINE
+    if pipeline not in HTML_PIPELINES:
+        raise ValueError(f"Pipeline HTML không hợp lệ: {pipeline}")
+    return pipeline
+
+def _markdown_converter():
     markdown_converter = html2text.HTML2Text()
     markdown_converter.ignore_links = False
-    return markdown_converter.handle(cleaned_html)
+    return markdown_converter
+
+def html_to_markdown(html_content, pipeline=None):
+    """
+    Chuyển đổi HTML thành Markdown, tập trung vào nội dung chính.
+    Pipeline 'readability' giữ phần bài viết chính; 'lxml' chỉ lọc khung trang và giữ các item lặp lại (listing).
+    """
+    pipeline = resolve_html_pipeline(pipeline)
+    if pipeline != HTML_PIPELINE_LXML:
+        return _markdown_converter().handle(Document(html_content).summary())
+
+    try:
+        markdown_content = _markdown_converter().handle(html_cleaning.clean_html(html_content))
+    except (etree.ParserError, ValueError) as e:
+        logger.warning(f"lxml không phân tích được trang, dùng readability: {e}")
+        return _markdown_converter().handle(Document(html_content).summary())
+    if len(markdown_content.strip()) >= LXML_MIN_MARKDOWN_CHARS:
+        return markdown_content
+    # Kết quả rỗng/quá ngắn: nhiều khả năng bộ lọc đã xóa nhầm nội dung chính, thử readability
+    fallback = _markdown_converter().handle(Document(html_content).summary())
+    if len(fallback.strip()) > len(markdown_content.strip()):
+        logger.warning(f"Pipeline lxml chỉ giữ lại {len(markdown_content.strip())} ký tự, dùng readability.")
+        return fallback
+    return markdown_content
+
+# --- Phát hiện phân trang ---
+NEXT_LINK_TEXTS = {
+    'next', 'next page', 'next »', 'next ›', 'older', '›', '»', '>', '→', '>>',
+    'sau', 'trang sau', 'tiếp', 'tiếp theo', 'trang tiếp',
+}
+# aria-label / title của link sang trang sau
+NEXT_LABEL_RE = re.compile(r'\bnext\b|trang sau|\btiếp\b')
+PAGE_PARAM_NAMES = ('page', 'p', 'pg', 'paged', 'trang')
+PATH_PAGE_RE = re.compile(r'/page/(\d+)/?$')
+
+def _page_number(url):
+    """Số trang hiện tại đọc từ ?page=N (hoặc tham số tương tự) hay /page/N; mặc định là 1."""
+    parsed = urlparse(url)
+    for name, value in parse_qsl(parsed.query):
+        if name in PAGE_PARAM_NAMES and value.isdigit():
+            return int(value)
+    match = PATH_PAGE_RE.search(parsed.path)
+    return int(match.group(1)) if match else 1
+
+def _without_page(url):
+    """Phần URL còn lại sau khi bỏ số trang, để nhận ra các link cùng một danh sách."""
+    parsed = urlparse(url)
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k not in PAGE_PARAM_NAMES)
+    return parsed.netloc, PATH_PAGE_RE.sub('', parsed.path).rstrip('/'), tuple(query)
+
+def _has_rel_next(tag):
+    return 'next' in [value.lower() for value in tag.get('rel') or []]
+
+def _is_next_anchor(anchor):
+    """
+    Link "Next"/"Trang sau" nhận diện qua nội dung chữ hoặc aria-label/title.
+    Không dựa vào class: các class như "btn-next-step" thường gặp ở nút giỏ hàng, wizard...
+    """
+    text = " ".join(anchor.get_text(" ", strip=True).lower().split())
+    label = (anchor.get('aria-label') or anchor.get('title') or '').lower()
+    return text in NEXT_LINK_TEXTS or NEXT_LABEL_RE.search(label) is not None
+
+def find_next_page_url(html_content, current_url):
+    """
+    Tìm URL trang kế tiếp trong HTML theo thứ tự tin cậy: <link rel="next">/<a rel="next">,
+    rồi link có cùng URL nhưng ?page= (hoặc /page/) bằng trang hiện tại + 1,
+    cuối cùng mới tới các link có chữ hoặc aria-label "Next"/"Trang sau".
+    Trả về None nếu không tìm thấy (đã tới trang cuối).
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    current = current_url.split('#')[0]
+    netloc = urlparse(current).netloc
+
+    def resolve(href):
+        if not href or href.startswith(('javascript:', '#', 'mailto:')):
+            return None
+        url = urljoin(current, href).split('#')[0]
+        return url if url != current and urlparse(url).netloc == netloc else None
+
+    anchors = soup.find_all('a', href=True)
+    for tag in [*soup.find_all('link', rel=True, href=True), *anchors]:
+        if _has_rel_next(tag):
+            url = resolve(tag['href'])
+            if url:
+                return url
+
+    # Link tới số trang kế tiếp của cùng danh sách đáng tin hơn chữ "Next" trên một nút bất kỳ
+    expected_page, listing_key = _page_number(current) + 1, _without_page(current)
+    for anchor in anchors:
+        url = resolve(anchor['href'])
+        if url and _without_page(url) == listing_key and _page_number(url) == expected_page:
+            return url
+
+    for anchor in anchors:
+        if _is_next_anchor(anchor):
+            url = resolve(anchor['href'])
+            if url:
+                return url
+    return None
 
 def create_dynamic_listing_model(field_names: List[str]) -> Type[BaseModel]:
     """Tạo một Pydantic model động dựa trên danh sách các trường."""
@@ -91,15 +409,11 @@ def gemini_format_data(data, DynamicListingsContainer, model="gemini-1.5-flash")
     """Gửi dữ liệu đến Gemini API và yêu cầu trả về JSON theo schema."""
     token_counts = {}
     try:
-        GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-        if not GOOGLE_API_KEY:
-            raise ValueError("GOOGLE_API_KEY không được cấu hình.")
-        genai.configure(api_key=GOOGLE_API_KEY)
-
         # SỬA LỖI: Truyền thẳng Pydantic Model class vào response_schema
         # Thư viện google-generativeai sẽ tự động chuyển đổi sang schema tương thích.
-        model = genai.GenerativeModel(
-            model_name=model,
+        # Model được lấy từ pool dùng chung, API key chỉ cấu hình một lần mỗi process.
+        model = get_generative_model(
+            model,
             generation_config={
                 "response_mime_type": "application/json",
                 "response_schema": DynamicListingsContainer
@@ -131,12 +445,173 @@ def gemini_format_data(data, DynamicListingsContainer, model="gemini-1.5-flash")
         # Trả về một chuỗi JSON chứa thông tin lỗi để xử lý ở view
         return json.dumps({"error": "Lỗi khi gọi Gemini API", "details": str(e)}), token_counts
 
+# --- Trích xuất theo chunk (map-reduce) cho trang dài ---
+# Ranh giới cấu trúc: trước mỗi heading Markdown, hoặc giữa các khối cách nhau bởi dòng trống
+BLOCK_BOUNDARY_RE = re.compile(r"\n(?=#{1,6} )|\n{2,}")
+
+def _split_long_block(block, max_chars):
+    """Cắt một khối quá dài theo dòng (hoặc cứng theo ký tự nếu một dòng vượt giới hạn)."""
+    pieces, current = [], ""
+    for line in block.split("\n"):
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + len(line) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_markdown(markdown_content, max_chars, overlap_chars=0):
+    """
+    Chia Markdown thành các chunk <= max_chars theo ranh giới heading/khối danh sách.
+    Mỗi chunk (trừ chunk đầu) được nối thêm các khối cuối của chunk trước (tối đa overlap_chars)
+    để listing nằm vắt qua ranh giới không bị mất.
+    """
+    if len(markdown_content) <= max_chars:
+        return [markdown_content]
+
+    blocks = []
+    for block in BLOCK_BOUNDARY_RE.split(markdown_content):
+        block = block.strip()
+        if block:
+            blocks.extend(_split_long_block(block, max_chars) if len(block) > max_chars else [block])
+
+    chunks, current = [], []
+    current_len = 0
+    for block in blocks:
+        if current and current_len + len(block) + 2 > max_chars:
+            chunks.append(current)
+            # Overlap: mang theo các khối cuối của chunk trước
+            carried, carried_len = [], 0
+            for previous in reversed(current):
+                if carried_len + len(previous) > overlap_chars:
+                    break
+                carried.insert(0, previous)
+                carried_len += len(previous) + 2
+            current, current_len = carried, carried_len
+        current.append(block)
+        current_len += len(block) + 2
+    if current:
+        chunks.append(current)
+    return ["\n\n".join(chunk) for chunk in chunks]
+
+def _listing_identity(listing):
+    """Khóa so sánh để loại bỏ listing trùng (do overlap giữa các chunk)."""
+    if not isinstance(listing, dict):
+        return json.dumps(listing, sort_keys=True, ensure_ascii=False)
+    return tuple(sorted((key, " ".join(str(value).split()).lower()) for key, value in listing.items()))
+
+def merge_listings(listing_groups):
+    """Gộp danh sách listing từ nhiều chunk, giữ thứ tự xuất hiện và bỏ các bản trùng."""
+    merged, seen = [], set()
+    for listings in listing_groups:
+        for listing in listings:
+            identity = _listing_identity(listing)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            merged.append(listing)
+    return merged
+
+def gemini_extract_chunked(data, DynamicListingsContainer, model="gemini-1.5-flash"):
+    """
+    Trích xuất map-reduce: chia Markdown thành chunk, gọi Gemini song song cho từng chunk
+    với cùng container schema, rồi gộp và loại trùng listing. Token được cộng dồn.
+    Trả về (chuỗi JSON, token_counts, failed_chunks): failed_chunks > 0 nghĩa là kết quả chỉ là một phần
+    (một số chunk lỗi đã bị bỏ qua); nếu mọi chunk đều lỗi thì chuỗi JSON là lỗi đầu tiên.
+    """
+    chunks = split_markdown(data, settings.SCRAPER_CHUNK_MAX_CHARS, settings.SCRAPER_CHUNK_OVERLAP_CHARS)
+    if len(chunks) == 1:
+        formatted_data_str, token_counts = gemini_format_data(chunks[0], DynamicListingsContainer, model)
+        return formatted_data_str, token_counts, 0
+
+    logger.info(f"Trích xuất theo {len(chunks)} chunk.")
+    container_key = next(iter(DynamicListingsContainer.model_fields))
+    with ThreadPoolExecutor(max_workers=settings.SCRAPER_CHUNK_CONCURRENCY) as executor:
+        results = list(executor.map(lambda chunk: gemini_format_data(chunk, DynamicListingsContainer, model), chunks))
+
+    token_counts = {"input_tokens": 0, "output_tokens": 0}
+    listing_groups, errors = [], []
+    for formatted_data_str, chunk_tokens in results:
+        token_counts["input_tokens"] += chunk_tokens.get("input_tokens", 0)
+        token_counts["output_tokens"] += chunk_tokens.get("output_tokens", 0)
+        parsed = json.loads(formatted_data_str)
+        if "error" in parsed:
+            errors.append(formatted_data_str)
+            continue
+        listing_groups.append(parsed.get(container_key, []))
+
+    if not listing_groups:
+        # Mọi chunk đều lỗi: trả về lỗi đầu tiên để caller xử lý như trước
+        return errors[0], token_counts, len(errors)
+    if errors:
+        logger.warning(f"{len(errors)}/{len(chunks)} chunk bị lỗi khi trích xuất, kết quả chỉ là một phần.")
+
+    merged = merge_listings(listing_groups)
+    return json.dumps({container_key: merged}, ensure_ascii=False), token_counts, len(errors)
+
+def _pricing_table():
+    return {**PRICING, **getattr(settings, 'SCRAPER_MODEL_PRICING', {})}
+
+def supported_models():
+    """Các model có bảng giá, tức là các model được phép chọn cho scraper."""
+    return sorted(_pricing_table())
+
+def get_model_pricing(model):
+    """Giá theo token (USD) của model; raise ValueError nếu model không có trong bảng giá."""
+    table = _pricing_table()
+    name = model[:-len("-latest")] if model.endswith("-latest") else model
+    if name not in table:
+        raise ValueError(f"Không có bảng giá cho model '{model}'.")
+    return {"input": table[name]["input"] / 1_000_000, "output": table[name]["output"] / 1_000_000}
+
 def calculate_price(token_counts, model="gemini-1.5-flash"):
     """Tính toán chi phí dựa trên số lượng token."""
+    pricing = get_model_pricing(model)
     input_token_count = token_counts.get("input_tokens", 0)
     output_token_count = token_counts.get("output_tokens", 0)
-    input_cost = input_token_count * PRICING[model]["input"]
-    output_cost = output_token_count * PRICING[model]["output"]
+    input_cost = input_token_count * pricing["input"]
+    output_cost = output_token_count * pricing["output"]
     total_cost = input_cost + output_cost
     return input_token_count, output_token_count, total_cost
 
+# --- Ước lượng trước khi gọi Gemini ---
+def count_prompt_tokens(prompt, model):
+    """
+    Đếm token của prompt: gọi count_tokens của Gemini khi SCRAPER_TOKEN_COUNT_MODE = 'api',
+    ngược lại (hoặc khi API lỗi) dùng ước lượng cục bộ theo số ký tự.
+    """
+    if settings.SCRAPER_TOKEN_COUNT_MODE == 'api':
+        try:
+            return get_generative_model(model).count_tokens(prompt).total_tokens
+        except Exception as e:
+            logger.warning(f"count_tokens lỗi, dùng ước lượng cục bộ: {e}")
+    return estimate_tokens(prompt)
+
+def trim_to_token_budget(markdown_content, max_tokens):
+    """
+    Cắt Markdown (tại ranh giới khối gần nhất) để nội dung gửi đi không vượt ngân sách token của tác vụ.
+    Trả về (markdown, đã_cắt). max_tokens <= 0 nghĩa là không giới hạn.
+    """
+    if max_tokens <= 0 or estimate_tokens(markdown_content) <= max_tokens:
+        return markdown_content, False
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    cut = markdown_content.rfind("\n\n", 0, max_chars)
+    if cut < max_chars // 2:
+        cut = max_chars
+    return markdown_content[:cut], True
+
+def estimate_extraction(markdown_content, model):
+    """
+    Ước lượng token và chi phí của gemini_extract_chunked trước khi gọi API, với cùng cách chia chunk.
+    Token output được ước lượng theo tỷ lệ SCRAPER_ESTIMATED_OUTPUT_RATIO so với input.
+    """
+    chunks = split_markdown(markdown_content, settings.SCRAPER_CHUNK_MAX_CHARS, settings.SCRAPER_CHUNK_OVERLAP_CHARS)
+    input_tokens = sum(count_prompt_tokens(f"{SYSTEM_MESSAGE}\n{USER_MESSAGE}\n{chunk}", model) for chunk in chunks)
+    output_tokens = int(input_tokens * settings.SCRAPER_ESTIMATED_OUTPUT_RATIO)
+    _, _, cost = calculate_price({"input_tokens": input_tokens, "output_tokens": output_tokens}, model)
+    return {"chunks": len(chunks), "input_tokens": input_tokens, "output_tokens": output_tokens, "cost": cost}
+
@@ -0,0 +1,536 @@
+# File: Rita_All_Django/core/tasks.py
+import json
+import time
+import logging
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+
+from .models import TikTokVideo, TikTokBatch, ScrapeResult, ScrapeBatch
+from .tiktok_utils import (
+    analyze_tiktok_video, analyze_tiktok_videos, stats_snapshot, is_analysis_error,
+    afetch_bulk_video_infos, video_fields_from_info, VIDEO_ID_RE,
+)
+from .export_utils import ListingExportWriter, iter_ndjson
+from .extraction_cache import extraction_cache_key, get_cached_extraction, store_extraction
+from .job_queue import job_handler, enqueue, heartbeat, keep_alive, active_payload_values, QueueFullError, PermanentJobError
+from .scrape_budget import reserve_budget, record_spend, release_reservation, BudgetExceededError
+from .history_utils import JOB_TYPE_CHAT_SUMMARY, refresh_summary
+from . import scraper_utils
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPE_SCRAPE = 'scrape'
+JOB_TYPE_SCRAPE_BATCH = 'scrape_batch'
+JOB_TYPE_TIKTOK_ANALYSIS = 'tiktok_analysis'
+JOB_TYPE_TIKTOK_ANALYSIS_BATCH = 'tiktok_analysis_batch'
+JOB_TYPE_TIKTOK_BATCH_FETCH = 'tiktok_batch_fetch'
+
+
+# --- AI Chat ---
+@job_handler(JOB_TYPE_CHAT_SUMMARY)
+def refresh_chat_summary_in_background(user_id):
+    # Runs off the chat request path; a Gemini error simply retries the job
+    refresh_summary(user_id)
+
+
+# --- TikTok Analyzer ---
+def mark_analysis_failed(payload, error_message):
+    TikTokVideo.objects.filter(pk=payload.get('video_pk')).update(status='FAILED')
+
+@job_handler(JOB_TYPE_TIKTOK_ANALYSIS, on_failure=mark_analysis_failed)
+def perform_analysis_in_background(video_pk):
+    try:
+        video = TikTokVideo.objects.get(pk=video_pk)
+    except TikTokVideo.DoesNotExist:
+        logger.error(f"Video PK: {video_pk} không tồn tại để phân tích.")
+        return
+
+    with keep_alive():
+        analysis_result_json = analyze_tiktok_video(video)
+    video.analysis = json.loads(analysis_result_json)
+    # Error placeholders get no snapshot, so the next submission re-analyzes instead of reusing them
+    video.analyzed_stats = None if is_analysis_error(video.analysis) else stats_snapshot(video)
+
+    video.status = 'COMPLETE'
+    video.save()
+    logger.info(f"Phân tích AI hoàn tất cho video PK: {video_pk}")
+
+def enqueue_tiktok_batch_analysis(batch_id, video_pks):
+    """Queue the analysis of a bulk submission as jobs of TIKTOK_ANALYSIS_BATCH_SIZE videos each."""
+    size = max(1, settings.TIKTOK_ANALYSIS_BATCH_SIZE)
+    for start in range(0, len(video_pks), size):
+        enqueue(JOB_TYPE_TIKTOK_ANALYSIS_BATCH, {'batch_id': batch_id, 'video_pks': video_pks[start:start + size]})
+
+def _refresh_tiktok_batch(batch_id):
+    """Mark the batch COMPLETE once none of its videos is waiting or running."""
+    if not TikTokVideo.objects.filter(batch_id=batch_id, status__in=['PENDING', 'PROCESSING']).exists():
+        TikTokBatch.objects.filter(pk=batch_id).exclude(status='COMPLETE').update(status='COMPLETE', completed_at=timezone.now())
+    else:
+        TikTokBatch.objects.filter(pk=batch_id, status='PENDING').update(status='PROCESSING')
+
+def mark_batch_analysis_failed(payload, error_message):
+    TikTokVideo.objects.filter(pk__in=payload.get('video_pks') or [], status__in=['PENDING', 'PROCESSING']).update(status='FAILED')
+    _refresh_tiktok_batch(payload.get('batch_id'))
+
+@job_handler(JOB_TYPE_TIKTOK_ANALYSIS_BATCH, on_failure=mark_batch_analysis_failed)
+def perform_batch_analysis_in_background(batch_id, video_pks):
+    """
+    Analyze one chunk of a bulk submission, TIKTOK_ANALYSIS_VIDEOS_PER_PROMPT videos per Gemini request;
+    videos completed by an earlier attempt are skipped.
+    """
+    TikTokBatch.objects.filter(pk=batch_id, status='PENDING').update(status='PROCESSING')
+    videos = list(TikTokVideo.objects.filter(pk__in=video_pks).exclude(status='COMPLETE').select_related('user').order_by('id'))
+    per_prompt = max(1, settings.TIKTOK_ANALYSIS_VIDEOS_PER_PROMPT)
+    for start in range(0, len(videos), per_prompt):
+        group = videos[start:start + per_prompt]
+        heartbeat()
+        TikTokVideo.objects.filter(pk__in=[video.pk for video in group]).update(status='PROCESSING')
+        analyses = analyze_tiktok_videos(group)
+        for video in group:
+            video.analysis = analyses[video.pk]
+            video.analyzed_stats = None if is_analysis_error(video.analysis) else stats_snapshot(video)
+            video.status = 'COMPLETE'
+            video.save(update_fields=['analysis', 'analyzed_stats', 'status', 'updated_at'])
+    _refresh_tiktok_batch(batch_id)
+    logger.info(f"[TIKTOK BATCH {batch_id}] Phân tích xong {len(video_pks)} video.")
+
+
+def mark_batch_fetch_failed(payload, error_message):
+    TikTokBatch.objects.filter(pk=payload.get('batch_id'), status='PENDING').update(status='FAILED', completed_at=timezone.now())
+
+def _existing_video_pks(video_ids):
+    return dict(TikTokVideo.objects.filter(video_id__in=list(video_ids)).values_list('video_id', 'pk'))
+
+@job_handler(JOB_TYPE_TIKTOK_BATCH_FETCH, on_failure=mark_batch_fetch_failed)
+def perform_batch_fetch_in_background(batch_id):
+    """
+    Fetch the metadata of a bulk submission (the batch's submitted_urls and creator feed), create its video
+    rows and queue their analysis. Videos already stored are attached to the batch as existing_video_pks
+    instead of being re-analyzed.
+    """
+    try:
+        batch = TikTokBatch.objects.get(pk=batch_id, status='PENDING')
+    except TikTokBatch.DoesNotExist:
+        logger.warning(f"[TIKTOK BATCH {batch_id}] Không còn chờ lấy metadata, bỏ qua.")
+        return
+    video_urls, creator, max_videos = batch.submitted_urls, batch.creator, batch.max_videos
+
+    # URLs that already carry a video id are de-duplicated before any request is made
+    known_ids = {}
+    for video_url in video_urls:
+        match = VIDEO_ID_RE.search(urlparse(video_url).path)
+        if match:
+            known_ids[video_url] = match.group(1)
+    existing = _existing_video_pks(known_ids.values())
+    to_fetch = [video_url for video_url in video_urls if known_ids.get(video_url) not in existing]
+
+    with keep_alive():
+        video_infos, failures, feed_count = async_to_sync(afetch_bulk_video_infos)(to_fetch, creator, max_videos)
+
+    # Short links and feed entries only reveal their video id after the fetch
+    existing.update(_existing_video_pks(info["video_id"] for info in video_infos))
+    unique_infos = {}
+    for info in video_infos:
+        if info["video_id"] not in existing and info["video_id"] not in unique_infos:
+            unique_infos[info["video_id"]] = info
+
+    with transaction.atomic():
+        # A concurrent submission may have created some of these video_ids in the meantime
+        TikTokVideo.objects.bulk_create([
+            TikTokVideo(user=batch.user, batch=batch, video_id=video_id, status='PENDING', **video_fields_from_info(info, info["video_url"]))
+            for video_id, info in unique_infos.items()
+        ], ignore_conflicts=True)
+        video_pks = list(batch.videos.order_by('id').values_list('id', flat=True))
+        existing.update(_existing_video_pks(set(unique_infos) - set(batch.videos.values_list('video_id', flat=True))))
+
+        batch.submitted_count = len(video_urls) + feed_count
+        batch.video_count = len(video_pks)
+        batch.existing_video_pks = sorted(set(existing.values()))
+        batch.duplicate_count = batch.submitted_count - len(video_pks) - len([f for f in failures if 'url' in f])
+        batch.fetch_failed_count = len(failures)
+        batch.fetch_errors = failures
+        if video_pks:
+            batch.status = 'PROCESSING'
+        else:
+            batch.status = 'FAILED' if failures and not existing else 'COMPLETE'
+            batch.completed_at = timezone.now()
+        batch.save()
+        enqueue_tiktok_batch_analysis(batch.id, video_pks)
+    logger.info(f"[TIKTOK BATCH {batch_id}] Xếp hàng {len(video_pks)} video, {len(existing)} video đã có, {len(failures)} lỗi.")
+
+# --- Web Scraper ---
+class ExtractionError(PermanentJobError, ValueError):
+    """Gemini answered (and was paid) but the response is unusable; a retry would most likely pay for the same answer."""
+
+def mark_scrape_failed(payload, error_message):
+    task_id = payload.get('task_id')
+    # Keep only the first line of the stored traceback for the user-facing message
+    ScrapeResult.objects.filter(pk=task_id).update(status='FAILED', error_message=error_message.split('\n', 1)[0])
+    logger.info(f"[TASK {task_id}] Task status updated to FAILED.")
+
+def _fetch_markdown(task):
+    """Fetch the task's page and return its cleaned markdown."""
+    # Selenium can take longer than the job lease, so keep it alive while the page loads
+    with keep_alive():
+        fetched = scraper_utils.fetch_html(task.url, mode=task.fetch_mode)
+    if not fetched: raise ValueError("Could not fetch HTML content.")
+    logger.info(
+        f"[TASK {task.id}] Fetched page via {fetched.strategy} (waited {fetched.wait_seconds:.2f}s, "
+        f"throttled {fetched.throttle_seconds:.2f}s{', not modified' if fetched.from_cache else ''})."
+    )
+    task.fetch_wait_seconds = fetched.wait_seconds
+    return fetched.markdown or scraper_utils.html_to_markdown(fetched.html)
+
+def _run_extraction(task, markdown_content):
+    """
+    Run (or reuse a cached) Gemini extraction of one page. Returns (json_str, parsed, tokens_count, cache_hit).
+    Before any Gemini call the content is trimmed to the per-task token budget and the estimated cost is
+    reserved against the user's monthly cap; the actual cost is added to the task's tokens and total_cost as soon
+    as Gemini answers, before the response is parsed, so failed attempts are billed too.
+    Only complete extractions of the untrimmed page are cached, since the key hashes the untrimmed markdown.
+    """
+    fields = [field.strip() for field in task.fields.split(',')]
+    DynamicListingModel = scraper_utils.create_dynamic_listing_model(fields)
+    DynamicListingsContainer = scraper_utils.create_listings_container_model(DynamicListingModel)
+    
+    cache_key = extraction_cache_key(markdown_content, fields, task.model)
+    cached = get_cached_extraction(cache_key)
+    cacheable = not cached
+    if cached:
+        # Unchanged page content: reuse the previous extraction at zero token cost
+        formatted_data_str, _ = cached
+        tokens_count = {"input_tokens": 0, "output_tokens": 0}
+        logger.info(f"[TASK {task.id}] Extraction cache hit.")
+    else:
+        markdown_content, trimmed = scraper_utils.trim_to_token_budget(markdown_content, settings.SCRAPER_MAX_INPUT_TOKENS_PER_TASK)
+        if trimmed:
+            task.input_trimmed = True
+            logger.warning(f"[TASK {task.id}] Content trimmed to {settings.SCRAPER_MAX_INPUT_TOKENS_PER_TASK} input tokens.")
+        estimate = scraper_utils.estimate_extraction(markdown_content, task.model)
+        logger.info(f"[TASK {task.id}] Estimated {estimate['input_tokens']} input tokens in {estimate['chunks']} chunk(s), ~${estimate['cost']:.4f}.")
+        reserved = reserve_budget(task, estimate["cost"])
+        with keep_alive():
+            formatted_data_str, tokens_count, failed_chunks = scraper_utils.gemini_extract_chunked(markdown_content, DynamicListingsContainer, task.model)
+        record_spend(task, tokens_count, reserved)
+        if failed_chunks:
+            # Listings from the failed chunks are missing; surface that on the row instead of passing it off as complete
+            task.failed_chunks += failed_chunks
+            logger.warning(f"[TASK {task.id}] {failed_chunks} chunk(s) failed, result is partial.")
+        cacheable = not trimmed and not failed_chunks
+    try:
+        formatted_data_json = json.loads(formatted_data_str)
+        if 'error' in formatted_data_json: raise ExtractionError(f"Error from Gemini: {formatted_data_json.get('details', formatted_data_str)}")
+    except json.JSONDecodeError: raise ExtractionError("Response from Gemini was not valid JSON.")
+    if cacheable:
+        store_extraction(cache_key, task.model, formatted_data_str, tokens_count)
+    return formatted_data_str, formatted_data_json, tokens_count, bool(cached)
+
+def _extract_listings(task, markdown_content):
+    """Extract one page and return the parsed result; the task's token/cost fields are kept up to date by _run_extraction."""
+    release_reservation(task)
+    task.input_trimmed, task.failed_chunks = False, 0
+    _, formatted_data_json, _, task.cache_hit = _run_extraction(task, markdown_content)
+    return formatted_data_json
+
+def _extract_paginated(task):
+    """
+    Follow "next" links from task.url up to the page and time budget, accumulating listings into one result.
+    Page N+1 is fetched on a background thread while Gemini extracts page N.
+    """
+    max_pages = task.max_pages or settings.SCRAPER_PAGINATION_MAX_PAGES
+    deadline = time.monotonic() + (task.pagination_time_budget or settings.SCRAPER_PAGINATION_TIME_BUDGET)
+    container_key, listing_groups, all_cached = None, [], True
+    page_url, visited, pages = task.url, {task.url}, 0
+    task.fetch_wait_seconds = 0.0
+    release_reservation(task)
+    task.input_trimmed, task.failed_chunks = False, 0
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        next_fetch = prefetcher.submit(scraper_utils.fetch_html, page_url, task.fetch_mode)
+        while next_fetch is not None:
+            fetched, next_fetch = next_fetch.result(), None
+            if not fetched:
+                if not pages: raise ValueError("Could not fetch HTML content.")
+                logger.warning(f"[TASK {task.id}] Could not fetch {page_url}, stopping pagination.")
+                break
+            pages += 1
+            task.fetch_wait_seconds += fetched.wait_seconds
+            heartbeat()
+
+            next_url = scraper_utils.find_next_page_url(fetched.html, page_url)
+            if next_url in visited:
+                next_url = None
+            if next_url and pages < max_pages and time.monotonic() < deadline:
+                visited.add(next_url)
+                next_fetch = prefetcher.submit(scraper_utils.fetch_html, next_url, task.fetch_mode)
+
+            markdown_content = fetched.markdown or scraper_utils.html_to_markdown(fetched.html)
+            try:
+                _, page_json, _, page_cached = _run_extraction(task, markdown_content)
+            except BudgetExceededError:
+                if pages == 1: raise
+                logger.warning(f"[TASK {task.id}] Monthly budget reached on page {pages}, keeping the pages scraped so far.")
+                pages -= 1
+                break
+            except ValueError:
+                if pages == 1: raise
+                # The failed page's Gemini cost is already on the task (record_spend), but it added no listings
+                logger.warning(f"[TASK {task.id}] Extraction failed on page {pages} ({page_url}), stopping pagination.", exc_info=True)
+                pages -= 1
+                break
+            all_cached = all_cached and page_cached
+
+            container_key = container_key or next(iter(page_json))
+            page_listings = page_json.get(container_key) or []
+            logger.info(f"[TASK {task.id}] Page {pages}: {len(page_listings)} listings from {page_url}.")
+            if not page_listings and pages > 1:
+                # An empty page past the first one means we ran off the end of the listing
+                break
+            listing_groups.append(page_listings)
+            page_url = next_url
+
+        if next_fetch is not None:
+            next_fetch.cancel()
+
+    task.pages_scraped = pages
+    task.cache_hit = all_cached
+    # Featured/sticky items often repeat on every page
+    return {container_key: scraper_utils.merge_listings(listing_groups)}
+
+def _listing_columns(fields, leading=()):
+    """CSV columns: the sanitized field names the dynamic listing model uses, in the order the user gave them."""
+    return [*leading, *(field.strip().replace(' ', '_') for field in fields.split(','))]
+
+def _save_task_results(task, formatted_data_json):
+    container_key = next(iter(formatted_data_json))
+    # Listings are streamed row by row into the JSON / CSV / NDJSON files
+    with ListingExportWriter(container_key, _listing_columns(task.fields)) as writer:
+        writer.write_many(formatted_data_json[container_key] or [])
+        writer.save_to(task, f"scrape_result_{task.id}")
+    task.status, task.completed_at = 'COMPLETE', timezone.now()
+    task.save()
+
+@job_handler(JOB_TYPE_SCRAPE, on_failure=mark_scrape_failed)
+def perform_scraping_in_background(task_id):
+    try:
+        task = ScrapeResult.objects.get(pk=task_id)
+    except ScrapeResult.DoesNotExist:
+        logger.error(f"[TASK {task_id}] Task no longer exists, skipping.")
+        return
+    logger.info(f"[TASK {task_id}] Starting background scraping process.")
+    
+    task.status = 'PROCESSING'
+    task.save()
+    
+    if task.follow_pagination:
+        formatted_data_json = _extract_paginated(task)
+    else:
+        markdown_content = _fetch_markdown(task)
+        formatted_data_json = _extract_listings(task, markdown_content)
+    _save_task_results(task, formatted_data_json)
+    logger.info(f"[TASK {task_id}] Scraping task {task_id} completed successfully.")
+
+
+# --- Batch scraping ---
+def mark_batch_failed(payload, error_message):
+    batch_id = payload.get('batch_id')
+    ScrapeBatch.objects.filter(pk=batch_id).update(
+        status='FAILED', error_message=error_message.split('\n', 1)[0], completed_at=timezone.now()
+    )
+    ScrapeResult.objects.filter(batch_id=batch_id, status__in=['PENDING', 'PROCESSING']).update(
+        status='FAILED', error_message='Batch failed.'
+    )
+    logger.info(f"[BATCH {batch_id}] Batch status updated to FAILED.")
+
+def _fail_batch_child(task, error):
+    logger.warning(f"[BATCH {task.batch_id}] {task.url} failed: {error}")
+    ScrapeResult.objects.filter(pk=task.pk).update(status='FAILED', error_message=str(error).split('\n', 1)[0])
+    ScrapeBatch.objects.filter(pk=task.batch_id).update(failed_count=F('failed_count') + 1)
+
+def _batch_fetch_stage(task):
+    """Fetch stage of a batch child (runs in the fetch pool). Returns the markdown, or None if the child failed."""
+    try:
+        ScrapeResult.objects.filter(pk=task.pk).update(status='PROCESSING')
+        return _fetch_markdown(task)
+    except Exception as e:
+        _fail_batch_child(task, e)
+        return None
+    finally:
+        connection.close()
+
+def _batch_extract_stage(task, markdown_content):
+    """Extract stage of a batch child (runs in the extract pool)."""
+    try:
+        formatted_data_json = _extract_listings(task, markdown_content)
+        _save_task_results(task, formatted_data_json)
+        ScrapeBatch.objects.filter(pk=task.batch_id).update(completed_count=F('completed_count') + 1)
+    except Exception as e:
+        _fail_batch_child(task, e)
+    finally:
+        connection.close()
+
+def _child_listings(task):
+    """Listings of a completed batch child, read line by line from its NDJSON file."""
+    if task.ndjson_result:
+        yield from iter_ndjson(task.ndjson_result)
+        return
+    # Children completed before NDJSON export existed only have the JSON file
+    with task.json_result.open('rb') as fh:
+        data = json.load(fh)
+    if data:
+        yield from data[next(iter(data))] or []
+
+def _merge_batch_results(batch):
+    """Stream the listings of every completed child into the batch's JSON / CSV / NDJSON files, tagged with their source URL."""
+    completed = batch.tasks.filter(status='COMPLETE').order_by('id')
+    container_key = next(iter(scraper_utils.create_listings_container_model(
+        scraper_utils.create_dynamic_listing_model([field.strip() for field in batch.fields.split(',')])
+    ).model_fields))
+    with ListingExportWriter(container_key, _listing_columns(batch.fields, leading=('source_url',))) as writer:
+        for task in completed.iterator():
+            writer.write_many({'source_url': task.url, **item} for item in _child_listings(task))
+        writer.save_to(batch, f"scrape_batch_{batch.id}")
+        listing_count = writer.count
+
+    # Failed children were billed for their Gemini calls too
+    totals = batch.tasks.aggregate(input_tokens=Sum('input_tokens'), output_tokens=Sum('output_tokens'), total_cost=Sum('total_cost'))
+    batch.input_tokens, batch.output_tokens, batch.total_cost = totals['input_tokens'], totals['output_tokens'], totals['total_cost']
+    return listing_count
+
+@job_handler(JOB_TYPE_SCRAPE_BATCH, on_failure=mark_batch_failed)
+def perform_batch_scraping_in_background(batch_id):
+    """
+    Scrape every URL of a batch: a fetch pool (bounded per domain by scraper_limits.domain_slot) feeds
+    an extract pool, so page fetches overlap with Gemini extraction. Children completed by an earlier
+    attempt are kept, so a retried batch only redoes the URLs that did not finish.
+    """
+    try:
+        batch = ScrapeBatch.objects.get(pk=batch_id)
+    except ScrapeBatch.DoesNotExist:
+        logger.error(f"[BATCH {batch_id}] Batch no longer exists, skipping.")
+        return
+
+    batch.tasks.exclude(status='COMPLETE').update(status='PENDING', error_message=None)
+    ScrapeBatch.objects.filter(pk=batch_id).update(
+        status='PROCESSING', failed_count=0, completed_count=batch.tasks.filter(status='COMPLETE').count()
+    )
+    pending = list(batch.tasks.filter(status='PENDING').order_by('id'))
+    logger.info(f"[BATCH {batch_id}] Scraping {len(pending)} of {batch.total_urls} URLs.")
+
+    # keep_alive()/heartbeat() only see the job from this thread, not from the pool workers: renew the lease
+    # here for as long as the pools run, however long it takes until the next future completes
+    with keep_alive(), \
+            ThreadPoolExecutor(max_workers=settings.SCRAPER_BATCH_FETCH_CONCURRENCY) as fetch_pool, \
+            ThreadPoolExecutor(max_workers=settings.SCRAPER_BATCH_EXTRACT_CONCURRENCY) as extract_pool:
+        fetches = {fetch_pool.submit(_batch_fetch_stage, task): task for task in pending}
+        extractions = []
+        for future in as_completed(fetches):
+            markdown_content = future.result()
+            if markdown_content is not None:
+                extractions.append(extract_pool.submit(_batch_extract_stage, fetches[future], markdown_content))
+        for future in as_completed(extractions):
+            future.result()
+
+    batch.refresh_from_db()
+    if not batch.completed_count:
+        batch.status, batch.error_message = 'FAILED', 'All URLs in the batch failed.'
+        batch.completed_at = timezone.now()
+        batch.save()
+        logger.error(f"[BATCH {batch_id}] All {batch.total_urls} URLs failed.")
+        return
+
+    listing_count = _merge_batch_results(batch)
+    batch.status, batch.completed_at = 'COMPLETE', timezone.now()
+    batch.save()
+    logger.info(
+        f"[BATCH {batch_id}] Completed: {batch.completed_count} ok, {batch.failed_count} failed, {listing_count} listings merged."
+    )
+
+
+# --- Crash recovery ---
+IN_FLIGHT_STATUSES = ['PENDING', 'PROCESSING']
+
+def _still_orphaned(model, pk, job_keys, statuses=IN_FLIGHT_STATUSES):
+    """
+    Re-check one candidate inside the caller's transaction: the row is still in flight and no job
+    picked it up since the first scan (e.g. a submission committed its row and job in between).
+    """
+    if not model.objects.select_for_update().filter(pk=pk, status__in=statuses).exists():
+        return False
+    return all(pk not in active_payload_values(job_type, key) for job_type, key in job_keys)
+
+def recover_orphaned_rows():
+    """
+    Re-queue ScrapeResult / ScrapeBatch / TikTokVideo rows stuck in PENDING/PROCESSING without an active job,
+    and TikTokBatch rows still waiting for their metadata fetch, e.g. rows left behind by a worker restart.
+    """
+    recovered = 0
+    scrape_keys = [(JOB_TYPE_SCRAPE, 'task_id')]
+    batch_keys = [(JOB_TYPE_SCRAPE_BATCH, 'batch_id')]
+    video_keys = [(JOB_TYPE_TIKTOK_ANALYSIS, 'video_pk'), (JOB_TYPE_TIKTOK_ANALYSIS_BATCH, 'video_pks')]
+    fetch_keys = [(JOB_TYPE_TIKTOK_BATCH_FETCH, 'batch_id')]
+    try:
+        # Rows are listed before the active jobs; every candidate is then re-checked under a row lock
+        # Batch children are run by their batch job, never individually
+        stuck_tasks = list(ScrapeResult.objects.filter(status__in=IN_FLIGHT_STATUSES, batch__isnull=True).values_list('id', flat=True))
+        active_tasks = active_payload_values(JOB_TYPE_SCRAPE, 'task_id')
+        for task_id in stuck_tasks:
+            if task_id in active_tasks:
+                continue
+            with transaction.atomic():
+                if _still_orphaned(ScrapeResult, task_id, scrape_keys):
+                    enqueue(JOB_TYPE_SCRAPE, {'task_id': task_id})
+                    recovered += 1
+
+        stuck_batches = list(ScrapeBatch.objects.filter(status__in=IN_FLIGHT_STATUSES).values_list('id', flat=True))
+        active_batches = active_payload_values(JOB_TYPE_SCRAPE_BATCH, 'batch_id')
+        for batch_id in stuck_batches:
+            if batch_id in active_batches:
+                continue
+            with transaction.atomic():
+                if _still_orphaned(ScrapeBatch, batch_id, batch_keys):
+                    enqueue(JOB_TYPE_SCRAPE_BATCH, {'batch_id': batch_id})
+                    recovered += 1
+
+        # PENDING means the metadata fetch has not created the batch's videos yet; later stages are covered below
+        stuck_fetches = list(TikTokBatch.objects.filter(status='PENDING').values_list('id', flat=True))
+        active_fetches = active_payload_values(JOB_TYPE_TIKTOK_BATCH_FETCH, 'batch_id')
+        for batch_id in stuck_fetches:
+            if batch_id in active_fetches:
+                continue
+            with transaction.atomic():
+                if _still_orphaned(TikTokBatch, batch_id, fetch_keys, statuses=['PENDING']):
+                    enqueue(JOB_TYPE_TIKTOK_BATCH_FETCH, {'batch_id': batch_id})
+                    recovered += 1
+
+        stuck_videos = list(TikTokVideo.objects.filter(status__in=IN_FLIGHT_STATUSES).values_list('id', 'batch_id'))
+        active_videos = set().union(*(active_payload_values(job_type, key) for job_type, key in video_keys))
+        orphaned_by_batch = {}
+        for video_pk, batch_id in stuck_videos:
+            if video_pk in active_videos:
+                continue
+            if batch_id is not None:
+                orphaned_by_batch.setdefault(batch_id, []).append(video_pk)
+                continue
+            with transaction.atomic():
+                if _still_orphaned(TikTokVideo, video_pk, video_keys):
+                    enqueue(JOB_TYPE_TIKTOK_ANALYSIS, {'video_pk': video_pk})
+                    recovered += 1
+        for batch_id, video_pks in orphaned_by_batch.items():
+            with transaction.atomic():
+                video_pks = [video_pk for video_pk in video_pks if _still_orphaned(TikTokVideo, video_pk, video_keys)]
+                if video_pks:
+                    enqueue_tiktok_batch_analysis(batch_id, video_pks)
+                    recovered += len(video_pks)
+    except QueueFullError as e:
+        logger.warning(f"Stopped recovering orphaned rows: {e}")
+
+    if recovered:
+        logger.warning(f"Re-queued {recovered} orphaned scrape/analysis rows.")
+    return recovered
@@ -0,0 +1,638 @@
+import os
+import time
+import tempfile
+import threading
+
+import httpx
+
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from asgiref.sync import async_to_sync
+from datetime import timedelta
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import ai_utils, history_utils, html_cleaning, http_client, job_queue, outbound_loop, page_cache, scraper_utils, tasks, views
+from core.browser_pool import BrowserPool
+from core.job_queue import PermanentJobError, enqueue
+from core.models import BackgroundJob, ChatHistory, ChatSummary, ScrapeResult, TikTokBatch, TikTokVideo
+from core import scrape_budget
+from core.scrape_budget import BudgetExceededError, monthly_spend, record_spend, reserve_budget
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_fixtures')
+
+
+class PageCacheCleanupTests(SimpleTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        settings_override = override_settings(
+            SCRAPER_PAGE_CACHE_ENABLED=True,
+            SCRAPER_PAGE_CACHE_DIR=self.cache_dir.name,
+            SCRAPER_PAGE_CACHE_TTL=3600,
+            SCRAPER_PAGE_CACHE_MAX_BYTES=10 * 1024 * 1024,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _age(self, url, seconds):
+        meta_path = page_cache._base_path(url) + '.json'
+        past = time.time() - seconds
+        os.utime(meta_path, (past, past))
+
+    def test_load_drops_expired_entry(self):
+        url = 'https://example.com/listings'
+        page_cache.store(url, '<html>old</html>', etag='"v1"')
+        page_cache.store_markdown(url, 'old', 'readability')
+        self._age(url, 7200)
+
+        self.assertIsNone(page_cache.load(url, 'readability'))
+        self.assertEqual(os.listdir(os.path.dirname(page_cache._base_path(url))), [])
+
+    def test_mark_used_extends_ttl(self):
+        url = 'https://example.com/listings'
+        page_cache.store(url, '<html>page</html>', etag='"v1"')
+        self._age(url, 7200)
+        page_cache.mark_used(url)
+
+        self.assertEqual(page_cache.load(url, 'readability').html, '<html>page</html>')
+
+    def test_sweep_removes_expired_then_least_recently_used(self):
+        urls = [f'https://example.com/page/{n}' for n in range(4)]
+        for age, url in zip([7200, 300, 200, 100], urls):
+            page_cache.store(url, 'x' * 1000, last_modified='Mon, 01 Jan 2024 00:00:00 GMT')
+            self._age(url, age)
+
+        entry_bytes = sum(
+            os.path.getsize(path) for path in page_cache._entry_files(page_cache._base_path(urls[1]))
+        )
+        with override_settings(SCRAPER_PAGE_CACHE_MAX_BYTES=2 * entry_bytes):
+            self.assertEqual(page_cache.sweep(), 2)
+
+        self.assertIsNone(page_cache.load(urls[0], 'readability'))
+        self.assertIsNone(page_cache.load(urls[1], 'readability'))
+        self.assertIsNotNone(page_cache.load(urls[2], 'readability'))
+        self.assertIsNotNone(page_cache.load(urls[3], 'readability'))
+
+
+class FindNextPageUrlTests(SimpleTestCase):
+    def test_prefers_next_page_number_over_next_class_decoy(self):
+        html = """
+        <a class="btn btn-next-step" href="/cart">Checkout</a>
+        <nav class="pagination">
+            <a href="/shop?page=1">1</a>
+            <a href="/shop?page=3">3</a>
+            <a href="/shop?page=2">2</a>
+        </nav>
+        """
+        self.assertEqual(
+            scraper_utils.find_next_page_url(html, 'https://example.com/shop?page=2'),
+            'https://example.com/shop?page=3',
+        )
+
+    def test_ignores_next_class_without_text_or_label(self):
+        html = '<a class="next" href="/cart">Add to cart</a>'
+        self.assertIsNone(scraper_utils.find_next_page_url(html, 'https://example.com/shop'))
+
+    def test_rel_next_wins(self):
+        html = """
+        <link rel="next" href="/shop/page/2/">
+        <a href="/shop?page=2">2</a>
+        """
+        self.assertEqual(
+            scraper_utils.find_next_page_url(html, 'https://example.com/shop/'),
+            'https://example.com/shop/page/2/',
+        )
+
+    def test_falls_back_to_next_text(self):
+        html = '<a href="/shop?cursor=abc">Next ›</a>'
+        self.assertEqual(
+            scraper_utils.find_next_page_url(html, 'https://example.com/shop'),
+            'https://example.com/shop?cursor=abc',
+        )
+
+
+class LxmlPipelineTests(SimpleTestCase):
+    def _markdown(self, fixture):
+        with open(os.path.join(FIXTURES_DIR, fixture), encoding='utf-8') as fh:
+            return scraper_utils.html_to_markdown(fh.read(), scraper_utils.HTML_PIPELINE_LXML)
+
+    def test_wrapper_class_does_not_drop_listing(self):
+        markdown_content = self._markdown('wrapper_class_listing.html')
+        self.assertIn('Laptop văn phòng', markdown_content)
+        self.assertEqual(markdown_content.count('/san-pham/'), 8)
+        self.assertNotIn('Lọc theo hãng', markdown_content)
+        self.assertNotIn('Hotline', markdown_content)
+
+    def test_wrapper_class_keeps_single_product(self):
+        markdown_content = self._markdown('product_detail_wrapper.html')
+        self.assertIn('Máy pha cà phê Espressa Mini', markdown_content)
+        self.assertIn('4.590.000', markdown_content)
+        self.assertNotIn('Sản phẩm đã xem', markdown_content)
+
+    def test_keeps_article_inside_chrome_like_wrappers(self):
+        markdown_content = self._markdown('article_in_wrappers.html')
+        self.assertIn('Cách bảo quản cà phê rang xay', markdown_content)
+        self.assertIn('van một chiều', markdown_content)
+        self.assertNotIn('cookie', markdown_content)
+        self.assertNotIn('Chia sẻ', markdown_content)
+
+    def test_matches_whole_class_tokens_only(self):
+        cleaned = html_cleaning.clean_html(
+            '<body><div class="card-header-wrap"><p>Giữ lại</p></div><div class="header"><p>Bỏ đi</p></div>'
+            '<p>Đoạn văn chính đủ dài để là khối chữ lớn nhất của trang mẫu này.</p></body>'
+        )
+        self.assertIn('Giữ lại', cleaned)
+        self.assertNotIn('Bỏ đi', cleaned)
+
+    def test_falls_back_to_readability_when_lxml_output_is_tiny(self):
+        text = 'Nội dung duy nhất của trang nằm trong thẻ aside nên pipeline lxml sẽ xóa mất. ' * 5
+        html_content = f'<html><body><aside><p>{text}</p></aside></body></html>'
+        self.assertIn('Nội dung duy nhất', scraper_utils.html_to_markdown(html_content, scraper_utils.HTML_PIPELINE_LXML))
+
+
+def _scrape_task(user, **fields):
+    return ScrapeResult.objects.create(
+        user=user, url='https://example.com', fields='name', model='gemini-2.0-flash',
+        # The migrated schema still has NOT NULL on the token/cost columns
+        input_tokens=0, output_tokens=0, total_cost=Decimal('0'), **fields
+    )
+
+
+@override_settings(SCRAPER_DEFAULT_MONTHLY_COST_CAP=1)
+class ScrapeBudgetReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('budget-user')
+
+    def test_in_flight_reservation_blocks_concurrent_task(self):
+        first, second = _scrape_task(self.user, status='PROCESSING'), _scrape_task(self.user, status='PROCESSING')
+        reserve_budget(first, 0.6)
+
+        self.assertEqual(monthly_spend(self.user), Decimal('0.6'))
+        with self.assertRaises(BudgetExceededError):
+            reserve_budget(second, 0.6)
+        self.assertIsNone(ScrapeResult.objects.get(pk=second.pk).estimated_cost)
+
+    def test_recorded_spend_replaces_reservation(self):
+        task = _scrape_task(self.user, status='PROCESSING')
+        reserved = reserve_budget(task, 0.6)
+        with mock.patch.object(scrape_budget, 'calculate_price', return_value=(1000, 100, 0.2)):
+            record_spend(task, {'input_tokens': 1000, 'output_tokens': 100}, reserved)
+
+        self.assertEqual(task.total_cost, Decimal('0.2'))
+        self.assertEqual(task.estimated_cost, Decimal('0'))
+        self.assertEqual(monthly_spend(self.user), Decimal('0.2'))
+        reserve_budget(_scrape_task(self.user, status='PROCESSING'), 0.7)
+
+    def test_failed_task_spend_still_counts(self):
+        task = _scrape_task(self.user, status='PROCESSING')
+        for _ in range(2):
+            # Two paid attempts, e.g. a transient error after Gemini answered and a retry
+            with mock.patch.object(scrape_budget, 'calculate_price', return_value=(1000, 100, 0.3)):
+                record_spend(task, {'input_tokens': 1000, 'output_tokens': 100}, reserve_budget(task, 0.3))
+        ScrapeResult.objects.filter(pk=task.pk).update(status='FAILED')
+
+        self.assertEqual(monthly_spend(self.user), Decimal('0.6'))
+        with self.assertRaises(BudgetExceededError):
+            reserve_budget(_scrape_task(self.user, status='PROCESSING'), 0.6)
+
+
+class RunExtractionTests(TestCase):
+    def setUp(self):
+        self.task = _scrape_task(User.objects.create_user('extract-user'), status='PROCESSING')
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(tasks, 'get_cached_extraction', return_value=None).start()
+        mock.patch.object(scraper_utils, 'estimate_extraction', return_value={'chunks': 1, 'input_tokens': 1000, 'output_tokens': 100, 'cost': 0.01}).start()
+        mock.patch.object(scrape_budget, 'calculate_price', return_value=(1000, 100, 0.01)).start()
+
+    def test_unusable_response_is_billed_and_not_retried(self):
+        tokens = {'input_tokens': 1000, 'output_tokens': 100}
+        with mock.patch.object(scraper_utils, 'gemini_extract_chunked', return_value=('not json', tokens, 0)):
+            with self.assertRaises(tasks.ExtractionError) as raised:
+                tasks._run_extraction(self.task, '# Page')
+
+        self.assertIsInstance(raised.exception, PermanentJobError)
+        task = ScrapeResult.objects.get(pk=self.task.pk)
+        self.assertEqual(task.total_cost, Decimal('0.01'))
+        self.assertEqual(task.input_tokens, 1000)
+
+    def test_failed_later_page_is_billed_but_not_counted(self):
+        pages = [
+            scraper_utils.FetchResult(html='<a rel="next" href="/shop?page=2">2</a>', strategy='http', markdown='# Page 1'),
+            scraper_utils.FetchResult(html='<p>Trang 2</p>', strategy='http', markdown='# Page 2'),
+        ]
+        replies = [('{"listings": [{"name": "A"}]}', {'input_tokens': 1000, 'output_tokens': 100}, 0),
+                   ('not json', {'input_tokens': 1000, 'output_tokens': 100}, 0)]
+        self.task.follow_pagination, self.task.max_pages = True, 3
+        with mock.patch.object(scraper_utils, 'fetch_html', side_effect=pages), \
+                mock.patch.object(scraper_utils, 'gemini_extract_chunked', side_effect=replies):
+            result = tasks._extract_paginated(self.task)
+
+        self.assertEqual(result, {'listings': [{'name': 'A'}]})
+        self.assertEqual(self.task.pages_scraped, 1)
+        self.assertEqual(self.task.total_cost, Decimal('0.02'))
+
+
+@override_settings(SCRAPER_DEFAULT_MONTHLY_COST_CAP=1)
+class ConcurrentScrapeBudgetTests(TransactionTestCase):
+    def test_concurrent_reservations_cannot_both_pass(self):
+        user = User.objects.create_user('budget-race')
+        tasks = [_scrape_task(user, status='PROCESSING') for _ in range(2)]
+        slow_remaining = scrape_budget.remaining_budget
+        results = []
+
+        def remaining_then_wait(task_user):
+            remaining = slow_remaining(task_user)
+            # Give the other thread time to read the same spend if nothing serializes the two checks
+            time.sleep(0.3)
+            return remaining
+
+        def reserve(task):
+            try:
+                reserve_budget(task, 0.6)
+                results.append('reserved')
+            except BudgetExceededError:
+                results.append('rejected')
+            finally:
+                connection.close()
+
+        with mock.patch.object(scrape_budget, 'remaining_budget', remaining_then_wait):
+            threads = [threading.Thread(target=reserve, args=(task,)) for task in tasks]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(results), ['rejected', 'reserved'])
+        self.assertEqual(monthly_spend(user), Decimal('0.6'))
+
+
+class TikTokBatchFetchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tiktok-user')
+        self.stored = TikTokVideo.objects.create(
+            user=self.user, video_id='111', video_url='https://www.tiktok.com/@a/video/111', status='COMPLETE'
+        )
+
+    def test_fetch_job_creates_rows_and_attaches_existing_videos(self):
+        video_urls = [
+            'https://www.tiktok.com/@a/video/111',
+            'https://vm.tiktok.com/short/',
+            'https://www.tiktok.com/@a/video/333',
+        ]
+        batch = TikTokBatch.objects.create(user=self.user, submitted_count=3, submitted_urls=video_urls)
+
+        async def fake_fetch(urls, creator, max_videos):
+            # The stored video is skipped before any request is made
+            self.assertEqual(urls, video_urls[1:])
+            return [
+                {'video_id': '222', 'author': 'a', 'video_url': urls[0]},
+                {'video_id': '111', 'author': 'a', 'video_url': urls[0]},
+            ], [{'url': urls[1], 'error': 'private'}], 0
+
+        with mock.patch.object(tasks, 'afetch_bulk_video_infos', fake_fetch), \
+                mock.patch.object(tasks, 'enqueue_tiktok_batch_analysis') as enqueue_analysis:
+            tasks.perform_batch_fetch_in_background(batch.id)
+
+        batch.refresh_from_db()
+        new_video = TikTokVideo.objects.get(video_id='222')
+        self.assertEqual(new_video.batch_id, batch.id)
+        self.assertEqual(batch.status, 'PROCESSING')
+        self.assertEqual(batch.video_count, 1)
+        self.assertEqual(batch.existing_video_pks, [self.stored.pk])
+        self.assertEqual(batch.duplicate_count, 1)
+        self.assertEqual(batch.fetch_failed_count, 1)
+        enqueue_analysis.assert_called_once_with(batch.id, [new_video.pk])
+
+    def test_recovery_requeues_batch_whose_fetch_job_was_lost(self):
+        lost = TikTokBatch.objects.create(user=self.user, submitted_urls=['https://www.tiktok.com/@a/video/555'])
+        queued = TikTokBatch.objects.create(user=self.user, submitted_urls=['https://www.tiktok.com/@a/video/666'])
+        enqueue(tasks.JOB_TYPE_TIKTOK_BATCH_FETCH, {'batch_id': queued.id})
+        TikTokBatch.objects.create(user=self.user, status='PROCESSING')
+
+        self.assertEqual(tasks.recover_orphaned_rows(), 1)
+        fetch_jobs = BackgroundJob.objects.filter(job_type=tasks.JOB_TYPE_TIKTOK_BATCH_FETCH)
+        self.assertEqual(sorted(job.payload['batch_id'] for job in fetch_jobs), [lost.id, queued.id])
+
+
+class TikTokResubmissionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tiktok-resubmit')
+        self.video_url = 'https://www.tiktok.com/@a/video/444'
+        self.video_info = {'video_id': '444', 'author': 'a', 'play_count': 10}
+
+    def test_in_flight_video_is_not_reset_or_requeued(self):
+        video = TikTokVideo.objects.create(
+            user=self.user, video_id='444', video_url=self.video_url, status='PROCESSING', analysis={'partial': True}
+        )
+
+        async def fake_info(video_url):
+            return self.video_info
+
+        with mock.patch.object(views, 'aget_tiktok_video_info', fake_info), \
+                mock.patch.object(views, 'enqueue') as enqueue_job:
+            result = async_to_sync(views._handle_tiktok_submission)(self.video_url, self.user)
+
+        self.assertEqual(result['status'], 'processing')
+        self.assertEqual(result['video']['id'], video.pk)
+        enqueue_job.assert_not_called()
+        video.refresh_from_db()
+        self.assertEqual(video.analysis, {'partial': True})
+
+    def test_reuse_shares_analysis_without_taking_over_the_row(self):
+        owner = User.objects.create_user('tiktok-owner')
+        video = TikTokVideo.objects.create(
+            user=owner, video_id='444', video_url=self.video_url, status='COMPLETE', analysis={'summary': 'ok'}
+        )
+
+        async def fake_info(video_url):
+            return self.video_info
+
+        with mock.patch.object(views, 'aget_tiktok_video_info', fake_info), \
+                mock.patch.object(views, 'analysis_is_reusable', return_value=True):
+            result = async_to_sync(views._handle_tiktok_submission)(self.video_url, self.user)
+
+        self.assertEqual(result['status'], 'complete')
+        self.assertEqual(result['analysis'], {'summary': 'ok'})
+        video.refresh_from_db()
+        self.assertEqual(video.user, owner)
+        self.assertEqual(video.play_count, 10)
+
+    def test_queue_helper_skips_row_put_in_flight_concurrently(self):
+        TikTokVideo.objects.create(user=self.user, video_id='444', video_url=self.video_url, status='PENDING')
+
+        with mock.patch.object(views, 'enqueue') as enqueue_job:
+            views._queue_tiktok_analysis(self.video_info, self.video_url, self.user)
+
+        enqueue_job.assert_not_called()
+
+
+class _FakeDriver:
+    def __init__(self, cdp_available=True):
+        self.cdp_available = cdp_available
+        self.commands, self.quit_called, self.current_url = [], False, 'https://shop.example/list'
+        self.window_handles = ['main']
+        self.switch_to = mock.Mock()
+
+    def execute_cdp_cmd(self, command, params):
+        if not self.cdp_available:
+            raise RuntimeError('CDP unavailable')
+        self.commands.append((command, params))
+        if command == 'Page.getFrameTree':
+            return {'frameTree': {
+                'frame': {'securityOrigin': 'https://shop.example'},
+                'childFrames': [{'frame': {'securityOrigin': 'https://ads.example'}}],
+            }}
+        if command == 'Network.getAllCookies':
+            return {'cookies': [{'domain': '.login.example'}]}
+        return {}
+
+    def get(self, url):
+        self.current_url = url
+
+    def quit(self):
+        self.quit_called = True
+
+
+class BrowserPoolResetTests(SimpleTestCase):
+    def test_clears_storage_of_every_visited_origin(self):
+        driver = _FakeDriver()
+        pool = BrowserPool(lambda: driver, max_size=1, max_pages=10)
+        with pool.checkout():
+            pass
+
+        cleared = {params['origin'] for command, params in driver.commands if command == 'Storage.clearDataForOrigin'}
+        self.assertEqual(cleared, {'https://shop.example', 'https://ads.example', 'https://login.example', 'http://login.example'})
+        self.assertIn(('Network.clearBrowserCache', {}), driver.commands)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_recycles_driver_when_storage_cannot_be_cleared(self):
+        driver = _FakeDriver(cdp_available=False)
+        pool = BrowserPool(lambda: driver, max_size=1, max_pages=10)
+        with pool.checkout():
+            pass
+
+        self.assertTrue(driver.quit_called)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+
+class OutboundHttpClientTests(SimpleTestCase):
+    def test_requests_from_separate_loops_share_one_client(self):
+        threads, created = [], []
+        real_client = httpx.AsyncClient
+
+        def handler(request):
+            threads.append(threading.current_thread().name)
+            return httpx.Response(200, json={'code': 0})
+
+        def make_client(**kwargs):
+            created.append(real_client(transport=httpx.MockTransport(handler), **kwargs))
+            return created[-1]
+
+        self.addCleanup(setattr, http_client, '_client', None)
+        http_client._client = None
+        with mock.patch.object(http_client.httpx, 'AsyncClient', make_client):
+            # Each async_to_sync call runs on a fresh event loop, like a WSGI request or a job
+            for _ in range(2):
+                self.assertEqual(async_to_sync(http_client.aget)('https://api.example/').json(), {'code': 0})
+
+        self.assertEqual(len(created), 1)
+        self.assertEqual(threads, ['outbound-loop', 'outbound-loop'])
+
+
+class OutboundLoopTests(SimpleTestCase):
+    def test_iterate_runs_the_stream_on_the_shared_loop(self):
+        async def stream():
+            for part in ('a', 'b'):
+                yield part, threading.current_thread().name
+
+        async def consume():
+            return [item async for item in outbound_loop.iterate(stream())]
+
+        self.assertEqual(async_to_sync(consume)(), [('a', 'outbound-loop'), ('b', 'outbound-loop')])
+
+
+class JobQueueTests(TestCase):
+    job_type = 'test_job'
+
+    def setUp(self):
+        self.calls, self.failures = [], []
+        self.addCleanup(job_queue._handlers.pop, self.job_type, None)
+
+    def _register(self, error=None):
+        def handler(**payload):
+            self.calls.append(payload)
+            if error:
+                raise error
+
+        job_queue.job_handler(self.job_type, on_failure=lambda payload, message: self.failures.append(payload))(handler)
+
+    def _make_ready(self, job):
+        BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+    def test_claim_is_compare_and_set(self):
+        job_queue.enqueue(self.job_type, {'n': 1})
+
+        claimed = job_queue.claim_next(self.job_type, 'worker-a')
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), ('PROCESSING', 'worker-a', 1))
+        self.assertIsNone(job_queue.claim_next(self.job_type, 'worker-b'))
+
+    def test_failed_job_retries_then_fails_once(self):
+        self._register(error=ValueError('boom'))
+        job = job_queue.enqueue(self.job_type, {'n': 1}, max_attempts=2)
+
+        job_queue.run_job(job_queue.claim_next(self.job_type, 'worker-a'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('PENDING', ''))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(job_queue.claim_next(self.job_type, 'worker-a'))
+
+        self._make_ready(job)
+        job_queue.run_job(job_queue.claim_next(self.job_type, 'worker-a'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 2))
+        self.assertEqual(self.failures, [{'n': 1}])
+
+    def test_permanent_error_is_not_retried(self):
+        self._register(error=PermanentJobError('over budget'))
+        job = job_queue.enqueue(self.job_type, {'n': 1}, max_attempts=3)
+
+        job_queue.run_job(job_queue.claim_next(self.job_type, 'worker-a'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('FAILED', 1, 'over budget'))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.failures, [{'n': 1}])
+
+    def test_stale_lease_is_requeued_and_old_worker_cannot_finish_it(self):
+        self._register()
+        job_queue.enqueue(self.job_type, {'n': 1})
+        stale = job_queue.claim_next(self.job_type, 'worker-a')
+        BackgroundJob.objects.filter(pk=stale.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(job_queue.recover_stale_jobs(), 1)
+        self._make_ready(stale)
+        current = job_queue.claim_next(self.job_type, 'worker-b')
+        self.assertEqual(current.pk, stale.pk)
+
+        # The first worker wakes up and finishes: it no longer owns the job, so the new run is untouched
+        job_queue.run_job(stale)
+        current.refresh_from_db()
+        self.assertEqual((current.status, current.locked_by), ('PROCESSING', 'worker-b'))
+
+    def test_heartbeat_extends_only_the_owned_lease(self):
+        job_queue.enqueue(self.job_type, {'n': 1})
+        job = job_queue.claim_next(self.job_type, 'worker-a')
+        BackgroundJob.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() + timedelta(seconds=5))
+
+        job_queue._extend_lease(job.pk, 'worker-b')
+        job.refresh_from_db()
+        self.assertLess(job.lease_expires_at, timezone.now() + timedelta(seconds=10))
+        job_queue._extend_lease(job.pk, 'worker-a')
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=60))
+
+
+class SystemPromptCacheTests(SimpleTestCase):
+    def setUp(self):
+        base_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(base_dir.cleanup)
+        self.csv_path = os.path.join(base_dir.name, 'Data.csv')
+        settings_override = override_settings(BASE_DIR=base_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = ai_utils._SystemPromptCache()
+
+    def _write_csv(self, row, mtime):
+        with open(self.csv_path, 'w', encoding='utf-8') as fh:
+            fh.write(f'Name,Note\n{row}\n')
+        os.utime(self.csv_path, (mtime, mtime))
+
+    def test_reads_csv_once_until_it_changes(self):
+        self._write_csv('Rita,vui ve', 1_000_000)
+        first = self.cache.render('An')
+        self.assertIn('vui ve', first)
+        self.assertIn('An', first)
+        self.assertIn('Binh', self.cache.render('Binh'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # Same size, new mtime: the file is read again
+        self._write_csv('Rita,vui vo', 2_000_000)
+        self.assertIn('vui vo', self.cache.render('An'))
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_missing_file_is_cached_until_it_appears(self):
+        self.assertIn('Data.csv', self.cache.render('An'))
+        self.cache.render('An')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        self._write_csv('Rita,vui ve', 1_000_000)
+        self.assertIn('vui ve', self.cache.render('An'))
+
+
+@override_settings(CHAT_HISTORY_MAX_TOKENS=10)
+class HistoryTokenBudgetTests(SimpleTestCase):
+    # 4 characters per token: each message below costs 3 tokens
+    rows = [(1, 'user', 'a' * 12), (2, 'model', 'b' * 12), (3, 'user', 'c' * 12), (4, 'model', 'd' * 12)]
+
+    def test_drops_oldest_messages_over_budget_and_starts_with_user(self):
+        # 3 newest rows fit in 10 tokens, but the window must not start with a model turn
+        self.assertEqual([row[0] for row in history_utils._apply_token_budget(self.rows)], [3, 4])
+
+    def test_summary_tokens_are_reserved_first(self):
+        self.assertEqual([row[0] for row in history_utils._apply_token_budget(self.rows, reserved_tokens=5)], [])
+        self.assertEqual([row[0] for row in history_utils._apply_token_budget(self.rows, reserved_tokens=4)], [3, 4])
+
+    @override_settings(CHAT_HISTORY_MAX_TOKENS=0)
+    def test_zero_budget_means_unlimited(self):
+        self.assertEqual([row[0] for row in history_utils._apply_token_budget(self.rows)], [1, 2, 3, 4])
+
+
+@override_settings(CHAT_HISTORY_MAX_TURNS=1, CHAT_HISTORY_MAX_TOKENS=0, CHAT_HISTORY_SUMMARY_ENABLED=True, CHAT_HISTORY_SUMMARY_BATCH=2)
+class HistorySummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('chat-user')
+        self.messages = [
+            ChatHistory.objects.create(user=self.user, role=role, content=f'tin nhan {n}')
+            for n, role in enumerate(['user', 'model'] * 3)
+        ]
+
+    def test_window_keeps_summary_and_schedules_refresh_once(self):
+        ChatSummary.objects.create(user=self.user, content='tom tat cu', last_message_id=self.messages[1].pk)
+
+        for _ in range(2):
+            history = async_to_sync(history_utils.abuild_history_window)(self.user)
+
+        self.assertIn('tom tat cu', history[0]['parts'][0])
+        self.assertEqual([turn['parts'][0] for turn in history[2:]], ['tin nhan 4', 'tin nhan 5'])
+        jobs = BackgroundJob.objects.filter(job_type=history_utils.JOB_TYPE_CHAT_SUMMARY)
+        self.assertEqual([job.payload for job in jobs], [{'user_id': self.user.pk}])
+
+    def test_refresh_folds_pending_messages_in_batches(self):
+        model = mock.Mock()
+        model.generate_content.side_effect = [mock.Mock(text='tom tat 1'), mock.Mock(text='tom tat 2')]
+        with mock.patch.object(history_utils, 'get_generative_model', return_value=model):
+            history_utils.refresh_summary(self.user.pk)
+
+        summary = ChatSummary.objects.get(user=self.user)
+        self.assertEqual((summary.content, summary.last_message_id), ('tom tat 2', self.messages[3].pk))
+        self.assertEqual(model.generate_content.call_count, 2)
+
+    def test_refresh_stops_when_another_job_updated_the_summary(self):
+        summary = ChatSummary.objects.create(user=self.user)
+
+        def concurrent_update(prompt):
+            ChatSummary.objects.filter(pk=summary.pk).update(content='job khac', last_message_id=self.messages[3].pk)
+            return mock.Mock(text='tom tat cu')
+
+        model = mock.Mock()
+        model.generate_content.side_effect = concurrent_update
+        with mock.patch.object(history_utils, 'get_generative_model', return_value=model):
+            history_utils.refresh_summary(self.user.pk)
+
+        summary.refresh_from_db()
+        self.assertEqual((summary.content, summary.last_message_id), ('job khac', self.messages[3].pk))
+        self.assertEqual(model.generate_content.call_count, 1)
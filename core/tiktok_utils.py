@@ -1,14 +1,165 @@
 # File: Rita_All_Django/core/tiktok_utils.py
-import requests
-import logging
+import re
 import json
-import google.generativeai as genai
+import asyncio
+import hashlib
+import logging
+from typing import List
+from urllib.parse import urlparse
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+from pydantic import BaseModel, create_model
+
+from .gemini_pool import get_generative_model
+from . import http_client
 
 # Lấy logger được cấu hình sẵn trong Django
 logger = logging.getLogger(__name__)
 
 # End-point của API trung gian để lấy thông tin video TikTok
 API_ENDPOINT = "https://www.tikwm.com/api/"
+USER_POSTS_ENDPOINT = "https://www.tikwm.com/api/user/posts"
+# Số video tối đa mỗi trang mà API user/posts trả về
+USER_POSTS_PAGE_SIZE = 35
+VIDEO_ID_RE = re.compile(r'/video/(\d+)')
+
+def normalize_tiktok_url(video_url: str) -> str:
+    """Chuẩn hóa URL (host chữ thường, bỏ 'www.'/'m.', query, fragment và '/' cuối) để dùng làm khóa cache."""
+    parsed = urlparse(video_url.strip())
+    host = (parsed.hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return f"{host}{parsed.path.rstrip('/')}"
+
+def _url_cache_key(video_url):
+    return "tiktok:url:" + hashlib.sha256(normalize_tiktok_url(video_url).encode('utf-8')).hexdigest()
+
+def _video_cache_key(video_id):
+    return f"tiktok:video:{video_id}"
+
+async def _acached_video_info(video_url):
+    """Metadata đã cache cho URL: tra theo video id nếu URL chứa id, ngược lại (link rút gọn...) theo URL chuẩn hóa."""
+    match = VIDEO_ID_RE.search(urlparse(video_url).path)
+    video_id = match.group(1) if match else await cache.aget(_url_cache_key(video_url))
+    return await cache.aget(_video_cache_key(video_id)) if video_id else None
+
+async def _astore_video_info(video_url, video_info):
+    ttl = settings.TIKTOK_METADATA_CACHE_TTL
+    await cache.aset(_video_cache_key(video_info["video_id"]), video_info, ttl)
+    await cache.aset(_url_cache_key(video_url), video_info["video_id"], ttl)
+
+def format_video_data(video_data: dict) -> dict:
+    """Chuyển một object video của API tikwm sang dict thông tin video dùng trong ứng dụng."""
+    author_info = video_data.get("author", {})
+    return {
+        "video_id": video_data.get("id"),
+        "author": author_info.get("nickname", author_info.get("unique_id")),
+        "description": video_data.get("title"),
+        "cover_url": video_data.get("cover"),
+        "download_url": video_data.get("play"),
+        "play_count": video_data.get("play_count", 0),
+        "duration": video_data.get("duration", 0),
+        "likes": video_data.get("digg_count", 0),
+        "comments": video_data.get("comment_count", 0),
+        "shares": video_data.get("share_count", 0),
+        "transcript": None,
+    }
+
+# Chỉ số tương tác dùng để quyết định có cần phân tích lại hay không
+STAT_FIELDS = ('play_count', 'likes', 'comments', 'shares')
+
+def stats_snapshot(video) -> dict:
+    """Ảnh chụp các chỉ số tương tác của một bản ghi TikTokVideo."""
+    return {field: getattr(video, field) or 0 for field in STAT_FIELDS}
+
+def is_analysis_error(analysis) -> bool:
+    return not isinstance(analysis, dict) or analysis.get("summary") == ANALYSIS_ERROR_SUMMARY
+
+def analysis_is_reusable(video, video_info: dict) -> bool:
+    """
+    True nếu video đã có phân tích hợp lệ và không chỉ số nào (lượt xem, thích, bình luận, chia sẻ)
+    thay đổi quá TIKTOK_ANALYSIS_REUSE_THRESHOLD (tỷ lệ tương đối) so với lúc phân tích.
+    """
+    if not settings.TIKTOK_ANALYSIS_REUSE_ENABLED:
+        return False
+    if video.status != 'COMPLETE' or not video.analyzed_stats or is_analysis_error(video.analysis):
+        return False
+    for field in STAT_FIELDS:
+        old, new = video.analyzed_stats.get(field, 0) or 0, video_info.get(field, 0) or 0
+        if abs(new - old) / max(old, 1) > settings.TIKTOK_ANALYSIS_REUSE_THRESHOLD:
+            return False
+    return True
+
+def video_info_from_model(video) -> dict:
+    """Dựng dict thông tin video (cùng key với aget_tiktok_video_info) từ một bản ghi TikTokVideo đã lưu."""
+    return {
+        "video_id": video.video_id,
+        "author": video.author,
+        "description": video.description,
+        "cover_url": video.cover_url,
+        "download_url": video.download_url,
+        "play_count": video.play_count,
+        "duration": video.duration,
+        "likes": video.likes,
+        "comments": video.comments,
+        "shares": video.shares,
+        "transcript": video.transcript,
+    }
+
+def video_fields_from_info(video_info: dict, video_url: str) -> dict:
+    """Giá trị các trường TikTokVideo dựng từ dict metadata (ngược lại với video_info_from_model)."""
+    return {
+        'video_url': video_url,
+        'author': video_info.get("author"),
+        'description': video_info.get("description"),
+        'cover_url': video_info.get("cover_url"),
+        'download_url': video_info.get("download_url"),
+        'play_count': video_info.get("play_count", 0),
+        'duration': video_info.get("duration", 0),
+        'likes': video_info.get("likes", 0),
+        'comments': video_info.get("comments", 0),
+        'shares': video_info.get("shares", 0),
+        'transcript': video_info.get('transcript'),
+    }
+
+ANALYSIS_MODEL = 'gemini-1.5-flash-latest'
+ANALYSIS_ROLE = "Với vai trò là một chuyên gia phân tích mạng xã hội"
+ANALYSIS_KEYS = """- "summary": (string) Một bản tóm tắt ngắn gọn (2-3 câu) về nội dung và mục đích của video.
+        - "sentiment": (string) Cảm xúc tổng thể của video (ví dụ: Tích cực, Tiêu cực, Hài hước, Truyền cảm hứng).
+        - "potential_virality": (string) Đánh giá khả năng lan truyền của video (Thấp, Trung bình, Cao) dựa trên các chỉ số tương tác và nội dung.
+        - "positive_points": (list of strings) Một danh sách các điểm mạnh hoặc yếu tố tích cực của video.
+        - "negative_points": (list of strings) Một danh sách các điểm yếu hoặc những gì có thể được cải thiện.
+        - "suggestions": (list of strings) Một danh sách các đề xuất cụ thể để cải thiện video."""
+
+class TikTokAnalysis(BaseModel):
+    """Schema kết quả phân tích một video (dùng làm response_schema khi phân tích gộp)."""
+    summary: str
+    sentiment: str
+    potential_virality: str
+    positive_points: List[str]
+    negative_points: List[str]
+    suggestions: List[str]
+
+def _video_details(video_info: dict) -> str:
+    return f"""- Tác giả: {video_info.get('author', 'Không rõ')}
+        - Mô tả / Tiêu đề: {video_info.get('description', 'Không có')}
+        - Lượt xem: {video_info.get('play_count', 0)}
+        - Lượt thích: {video_info.get('likes', 0)}
+        - Lượt bình luận: {video_info.get('comments', 0)}
+        - Lượt chia sẻ: {video_info.get('shares', 0)}"""
+
+ANALYSIS_ERROR_SUMMARY = "Không thể phân tích video do lỗi từ hệ thống AI."
+
+def _analysis_error(message: str) -> dict:
+    return {
+        "summary": ANALYSIS_ERROR_SUMMARY,
+        "sentiment": "Không xác định", "potential_virality": "Không xác định",
+        "positive_points": [], "negative_points": [f"Chi tiết lỗi: {message}"],
+        "suggestions": ["Vui lòng thử lại sau."]
+    }
 
 def get_gemini_tiktok_analysis(video_info: dict) -> str:
     """
@@ -23,30 +174,20 @@ def get_gemini_tiktok_analysis(video_info: dict) -> str:
     """
     try:
         # Cấu hình model để trả về JSON
-        model = genai.GenerativeModel(
-            'gemini-1.5-flash-latest',
+        model = get_generative_model(
+            ANALYSIS_MODEL,
             generation_config={"response_mime_type": "application/json"}
         )
         
         # Xây dựng prompt chi tiết để hướng dẫn AI
         prompt = f"""
-        Với vai trò là một chuyên gia phân tích mạng xã hội, hãy phân tích video TikTok sau đây dựa trên các thông tin được cung cấp.
+        {ANALYSIS_ROLE}, hãy phân tích video TikTok sau đây dựa trên các thông tin được cung cấp.
         
         Thông tin video:
-        - Tác giả: {video_info.get('author', 'Không rõ')}
-        - Mô tả / Tiêu đề: {video_info.get('description', 'Không có')}
-        - Lượt xem: {video_info.get('play_count', 0)}
-        - Lượt thích: {video_info.get('likes', 0)}
-        - Lượt bình luận: {video_info.get('comments', 0)}
-        - Lượt chia sẻ: {video_info.get('shares', 0)}
+        {_video_details(video_info)}
 
         Hãy cung cấp phân tích của bạn dưới dạng một đối tượng JSON với các key sau:
-        - "summary": (string) Một bản tóm tắt ngắn gọn (2-3 câu) về nội dung và mục đích của video.
-        - "sentiment": (string) Cảm xúc tổng thể của video (ví dụ: Tích cực, Tiêu cực, Hài hước, Truyền cảm hứng).
-        - "potential_virality": (string) Đánh giá khả năng lan truyền của video (Thấp, Trung bình, Cao) dựa trên các chỉ số tương tác và nội dung.
-        - "positive_points": (list of strings) Một danh sách các điểm mạnh hoặc yếu tố tích cực của video.
-        - "negative_points": (list of strings) Một danh sách các điểm yếu hoặc những gì có thể được cải thiện.
-        - "suggestions": (list of strings) Một danh sách các đề xuất cụ thể để cải thiện video.
+        {ANALYSIS_KEYS}
 
         Hãy đảm bảo câu trả lời chỉ là một đối tượng JSON hợp lệ.
         """
@@ -57,79 +198,178 @@ def get_gemini_tiktok_analysis(video_info: dict) -> str:
 
     except Exception as e:
         logger.error(f"Lỗi khi gọi Gemini API để phân tích TikTok: {e}", exc_info=True)
-        error_response = {
-            "summary": "Không thể phân tích video do lỗi từ hệ thống AI.",
-            "sentiment": "Không xác định", "potential_virality": "Không xác định",
-            "positive_points": [], "negative_points": [f"Chi tiết lỗi: {str(e)}"],
-            "suggestions": ["Vui lòng thử lại sau."]
-        }
-        return json.dumps(error_response, ensure_ascii=False)
+        return json.dumps(_analysis_error(str(e)), ensure_ascii=False)
+
+def _batch_key(video_id) -> str:
+    # Key của schema phải là định danh hợp lệ, nên thêm tiền tố trước video id
+    return f"video_{video_id}"
+
+def get_gemini_tiktok_batch_analysis(video_infos: list) -> dict:
+    """
+    Phân tích nhiều video trong một request Gemini: phần hướng dẫn chỉ gửi một lần, response_schema là
+    một object có key `video_<id>` cho mỗi video. Trả về {video_id: dict phân tích}; video thiếu trong
+    phản hồi (hoặc khi request lỗi) không có trong kết quả để caller phân tích riêng.
+    """
+    BatchAnalysis = create_model(
+        'TikTokBatchAnalysis', **{_batch_key(info['video_id']): (TikTokAnalysis, ...) for info in video_infos}
+    )
+    videos_text = "\n\n        ".join(
+        f"Video `{_batch_key(info['video_id'])}`:\n        {_video_details(info)}" for info in video_infos
+    )
+    try:
+        model = get_generative_model(
+            ANALYSIS_MODEL,
+            generation_config={"response_mime_type": "application/json", "response_schema": BatchAnalysis}
+        )
+        prompt = f"""
+        {ANALYSIS_ROLE}, hãy phân tích độc lập từng video TikTok sau đây dựa trên các thông tin được cung cấp.
+
+        {videos_text}
 
-def get_tiktok_video_info(video_url: str):
+        Trả về một đối tượng JSON có đúng một key cho mỗi video (là mã video ở trên, ví dụ `{_batch_key(video_infos[0]['video_id'])}`).
+        Giá trị của mỗi key là một đối tượng JSON với các key sau:
+        {ANALYSIS_KEYS}
+        """
+        response = model.generate_content(prompt)
+        data = json.loads(response.text)
+    except Exception as e:
+        logger.error(f"Lỗi khi gọi Gemini API để phân tích gộp {len(video_infos)} video TikTok: {e}", exc_info=True)
+        return {}
+
+    results = {}
+    for info in video_infos:
+        analysis = data.get(_batch_key(info['video_id'])) if isinstance(data, dict) else None
+        if isinstance(analysis, dict):
+            results[info['video_id']] = analysis
+    return results
+
+async def aget_tiktok_video_info(video_url: str, use_cache: bool = True):
     """
-    Lấy thông tin chi tiết của video TikTok thông qua một API trung gian.
+    Lấy thông tin chi tiết của video TikTok thông qua một API trung gian, bằng client httpx dùng chung.
+    Kết quả thành công được cache TIKTOK_METADATA_CACHE_TTL giây theo URL chuẩn hóa và video id,
+    nên gửi lại cùng một video trong khoảng đó không gọi API lần nữa.
     """
+    if use_cache and settings.TIKTOK_METADATA_CACHE_TTL > 0:
+        cached = await _acached_video_info(video_url)
+        if cached:
+            logger.info(f"Dùng metadata đã cache cho video ID: {cached['video_id']}")
+            return cached
     try:
-        params = {'url': video_url}
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(API_ENDPOINT, params=params, headers=headers, timeout=15)
-        response.raise_for_status()
+        response = await http_client.aget(API_ENDPOINT, params={'url': video_url})
         data = response.json()
 
         if data.get("code") != 0 or "data" not in data:
             error_message = data.get("msg", "Phản hồi không hợp lệ từ API TikTok.")
             logger.error(f"Lỗi API TikTok: {error_message} cho URL: {video_url}")
             return {"error": error_message}
-            
-        video_data = data["data"]
-        author_info = video_data.get("author", {})
-
-        # CẬP NHẬT: Thay đổi cách lấy thông tin thống kê để khớp với API mới
-        formatted_data = {
-            "video_id": video_data.get("id"),
-            "author": author_info.get("nickname", author_info.get("unique_id")),
-            "description": video_data.get("title"),
-            "cover_url": video_data.get("cover"),
-            "download_url": video_data.get("play"),
-            "play_count": video_data.get("play_count", 0),
-            "duration": video_data.get("duration", 0),
-            "likes": video_data.get("digg_count", 0),
-            "comments": video_data.get("comment_count", 0),
-            "shares": video_data.get("share_count", 0),
-            "transcript": None,
-        }
-        
+
+        formatted_data = format_video_data(data["data"])
         if not formatted_data["video_id"]:
             return {"error": "Không thể lấy ID video. Video có thể là riêng tư hoặc đã bị xóa."}
 
         logger.info(f"Lấy thông tin thành công cho video ID: {formatted_data['video_id']}")
+        if settings.TIKTOK_METADATA_CACHE_TTL > 0:
+            await _astore_video_info(video_url, formatted_data)
         return formatted_data
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Lỗi mạng khi lấy dữ liệu TikTok: {e}", exc_info=True)
+    except httpx.HTTPError as e:
+        logger.error(f"Lỗi mạng khi lấy dữ liệu TikTok: {e!r}", exc_info=True)
         return {"error": f"Lỗi mạng: {e}"}
     except Exception as e:
-        logger.error(f"Lỗi không xác định trong get_tiktok_video_info: {e}", exc_info=True)
+        logger.error(f"Lỗi không xác định trong aget_tiktok_video_info: {e}", exc_info=True)
         return {"error": "Lỗi máy chủ không mong muốn khi xử lý video."}
 
-def analyze_tiktok_video(video_url: str, user):
+async def aget_tiktok_user_posts(unique_id: str, max_videos: int):
+    """
+    Lấy tối đa max_videos video gần nhất của một creator qua API user/posts (phân trang theo cursor).
+    Mỗi video đã có đủ metadata nên được cache luôn, không cần gọi API cho từng video.
+    Trả về {"videos": [...]} (mỗi phần tử có thêm "video_url") hoặc {"error": ...}.
+    """
+    unique_id = unique_id.strip().lstrip('@')
+    videos, cursor = [], 0
+    try:
+        while len(videos) < max_videos:
+            params = {'unique_id': unique_id, 'count': min(USER_POSTS_PAGE_SIZE, max_videos - len(videos)), 'cursor': cursor}
+            data = (await http_client.aget(USER_POSTS_ENDPOINT, params=params)).json()
+            if data.get("code") != 0 or not data.get("data"):
+                if videos:
+                    break
+                error_message = data.get("msg", "Phản hồi không hợp lệ từ API TikTok.")
+                logger.error(f"Lỗi API TikTok: {error_message} cho creator: @{unique_id}")
+                return {"error": error_message}
+
+            page = data["data"]
+            for item in page.get("videos") or []:
+                video_info = format_video_data(item)
+                if not video_info["video_id"]:
+                    continue
+                video_info["video_url"] = f"https://www.tiktok.com/@{unique_id}/video/{video_info['video_id']}"
+                if settings.TIKTOK_METADATA_CACHE_TTL > 0:
+                    await _astore_video_info(video_info["video_url"], video_info)
+                videos.append(video_info)
+            if not page.get("hasMore") or not page.get("videos"):
+                break
+            cursor = page.get("cursor")
+    except httpx.HTTPError as e:
+        logger.error(f"Lỗi mạng khi lấy danh sách video của @{unique_id}: {e!r}", exc_info=True)
+        if not videos:
+            return {"error": f"Lỗi mạng: {e}"}
+
+    logger.info(f"Lấy được {len(videos)} video của creator @{unique_id}")
+    return {"videos": videos[:max_videos]}
+
+async def afetch_bulk_video_infos(video_urls, creator: str = '', max_videos: int = 0):
+    """
+    Lấy metadata cho nhiều URL, tối đa TIKTOK_BULK_FETCH_CONCURRENCY request cùng lúc, cộng thêm
+    max_videos video mới nhất của creator (nếu có). Trả về (infos, failures, feed_count);
+    mỗi phần tử của infos có thêm "video_url".
+    """
+    semaphore = asyncio.Semaphore(max(1, settings.TIKTOK_BULK_FETCH_CONCURRENCY))
+
+    async def fetch(video_url):
+        async with semaphore:
+            return video_url, await aget_tiktok_video_info(video_url)
+
+    infos, failures = [], []
+    for video_url, video_info in await asyncio.gather(*(fetch(video_url) for video_url in video_urls)):
+        if video_info.get("error"):
+            failures.append({'url': video_url, 'error': video_info["error"]})
+        else:
+            infos.append({**video_info, 'video_url': video_url})
+
+    feed_count = 0
+    if creator and max_videos > 0:
+        feed = await aget_tiktok_user_posts(creator, max_videos)
+        if feed.get("error"):
+            failures.append({'creator': creator, 'error': feed["error"]})
+        else:
+            infos.extend(feed["videos"])
+            feed_count = len(feed["videos"])
+    return infos, failures, feed_count
+
+def analyze_tiktok_video(video):
     """
     Thực hiện phân tích video TikTok bằng AI.
+    Prompt được dựng từ metadata đã lưu trên bản ghi TikTokVideo lúc gửi URL, không gọi lại API TikTok.
     """
-    logger.info(f"Bắt đầu phân tích AI cho video: {video_url} bởi người dùng: {user.username}")
-    
-    video_info = get_tiktok_video_info(video_url)
-    
-    if 'error' in video_info:
-        logger.error(f"Không thể phân tích video do không lấy được thông tin: {video_info['error']}")
-        error_response = {
-            "summary": "Không thể phân tích do không lấy được thông tin ban đầu của video.",
-            "sentiment": "Không xác định", "potential_virality": "Không xác định",
-            "positive_points": [], "negative_points": [f"Lỗi: {video_info['error']}"],
-            "suggestions": ["Hãy chắc chắn URL video là công khai và hợp lệ."]
-        }
-        return json.dumps(error_response, ensure_ascii=False)
-        
-    analysis_json_string = get_gemini_tiktok_analysis(video_info)
-    
-    return analysis_json_string
\ No newline at end of file
+    logger.info(f"Bắt đầu phân tích AI cho video: {video.video_url} bởi người dùng: {video.user.username}")
+    return get_gemini_tiktok_analysis(video_info_from_model(video))
+
+def analyze_tiktok_videos(videos) -> dict:
+    """
+    Phân tích một nhóm TikTokVideo bằng một request Gemini duy nhất (xem get_gemini_tiktok_batch_analysis).
+    Video không có kết quả trong phản hồi gộp được phân tích riêng. Trả về {pk: dict phân tích}.
+    """
+    if len(videos) == 1:
+        return {videos[0].pk: json.loads(analyze_tiktok_video(videos[0]))}
+    video_infos = {video.pk: video_info_from_model(video) for video in videos}
+    logger.info(f"Bắt đầu phân tích AI gộp {len(videos)} video trong một request.")
+    batch_results = get_gemini_tiktok_batch_analysis(list(video_infos.values()))
+    analyses = {}
+    for video in videos:
+        analysis = batch_results.get(video.video_id)
+        if analysis is None:
+            logger.warning(f"Phản hồi gộp thiếu video ID: {video.video_id}, phân tích riêng.")
+            analysis = json.loads(get_gemini_tiktok_analysis(video_infos[video.pk]))
+        analyses[video.pk] = analysis
+    return analyses
@@ -16,12 +16,15 @@ urlpatterns = [
     # --- Chat Feature ---
     path('chat/', views.chat_view, name='chat_view'),
     path('api/chat/', views.api_chat, name='api_chat'),
+    path('api/chat/stream/', views.api_chat_stream, name='api_chat_stream'),
     path('api/chat/refresh/', views.api_refresh_chat, name='api_refresh_chat'),
     
     # --- TikTok Analyzer ---
     path('tiktok-analyzer/', views.tiktok_analyzer_view, name='tiktok_analyzer_view'),
     path('api/tiktok-analyzer/submit/', views.api_tiktok_submit_url, name='api_tiktok_submit_url'),
     path('api/tiktok-analyzer/status/', views.api_tiktok_check_status, name='api_tiktok_check_status'),
+    path('api/tiktok-analyzer/bulk/submit/', views.api_tiktok_submit_bulk, name='api_tiktok_submit_bulk'),
+    path('api/tiktok-analyzer/batch/<int:batch_id>/status/', views.api_tiktok_batch_status, name='api_tiktok_batch_status'),
     path('api/tiktok-history/delete/', views.api_delete_tiktok_history, name='api_delete_tiktok_history'),
 
     # --- Location Tracker ---
@@ -36,6 +39,10 @@ urlpatterns = [
     path('api/web-scraper/start/', views.api_start_scraping, name='api_start_scrape'),
     path('api/web-scraper/status/<int:task_id>/', views.api_check_scrape_status, name='api_check_scrape_status'),
     path('api/web-scraper/history/', views.api_get_scrape_history, name='api_get_scrape_history'),
+    path('api/web-scraper/metrics/', views.api_scraper_metrics, name='api_scraper_metrics'),
     path('api/web-scraper/history/delete/', views.api_delete_scrape_history, name='api_delete_scrape_history'),
     path('download/scrape/<int:task_id>/<str:file_type>/', views.download_scrape_result, name='download_scrape_result'),
+    path('api/web-scraper/batch/start/', views.api_start_batch_scraping, name='api_start_batch_scraping'),
+    path('api/web-scraper/batch/status/<int:batch_id>/', views.api_check_batch_status, name='api_check_batch_status'),
+    path('download/scrape-batch/<int:batch_id>/<str:file_type>/', views.download_batch_result, name='download_batch_result'),
 ]
\ No newline at end of file
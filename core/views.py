@@ -1,69 +1,117 @@
 # File: Rita_All_Django/core/views.py
 import json
 import logging
-import threading
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse, FileResponse, Http404
-from django.core.files.base import ContentFile
-from django.utils import timezone
+from django.http import JsonResponse, FileResponse, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
 from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
-import pandas as pd
+from django.utils import timezone
+from asgiref.sync import sync_to_async
 import os
-import asyncio
+from collections import Counter
 
 from .models import (
-    TikTokVideo, ChatHistory, Profile, TrackingLink, LocationLog, ScrapeResult
+    TikTokVideo, TikTokBatch, ChatHistory, ChatSummary, Profile, TrackingLink, LocationLog, ScrapeResult, ScrapeBatch
 )
 from .forms import RegistrationForm, LoginForm, ProfileUpdateForm
-from .ai_utils import get_gemini_response
-from .tiktok_utils import get_tiktok_video_info, analyze_tiktok_video
-from . import scraper_utils
+from .ai_utils import aget_gemini_response, astream_gemini_response
+from .tiktok_utils import aget_tiktok_video_info, normalize_tiktok_url, analysis_is_reusable, video_fields_from_info
+from .job_queue import enqueue, queue_depth, QueueFullError
+from .scraper_limits import read_published_stats
+from .export_utils import EXPORT_FORMATS, GZIP_SUFFIX, iter_gzip
+from .tasks import JOB_TYPE_SCRAPE, JOB_TYPE_SCRAPE_BATCH, JOB_TYPE_TIKTOK_ANALYSIS, JOB_TYPE_TIKTOK_BATCH_FETCH, IN_FLIGHT_STATUSES
+from .scraper_utils import get_model_pricing
+from .scrape_budget import remaining_budget
 
 logger = logging.getLogger(__name__)
 
 # --- Asynchronous helper for TikTok processing ---
 async def _handle_tiktok_submission(video_url, user):
-    # The awaited call is now synchronous to prevent TypeError
-    video_info = get_tiktok_video_info(video_url)
+    video_info = await aget_tiktok_video_info(video_url)
     if video_info.get("error"):
         return {"error": video_info.get("error")}
 
-    video, created = await TikTokVideo.objects.aupdate_or_create(
-        video_id=video_info.get("video_id"),
-        defaults={
-            'user': user,
-            'video_url': video_url,
-            'author': video_info.get("author"),
-            'description': video_info.get("description"),
-            'cover_url': video_info.get("cover_url"),
-            'download_url': video_info.get("download_url"),
-            'play_count': video_info.get("play_count", 0),
-            'duration': video_info.get("duration", 0),
-            'likes': video_info.get("likes", 0),
-            'comments': video_info.get("comments", 0),
-            'shares': video_info.get("shares", 0),
-            'transcript': video_info.get('transcript'),
-            'status': 'PROCESSING',
-            'analysis': None,
-        }
-    )
-    
+    existing = await TikTokVideo.objects.filter(video_id=video_info.get("video_id")).afirst()
+    # Already queued or running: report it instead of resetting the row and queueing a second analysis
+    if existing and existing.status in IN_FLIGHT_STATUSES:
+        return {'status': 'processing', 'video': _tiktok_video_payload(existing)}
+    # Engagement barely moved since the stored analysis: refresh the metadata and return it without a Gemini call.
+    # The update only applies while the row is still COMPLETE, so it cannot undo a concurrent re-analysis; the row
+    # keeps its owner (another user's video is shared, not moved into this caller's history).
+    if existing and analysis_is_reusable(existing, video_info):
+        refreshed = await TikTokVideo.objects.filter(pk=existing.pk, status='COMPLETE').aupdate(
+            **video_fields_from_info(video_info, video_url), updated_at=timezone.now()
+        )
+        if refreshed:
+            existing = await TikTokVideo.objects.aget(pk=existing.pk)
+            logger.info(f"Reusing stored analysis for TikTok video {existing.video_id}.")
+            return {'status': 'complete', 'video': _tiktok_video_payload(existing), 'analysis': existing.analysis}
+
+    video = await _aqueue_tiktok_analysis(video_info, video_url, user)
     response_data = {
         'status': 'processing',
-        'video': {
-            'id': video.pk, 'author': video.author, 'description': video.description,
-            'cover_url': video.cover_url, 'download_url': video.download_url,
-            'plays': video.play_count, 'likes': video.likes, 'comments': video.comments,
-            'shares': video.shares, 'transcript': video.transcript
-        }
+        'video': _tiktok_video_payload(video),
     }
     return response_data
 
+def _queue_tiktok_analysis(video_info, video_url, user):
+    """
+    Reset the video row and enqueue its analysis in one transaction: if the queue is full
+    (QueueFullError), the row keeps its previous status and analysis. A row that a concurrent
+    submission already put in flight is returned as is; an existing row keeps its owner.
+    """
+    with transaction.atomic():
+        current = TikTokVideo.objects.select_for_update().filter(video_id=video_info.get("video_id")).first()
+        if current and current.status in IN_FLIGHT_STATUSES:
+            return current
+        fields = {
+            **video_fields_from_info(video_info, video_url),
+            'status': 'PROCESSING',
+            'analysis': None,
+            'analyzed_stats': None,
+        }
+        video, _ = TikTokVideo.objects.update_or_create(
+            video_id=video_info.get("video_id"), defaults=fields, create_defaults={**fields, 'user': user},
+        )
+        enqueue(JOB_TYPE_TIKTOK_ANALYSIS, {'video_pk': video.pk})
+    return video
+
+_aqueue_tiktok_analysis = sync_to_async(_queue_tiktok_analysis)
+
+def _tiktok_video_payload(video):
+    return {
+        'id': video.pk, 'author': video.author, 'description': video.description,
+        'cover_url': video.cover_url, 'download_url': video.download_url, 'video_url': video.video_url,
+        'plays': video.play_count, 'likes': video.likes, 'comments': video.comments,
+        'shares': video.shares, 'transcript': video.transcript, 'status': video.status,
+    }
+
+def _tiktok_video_summary(video):
+    """Card data for the batch status poll: the payload without the (possibly long) transcript."""
+    payload = _tiktok_video_payload(video)
+    del payload['transcript']
+    return payload
+
+def _create_tiktok_batch(user, creator, video_urls, max_videos):
+    """Create the batch and queue its metadata fetch in one transaction; the fetch job creates the video rows."""
+    with transaction.atomic():
+        batch = TikTokBatch.objects.create(
+            user=user, creator=creator, submitted_count=len(video_urls),
+            submitted_urls=video_urls, max_videos=max_videos if creator else 0,
+        )
+        enqueue(JOB_TYPE_TIKTOK_BATCH_FETCH, {'batch_id': batch.id})
+    return batch
+
 # --- Authentication and General Pages ---
 def homepage(request):
     if request.user.is_authenticated:
@@ -160,13 +208,15 @@ def about_view(request):
 @login_required
 def chat_view(request):
     chat_history = ChatHistory.objects.filter(user=request.user)
-    context = {'chat_history': chat_history}
+    # Under WSGI a StreamingHttpResponse buffers async iterators, so the page falls back to /api/chat/
+    context = {'chat_history': chat_history, 'chat_streaming': isinstance(request, ASGIRequest)}
     return render(request, 'index.html', context)
 
 @login_required
 @require_POST
-def api_chat(request):
+async def api_chat(request):
     try:
+        user = await request.auser()
         user_input = request.POST.get('message', '')
         # Get the state of the search_web checkbox from the request, convert to boolean
         search_web_enabled = request.POST.get('search_web') == 'true'
@@ -180,16 +230,17 @@ def api_chat(request):
             file_names = ", ".join([f.name for f in uploaded_files])
             history_content += f"\n(Attached: {file_names})"
         
-        ChatHistory.objects.create(user=request.user, role='user', content=history_content.strip())
+        user_message = await ChatHistory.objects.acreate(user=user, role='user', content=history_content.strip())
         
-        # Pass the search_web state to the get_gemini_response function
-        response_text = get_gemini_response(
+        # Pass the search_web state to the Gemini call; awaiting it frees the worker while the model responds
+        response_text = await aget_gemini_response(
             user_input=user_input, 
-            user=request.user, 
+            user=user, 
             files=uploaded_files,
-            search_web=search_web_enabled
+            search_web=search_web_enabled,
+            exclude_message_id=user_message.id
         )
-        model_message = ChatHistory.objects.create(user=request.user, role='model', content=response_text)
+        model_message = await ChatHistory.objects.acreate(user=user, role='model', content=response_text)
 
         return JsonResponse({'answer': response_text, 'model_message_id': model_message.id})
     except Exception as e:
@@ -197,11 +248,68 @@ def api_chat(request):
         return JsonResponse({'error': 'An internal error occurred'}, status=500)
 
 
+def _sse_event(data, event=None):
+    """Format one Server-Sent Event frame."""
+    frame = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{frame}" if event else frame
+
+@login_required
+@require_POST
+async def api_chat_stream(request):
+    """Streaming variant of api_chat: forwards Gemini chunks as Server-Sent Events."""
+    try:
+        user = await request.auser()
+        user_input = request.POST.get('message', '')
+        search_web_enabled = request.POST.get('search_web') == 'true'
+        uploaded_files = request.FILES.getlist('files')
+
+        if not user_input and not uploaded_files:
+            return JsonResponse({'error': 'Message or file is required'}, status=400)
+
+        history_content = user_input
+        if uploaded_files:
+            file_names = ", ".join([f.name for f in uploaded_files])
+            history_content += f"\n(Attached: {file_names})"
+
+        user_message = await ChatHistory.objects.acreate(user=user, role='user', content=history_content.strip())
+
+        # History and file uploads are prepared here, while the request is still alive
+        chunks = await astream_gemini_response(
+            user_input=user_input,
+            user=user,
+            files=uploaded_files,
+            search_web=search_web_enabled,
+            exclude_message_id=user_message.id
+        )
+    except Exception as e:
+        logger.error(f"Error in api_chat_stream: {e}")
+        return JsonResponse({'error': 'An internal error occurred'}, status=500)
+
+    async def event_stream():
+        parts = []
+        model_message = None
+        try:
+            async for text in chunks:
+                parts.append(text)
+                yield _sse_event({'delta': text})
+        finally:
+            # Persist the answer once the stream ends, even if the client disconnected mid-way
+            if parts:
+                model_message = await ChatHistory.objects.acreate(user=user, role='model', content=''.join(parts))
+        yield _sse_event({'model_message_id': model_message.id if model_message else None}, event='done')
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 @require_POST
 def api_refresh_chat(request):
     try:
         ChatHistory.objects.filter(user=request.user).delete()
+        ChatSummary.objects.filter(user=request.user).delete()
         return JsonResponse({'status': 'success', 'message': 'Lịch sử trò chuyện đã được làm mới.'})
     except Exception as e:
         logger.error(f"Lỗi khi làm mới lịch sử chat: {e}")
@@ -213,47 +321,26 @@ def tiktok_analyzer_view(request):
     videos = TikTokVideo.objects.filter(user=request.user)
     return render(request, 'tiktok_analyzer.html', {'videos': videos})
     
-def perform_analysis_in_background(video_pk):
-    try:
-        video = TikTokVideo.objects.get(pk=video_pk)
-        
-        analysis_result_json = analyze_tiktok_video(video.video_url, video.user)
-        video.analysis = json.loads(analysis_result_json)
-        
-        video.status = 'COMPLETE'
-        video.save()
-        logger.info(f"Phân tích AI hoàn tất cho video PK: {video_pk}")
-    except TikTokVideo.DoesNotExist:
-        logger.error(f"Video PK: {video_pk} không tồn tại để phân tích.")
-    except Exception as e:
-        logger.error(f"Lỗi khi xử lý video PK {video_pk} trong nền: {e}", exc_info=True)
-        try:
-            video = TikTokVideo.objects.get(pk=video_pk)
-            video.status = 'FAILED'
-            video.save()
-        except TikTokVideo.DoesNotExist:
-            pass
-
 @login_required
 @require_POST
-def api_tiktok_submit_url(request):
+async def api_tiktok_submit_url(request):
     try:
+        user = await request.auser()
         data = json.loads(request.body)
         video_url = data.get('video_url')
         if not video_url:
             return JsonResponse({'error': 'URL video là bắt buộc'}, status=400)
 
-        result = asyncio.run(_handle_tiktok_submission(video_url, request.user))
+        # The metadata fetch is awaited on the shared httpx client instead of blocking the worker thread
+        result = await _handle_tiktok_submission(video_url, user)
 
         if "error" in result:
             return JsonResponse({'error': result['error']}, status=400)
 
-        video_pk = result.get('video', {}).get('id')
-        if video_pk:
-            analysis_thread = threading.Thread(target=perform_analysis_in_background, args=(video_pk,))
-            analysis_thread.start()
-
         return JsonResponse(result)
+    except QueueFullError as e:
+        logger.warning(f"TikTok analysis queue full: {e}")
+        return JsonResponse({'error': 'Hệ thống đang quá tải, vui lòng thử lại sau.'}, status=503)
     except Exception as e:
         logger.error(f"Lỗi trong api_tiktok_submit_url: {e}", exc_info=True)
         return JsonResponse({'error': 'Lỗi nội bộ xảy ra'}, status=500)
@@ -264,7 +351,8 @@ def api_tiktok_check_status(request):
     if not video_pk:
         return JsonResponse({'error': 'Thiếu ID video.'}, status=400)
     try:
-        video = TikTokVideo.objects.get(pk=video_pk, user=request.user)
+        # Not limited to the caller's rows: a resubmitted video is shared with the user who first submitted it
+        video = TikTokVideo.objects.get(pk=video_pk)
         return JsonResponse({
             'status': video.status, 
             'analysis': video.analysis if video.status == 'COMPLETE' else None
@@ -290,6 +378,75 @@ def api_delete_tiktok_history(request):
         logger.error(f"Lỗi khi xóa lịch sử TikTok: {e}")
         return JsonResponse({'error': 'Lỗi nội bộ xảy ra.'}, status=500)
 
+@login_required
+@require_POST
+async def api_tiktok_submit_bulk(request):
+    """
+    Submit many TikTok videos at once: `video_urls` (a list or whitespace-separated text) and/or `creator`,
+    whose latest `max_videos` posts are added. The request only validates and creates the batch: metadata is
+    fetched by a background job, which then queues the analyses in chunks; progress is polled via api_tiktok_batch_status.
+    """
+    try:
+        user = await request.auser()
+        data = json.loads(request.body)
+        raw_urls = data.get('video_urls') or []
+        if isinstance(raw_urls, str):
+            raw_urls = raw_urls.split()
+        if not isinstance(raw_urls, list):
+            return JsonResponse({'error': 'video_urls phải là một danh sách.'}, status=400)
+        creator = str(data.get('creator') or '').strip().lstrip('@')
+        limit = settings.TIKTOK_BULK_MAX_VIDEOS
+
+        # Keep submission order; the same video pasted twice (www./m. host, tracking params) counts once
+        video_urls, seen = [], set()
+        for video_url in (str(url).strip() for url in raw_urls):
+            key = normalize_tiktok_url(video_url) if video_url else None
+            if key and key not in seen:
+                seen.add(key)
+                video_urls.append(video_url)
+        if not video_urls and not creator:
+            return JsonResponse({'error': 'Cần ít nhất một URL video hoặc tên creator.'}, status=400)
+        if len(video_urls) > limit:
+            return JsonResponse({'error': f'Mỗi lần gửi tối đa {limit} video.'}, status=400)
+        validate_url = URLValidator(schemes=['http', 'https'])
+        for video_url in video_urls:
+            try:
+                validate_url(video_url)
+            except ValidationError:
+                return JsonResponse({'error': f'URL không hợp lệ: {video_url}'}, status=400)
+        try:
+            max_videos = min(int(data.get('max_videos') or limit), limit - len(video_urls))
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'max_videos phải là số nguyên.'}, status=400)
+        if creator and max_videos < 1:
+            return JsonResponse({'error': f'Mỗi lần gửi tối đa {limit} video.'}, status=400)
+
+        batch = await sync_to_async(_create_tiktok_batch)(user, creator, video_urls, max_videos)
+        return JsonResponse({'status': 'pending', 'batch_id': batch.id, 'submitted': len(video_urls)})
+    except QueueFullError as e:
+        logger.warning(f"TikTok analysis queue full: {e}")
+        return JsonResponse({'error': 'Hệ thống đang quá tải, vui lòng thử lại sau.'}, status=503)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Dữ liệu JSON không hợp lệ.'}, status=400)
+    except Exception as e:
+        logger.error(f"Lỗi trong api_tiktok_submit_bulk: {e}", exc_info=True)
+        return JsonResponse({'error': 'Lỗi nội bộ xảy ra'}, status=500)
+
+@login_required
+def api_tiktok_batch_status(request, batch_id):
+    """Aggregate progress of a bulk submission: one poll for the whole batch instead of one per video."""
+    batch = get_object_or_404(TikTokBatch, pk=batch_id, user=request.user)
+    videos = [_tiktok_video_summary(video) for video in batch.videos.order_by('id')]
+    existing_videos = [_tiktok_video_summary(video) for video in TikTokVideo.objects.filter(pk__in=batch.existing_video_pks).order_by('id')]
+    counts = Counter(video['status'] for video in videos)
+    return JsonResponse({
+        'id': batch.id, 'status': batch.status, 'creator': batch.creator,
+        'total': len(videos), 'completed': counts['COMPLETE'], 'failed': counts['FAILED'],
+        'pending': counts['PENDING'] + counts['PROCESSING'],
+        'duplicate_count': batch.duplicate_count, 'fetch_failed_count': batch.fetch_failed_count,
+        'fetch_errors': batch.fetch_errors, 'videos': videos, 'existing_videos': existing_videos,
+    })
+
 # --- Location Tracker Views (kept as is) ---
 @login_required
 def location_tracker_dashboard(request):
@@ -357,61 +514,54 @@ def api_delete_tracking_link(request, pk):
         return JsonResponse({'status': 'error', 'message': 'Có lỗi xảy ra trong quá trình xóa.'}, status=500)
 
 # --- Web Scraper Views ---
-def perform_scraping_in_background(task_id):
-    task = None
-    try:
-        task = ScrapeResult.objects.get(pk=task_id)
-        logger.info(f"[TASK {task_id}] Starting background scraping process.")
-        
-        task.status = 'PROCESSING'
-        task.save()
-        
-        raw_html = scraper_utils.fetch_html_selenium(task.url)
-        if not raw_html: raise ValueError("Could not fetch HTML content.")
-        
-        markdown_content = scraper_utils.html_to_markdown(raw_html)
-        fields = [field.strip() for field in task.fields.split(',')]
-        DynamicListingModel = scraper_utils.create_dynamic_listing_model(fields)
-        DynamicListingsContainer = scraper_utils.create_listings_container_model(DynamicListingModel)
-        
-        formatted_data_str, tokens_count = scraper_utils.gemini_format_data(markdown_content, DynamicListingsContainer, task.model)
-        try:
-            formatted_data_json = json.loads(formatted_data_str)
-            if 'error' in formatted_data_json: raise ValueError(f"Error from Gemini: {formatted_data_json.get('details', formatted_data_str)}")
-        except json.JSONDecodeError: raise ValueError("Response from Gemini was not valid JSON.")
-        
-        task.input_tokens, task.output_tokens, task.total_cost = scraper_utils.calculate_price(tokens_count, model=task.model)
-        task.status, task.completed_at = 'COMPLETE', timezone.now()
-        
-        task.json_result.save(f"scrape_result_{task.id}.json", ContentFile(formatted_data_str.encode('utf-8')))
-        df = pd.DataFrame(formatted_data_json[next(iter(formatted_data_json))])
-        task.csv_result.save(f"scrape_result_{task.id}.csv", ContentFile(df.to_csv(index=False).encode('utf-8')))
-        task.save()
-        logger.info(f"[TASK {task_id}] Scraping task {task_id} completed successfully.")
-    except Exception as e:
-        logger.error(f"[TASK {task_id}] A critical error occurred: {e}", exc_info=True)
-        if task:
-            task.status = 'FAILED'
-            task.error_message = str(e)
-            task.save()
-            logger.info(f"[TASK {task_id}] Task status updated to FAILED.")
-
 @login_required
 def web_scraper_view(request):
     return render(request, 'web_scraper.html')
 
+def _scrape_preflight_error(user, model):
+    """Reject unknown models and users with no budget left before a task row is created."""
+    try:
+        get_model_pricing(model)
+    except ValueError:
+        return JsonResponse({'error': f'Unsupported model: {model}.'}, status=400)
+    remaining = remaining_budget(user)
+    if remaining is not None and remaining <= 0:
+        return JsonResponse({'error': 'Your monthly scraping budget has been used up.'}, status=402)
+    return None
+
 @login_required
 @require_POST
 def api_start_scraping(request):
     try:
         data = json.loads(request.body)
         url, fields, model = data.get('url'), data.get('fields'), data.get('model')
+        fetch_mode = data.get('fetch_mode') or 'auto'
         if not all([url, fields, model]):
             return JsonResponse({'error': 'Missing required data.'}, status=400)
+        if fetch_mode not in dict(ScrapeResult.FETCH_MODE_CHOICES):
+            return JsonResponse({'error': 'Invalid fetch mode.'}, status=400)
+        follow_pagination = bool(data.get('follow_pagination'))
+        try:
+            max_pages = int(data['max_pages']) if data.get('max_pages') else None
+            time_budget = int(data['time_budget']) if data.get('time_budget') else None
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'max_pages and time_budget must be integers.'}, status=400)
+        if max_pages is not None and not 1 <= max_pages <= settings.SCRAPER_PAGINATION_PAGE_LIMIT:
+            return JsonResponse({'error': f'max_pages must be between 1 and {settings.SCRAPER_PAGINATION_PAGE_LIMIT}.'}, status=400)
+        preflight_error = _scrape_preflight_error(request.user, model)
+        if preflight_error:
+            return preflight_error
         
-        task = ScrapeResult.objects.create(user=request.user, url=url, fields=fields, model=model, status='PENDING')
-        threading.Thread(target=perform_scraping_in_background, args=(task.id,)).start()
+        # Roll back the task row if the queue rejects the job
+        with transaction.atomic():
+            task = ScrapeResult.objects.create(
+                user=request.user, url=url, fields=fields, model=model, fetch_mode=fetch_mode, status='PENDING',
+                follow_pagination=follow_pagination, max_pages=max_pages, pagination_time_budget=time_budget,
+            )
+            enqueue(JOB_TYPE_SCRAPE, {'task_id': task.id})
         return JsonResponse({'status': 'ok', 'task_id': task.id})
+    except QueueFullError:
+        return JsonResponse({'error': 'Scraping queue is full, please try again later.'}, status=503)
     except Exception as e:
         logger.error(f"Error starting scraping: {e}")
         return JsonResponse({'error': 'Internal server error.'}, status=500)
@@ -424,48 +574,171 @@ def api_check_scrape_status(request, task_id):
             'id': task.id, 'status': task.status, 'url': task.url, 'created_at': task.created_at.strftime("%H:%M, %d/%m/%Y"),
             'json_url': task.json_result.url if task.status == 'COMPLETE' and task.json_result else None,
             'csv_url': task.csv_result.url if task.status == 'COMPLETE' and task.csv_result else None,
+            'ndjson_url': task.ndjson_result.url if task.status == 'COMPLETE' and task.ndjson_result else None,
+            'parquet_url': task.parquet_result.url if task.status == 'COMPLETE' and task.parquet_result else None,
             'cost': f"{task.total_cost:.6f}" if task.total_cost is not None else "N/A",
+            'estimated_cost': f"{task.estimated_cost:.6f}" if task.estimated_cost is not None else None,
+            'input_trimmed': task.input_trimmed, 'failed_chunks': task.failed_chunks,
             'input_tokens': task.input_tokens, 'output_tokens': task.output_tokens,
+            'fetch_mode': task.fetch_mode, 'fetch_wait_seconds': task.fetch_wait_seconds,
+            'cache_hit': task.cache_hit, 'follow_pagination': task.follow_pagination, 'pages_scraped': task.pages_scraped,
             'error_message': task.error_message if task.status == 'FAILED' else None,
         }
         return JsonResponse(data)
     except ScrapeResult.DoesNotExist:
         return JsonResponse({'error': 'Task not found.'}, status=404)
 
+@staff_member_required
+def api_scraper_metrics(request):
+    """Per-domain rate-limit wait metrics published by the job workers, plus scrape queue depth."""
+    # Workers publish every JOB_QUEUE_RECOVERY_INTERVAL; older snapshots belong to stopped workers
+    workers = read_published_stats(max_age_seconds=settings.JOB_QUEUE_RECOVERY_INTERVAL * 3)
+    return JsonResponse({
+        'workers': workers,
+        'queue_depth': {job_type: queue_depth(job_type) for job_type in (JOB_TYPE_SCRAPE, JOB_TYPE_SCRAPE_BATCH)},
+    })
+
 @login_required
 def api_get_scrape_history(request):
-    history = ScrapeResult.objects.filter(user=request.user)
-    data = [{'id': item.id, 'created_at': item.created_at.strftime("%H:%M:%S, %d/%m/%Y"), 'url': item.url, 'status': item.status} for item in history]
+    history = ScrapeResult.objects.filter(user=request.user, batch__isnull=True)
+    data = [{'id': item.id, 'created_at': item.created_at.strftime("%H:%M:%S, %d/%m/%Y"), 'url': item.url, 'status': item.status, 'cache_hit': item.cache_hit, 'has_ndjson': bool(item.ndjson_result), 'has_parquet': bool(item.parquet_result)} for item in history]
     return JsonResponse({'history': data})
 
 @login_required
 @require_POST
 def api_delete_scrape_history(request):
     try:
+        ScrapeBatch.objects.filter(user=request.user).delete()
         ScrapeResult.objects.filter(user=request.user).delete()
         return JsonResponse({'status': 'success', 'message': 'History deleted successfully.'})
     except Exception as e:
         logger.error(f"Error deleting scraper history: {e}")
         return JsonResponse({'status': 'error', 'message': 'An error occurred.'}, status=500)
 
-@login_required
-def download_scrape_result(request, task_id, file_type):
-    task = get_object_or_404(ScrapeResult, pk=task_id, user=request.user)
+def _scrape_file_response(task, file_type):
+    """
+    Serve the JSON/CSV/NDJSON/Parquet artifact of a completed ScrapeResult or ScrapeBatch.
+    A '.gz' suffix (e.g. 'csv.gz') streams a gzip-compressed copy built on the fly.
+    """
     if task.status != 'COMPLETE':
         raise Http404("Result not ready or task failed.")
     
-    file_field = None
-    content_type = ''
-    if file_type == 'json' and task.json_result:
-        file_field = task.json_result
-        content_type = 'application/json'
-    elif file_type == 'csv' and task.csv_result:
-        file_field = task.csv_result
-        content_type = 'text/csv'
-
+    base_type = file_type[:-len(GZIP_SUFFIX)] if file_type.endswith(GZIP_SUFFIX) else file_type
+    field_name, content_type = EXPORT_FORMATS.get(base_type, (None, None))
+    file_field = getattr(task, field_name) if field_name else None
     if not file_field:
         raise Http404("Invalid file type or file does not exist.")
-        
-    response = FileResponse(file_field.open('rb'), content_type=content_type)
-    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_field.name)}"'
-    return response
\ No newline at end of file
+    
+    filename = os.path.basename(file_field.name)
+    if base_type != file_type:
+        response = StreamingHttpResponse(iter_gzip(file_field.open('rb')), content_type='application/gzip')
+        filename += GZIP_SUFFIX
+    else:
+        response = FileResponse(file_field.open('rb'), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+def download_scrape_result(request, task_id, file_type):
+    task = get_object_or_404(ScrapeResult, pk=task_id, user=request.user)
+    return _scrape_file_response(task, file_type)
+
+# --- Batch scraping ---
+def _expand_batch_urls(data):
+    """
+    Build the URL list of a batch from either `urls` (a list) or `url_pattern` containing `{page}`
+    plus an inclusive `page_start`..`page_end` range. Raises ValueError on invalid input.
+    """
+    urls, pattern = data.get('urls'), data.get('url_pattern')
+    if pattern:
+        if '{page}' not in pattern:
+            raise ValueError("url_pattern must contain {page}.")
+        try:
+            page_start, page_end = int(data.get('page_start', 1)), int(data['page_end'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("page_start/page_end must be integers.")
+        if page_end < page_start:
+            raise ValueError("page_end must not be smaller than page_start.")
+        if page_end - page_start + 1 > settings.SCRAPER_BATCH_MAX_URLS:
+            raise ValueError(f"A batch can contain at most {settings.SCRAPER_BATCH_MAX_URLS} URLs.")
+        urls = [pattern.replace('{page}', str(page)) for page in range(page_start, page_end + 1)]
+    elif not isinstance(urls, list):
+        raise ValueError("Provide either a list of urls or a url_pattern.")
+
+    # Keep submission order, drop blanks and duplicates
+    urls = list(dict.fromkeys(str(url).strip() for url in urls if str(url).strip()))
+    if not urls:
+        raise ValueError("No URLs provided.")
+    if len(urls) > settings.SCRAPER_BATCH_MAX_URLS:
+        raise ValueError(f"A batch can contain at most {settings.SCRAPER_BATCH_MAX_URLS} URLs.")
+    validate_url = URLValidator(schemes=['http', 'https'])
+    for url in urls:
+        try:
+            validate_url(url)
+        except ValidationError:
+            raise ValueError(f"Invalid URL: {url}")
+    return urls
+
+@login_required
+@require_POST
+def api_start_batch_scraping(request):
+    try:
+        data = json.loads(request.body)
+        fields, model = data.get('fields'), data.get('model')
+        fetch_mode = data.get('fetch_mode') or 'auto'
+        if not all([fields, model]):
+            return JsonResponse({'error': 'Missing required data.'}, status=400)
+        if fetch_mode not in dict(ScrapeResult.FETCH_MODE_CHOICES):
+            return JsonResponse({'error': 'Invalid fetch mode.'}, status=400)
+        try:
+            urls = _expand_batch_urls(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        preflight_error = _scrape_preflight_error(request.user, model)
+        if preflight_error:
+            return preflight_error
+
+        # One queue entry for the whole batch; the batch job fans the URLs out itself
+        with transaction.atomic():
+            batch = ScrapeBatch.objects.create(
+                user=request.user, fields=fields, model=model, fetch_mode=fetch_mode, total_urls=len(urls), status='PENDING'
+            )
+            ScrapeResult.objects.bulk_create([
+                ScrapeResult(user=request.user, batch=batch, url=url, fields=fields, model=model, fetch_mode=fetch_mode, status='PENDING')
+                for url in urls
+            ])
+            enqueue(JOB_TYPE_SCRAPE_BATCH, {'batch_id': batch.id})
+        return JsonResponse({'status': 'ok', 'batch_id': batch.id, 'total_urls': len(urls)})
+    except QueueFullError:
+        return JsonResponse({'error': 'Scraping queue is full, please try again later.'}, status=503)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON.'}, status=400)
+    except Exception as e:
+        logger.error(f"Error starting batch scraping: {e}")
+        return JsonResponse({'error': 'Internal server error.'}, status=500)
+
+@login_required
+def api_check_batch_status(request, batch_id):
+    batch = get_object_or_404(ScrapeBatch, pk=batch_id, user=request.user)
+    done = batch.completed_count + batch.failed_count
+    data = {
+        'id': batch.id, 'status': batch.status, 'created_at': batch.created_at.strftime("%H:%M, %d/%m/%Y"),
+        'total_urls': batch.total_urls, 'completed': batch.completed_count, 'failed': batch.failed_count,
+        'pending': max(0, batch.total_urls - done),
+        'progress': round(100 * done / batch.total_urls, 1) if batch.total_urls else 0,
+        'json_url': batch.json_result.url if batch.status == 'COMPLETE' and batch.json_result else None,
+        'csv_url': batch.csv_result.url if batch.status == 'COMPLETE' and batch.csv_result else None,
+        'ndjson_url': batch.ndjson_result.url if batch.status == 'COMPLETE' and batch.ndjson_result else None,
+        'parquet_url': batch.parquet_result.url if batch.status == 'COMPLETE' and batch.parquet_result else None,
+        'cost': f"{batch.total_cost:.6f}" if batch.total_cost is not None else "N/A",
+        'input_tokens': batch.input_tokens, 'output_tokens': batch.output_tokens,
+        'error_message': batch.error_message if batch.status == 'FAILED' else None,
+    }
+    if request.GET.get('include_tasks') == '1':
+        data['tasks'] = list(batch.tasks.order_by('id').values('id', 'url', 'status', 'error_message', 'cache_hit'))
+    return JsonResponse(data)
+
+@login_required
+def download_batch_result(request, batch_id, file_type):
+    batch = get_object_or_404(ScrapeBatch, pk=batch_id, user=request.user)
+    return _scrape_file_response(batch, file_type)
\ No newline at end of file
@@ -0,0 +1,9 @@
+# rita_suite/asgi.py
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rita_suite.settings')
+
+application = get_asgi_application()
@@ -18,6 +18,37 @@ SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'django-insecure-z*7!u%_q@#d&l-m*!x^
 # Get Gemini API Key from environment variables
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
+# Maximum number of Gemini GenerativeModel clients kept in the shared LRU pool
+GEMINI_MODEL_POOL_SIZE = int(os.getenv('GEMINI_MODEL_POOL_SIZE', '32'))
+
+# TikTok metadata (tikwm) is cached per normalized URL and video id for this many seconds (0 = disabled)
+TIKTOK_METADATA_CACHE_TTL = int(os.getenv('TIKTOK_METADATA_CACHE_TTL', '300'))
+# Bulk TikTok submission: video cap per submission, concurrent metadata fetches, and videos per analysis job
+TIKTOK_BULK_MAX_VIDEOS = int(os.getenv('TIKTOK_BULK_MAX_VIDEOS', '300'))
+TIKTOK_BULK_FETCH_CONCURRENCY = int(os.getenv('TIKTOK_BULK_FETCH_CONCURRENCY', '8'))
+TIKTOK_ANALYSIS_BATCH_SIZE = int(os.getenv('TIKTOK_ANALYSIS_BATCH_SIZE', '10'))
+# Videos packed into one structured-output Gemini request by the batch analysis job (1 = one request per video)
+TIKTOK_ANALYSIS_VIDEOS_PER_PROMPT = int(os.getenv('TIKTOK_ANALYSIS_VIDEOS_PER_PROMPT', '5'))
+# Reuse a stored TikTok analysis on resubmit while no engagement stat moved more than this fraction since it was made
+TIKTOK_ANALYSIS_REUSE_ENABLED = os.getenv('TIKTOK_ANALYSIS_REUSE_ENABLED', 'True') == 'True'
+TIKTOK_ANALYSIS_REUSE_THRESHOLD = float(os.getenv('TIKTOK_ANALYSIS_REUSE_THRESHOLD', '0.2'))
+# Shared async HTTP client (core/http_client.py): timeouts in seconds, pool size, and retries with jittered backoff
+HTTP_CLIENT_TIMEOUT = float(os.getenv('HTTP_CLIENT_TIMEOUT', '15'))
+HTTP_CLIENT_CONNECT_TIMEOUT = float(os.getenv('HTTP_CLIENT_CONNECT_TIMEOUT', '5'))
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv('HTTP_CLIENT_MAX_CONNECTIONS', '20'))
+HTTP_CLIENT_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_CLIENT_KEEPALIVE_EXPIRY', '30'))
+HTTP_CLIENT_RETRIES = int(os.getenv('HTTP_CLIENT_RETRIES', '2'))
+HTTP_CLIENT_BACKOFF_SECONDS = float(os.getenv('HTTP_CLIENT_BACKOFF_SECONDS', '0.5'))
+HTTP_CLIENT_MAX_BACKOFF = float(os.getenv('HTTP_CLIENT_MAX_BACKOFF', '10'))
+
+# Chat history window sent to Gemini: last N turns (user + model) capped at M estimated tokens (0 = no cap)
+CHAT_HISTORY_MAX_TURNS = int(os.getenv('CHAT_HISTORY_MAX_TURNS', '10'))
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv('CHAT_HISTORY_MAX_TOKENS', '8000'))
+# Rolling summary of turns that fall out of the window, stored in ChatSummary and refreshed by the 'chat_summary' job
+CHAT_HISTORY_SUMMARY_ENABLED = os.getenv('CHAT_HISTORY_SUMMARY_ENABLED', 'True') == 'True'
+CHAT_HISTORY_SUMMARY_BATCH = int(os.getenv('CHAT_HISTORY_SUMMARY_BATCH', '40'))
+CHAT_SUMMARY_MODEL = os.getenv('CHAT_SUMMARY_MODEL', 'gemini-2.5-flash')
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -67,6 +98,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'rita_suite.wsgi.application'
+# ASGI entry point: serve with e.g. `uvicorn rita_suite.asgi:application` so async views
+# (chat) can keep many Gemini calls in flight per process. Streaming chat (/api/chat/stream/)
+# requires ASGI; under WSGI the chat page falls back to the non-streaming /api/chat/ endpoint
+ASGI_APPLICATION = 'rita_suite.asgi.application'
 
 
 # Database
@@ -76,10 +111,102 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Background workers write concurrently with the web process; wait for locks instead of failing
+        'OPTIONS': {'timeout': 20},
+        # File-backed test database: the shared in-memory one fails with "table is locked" instead of waiting,
+        # so tests of concurrent workers would not see the locking production relies on
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Background job queue (run workers with `python manage.py run_jobs`)
+JOB_QUEUE_CONCURRENCY = {
+    'scrape': int(os.getenv('JOB_QUEUE_SCRAPE_CONCURRENCY', '2')),
+    'tiktok_analysis': int(os.getenv('JOB_QUEUE_TIKTOK_CONCURRENCY', '4')),
+    'scrape_batch': int(os.getenv('JOB_QUEUE_SCRAPE_BATCH_CONCURRENCY', '1')),
+    'tiktok_analysis_batch': int(os.getenv('JOB_QUEUE_TIKTOK_BATCH_CONCURRENCY', '2')),
+    'tiktok_batch_fetch': int(os.getenv('JOB_QUEUE_TIKTOK_FETCH_CONCURRENCY', '1')),
+    'chat_summary': int(os.getenv('JOB_QUEUE_CHAT_SUMMARY_CONCURRENCY', '1')),
+}
+JOB_QUEUE_MAX_ATTEMPTS = int(os.getenv('JOB_QUEUE_MAX_ATTEMPTS', '3'))
+JOB_QUEUE_RETRY_BACKOFF_SECONDS = int(os.getenv('JOB_QUEUE_RETRY_BACKOFF_SECONDS', '30'))
+# A job whose lease expires is assumed to be orphaned by a crashed worker and is re-queued
+JOB_QUEUE_LEASE_SECONDS = int(os.getenv('JOB_QUEUE_LEASE_SECONDS', '900'))
+# Maximum PENDING jobs per type before new submissions are rejected (0 = unlimited)
+JOB_QUEUE_MAX_PENDING = int(os.getenv('JOB_QUEUE_MAX_PENDING', '200'))
+JOB_QUEUE_POLL_INTERVAL = float(os.getenv('JOB_QUEUE_POLL_INTERVAL', '2'))
+JOB_QUEUE_RECOVERY_INTERVAL = int(os.getenv('JOB_QUEUE_RECOVERY_INTERVAL', '60'))
+
+# Web scraper: explicit chromedriver binary; when empty it is resolved once per process via webdriver-manager
+CHROMEDRIVER_PATH = os.getenv('CHROMEDRIVER_PATH', '')
+# Web scraper: pool of long-lived headless Chrome drivers shared by concurrent scrapes
+SCRAPER_BROWSER_POOL_SIZE = int(os.getenv('SCRAPER_BROWSER_POOL_SIZE', '2'))
+# Recycle a driver after this many pages to bound memory growth
+SCRAPER_BROWSER_MAX_PAGES = int(os.getenv('SCRAPER_BROWSER_MAX_PAGES', '50'))
+SCRAPER_BROWSER_CHECKOUT_TIMEOUT = int(os.getenv('SCRAPER_BROWSER_CHECKOUT_TIMEOUT', '120'))
+# Plain HTTP fetch mode; 'auto' falls back to the browser when the cleaned content is shorter than this
+SCRAPER_HTTP_TIMEOUT = int(os.getenv('SCRAPER_HTTP_TIMEOUT', '15'))
+SCRAPER_AUTO_MIN_CONTENT_CHARS = int(os.getenv('SCRAPER_AUTO_MIN_CONTENT_CHARS', '500'))
+# Browser page readiness: overall deadline, DOM/network quiet period and max infinite-scroll steps
+SCRAPER_READY_DEADLINE = float(os.getenv('SCRAPER_READY_DEADLINE', '20'))
+SCRAPER_READY_QUIET_SECONDS = float(os.getenv('SCRAPER_READY_QUIET_SECONDS', '0.5'))
+SCRAPER_MAX_SCROLLS = int(os.getenv('SCRAPER_MAX_SCROLLS', '10'))
+# Per-host overrides of the above, e.g. {'shop.example.com': {'deadline': 40, 'max_scrolls': 30}}
+SCRAPER_READINESS_OVERRIDES = {}
+# On-disk cache of raw HTML (+ converted markdown) revalidated with ETag / Last-Modified on HTTP fetches
+SCRAPER_PAGE_CACHE_ENABLED = os.getenv('SCRAPER_PAGE_CACHE_ENABLED', 'True') == 'True'
+SCRAPER_PAGE_CACHE_DIR = os.getenv('SCRAPER_PAGE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'pages'))
+# Entries unused (no 304 revalidation) for TTL seconds are removed; least recently used go first above MAX_BYTES
+SCRAPER_PAGE_CACHE_TTL = int(os.getenv('SCRAPER_PAGE_CACHE_TTL', str(7 * 24 * 3600)))
+SCRAPER_PAGE_CACHE_MAX_BYTES = int(os.getenv('SCRAPER_PAGE_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))
+# HTML cleaning before markdown conversion: 'readability' or 'lxml' (strip page chrome, keep repeated listing items;
+# falls back to readability when its output is nearly empty)
+SCRAPER_HTML_PIPELINE = os.getenv('SCRAPER_HTML_PIPELINE', 'readability')
+# Long pages are split into chunks extracted concurrently, then merged and de-duplicated
+SCRAPER_CHUNK_MAX_CHARS = int(os.getenv('SCRAPER_CHUNK_MAX_CHARS', '30000'))
+SCRAPER_CHUNK_OVERLAP_CHARS = int(os.getenv('SCRAPER_CHUNK_OVERLAP_CHARS', '1000'))
+SCRAPER_CHUNK_CONCURRENCY = int(os.getenv('SCRAPER_CHUNK_CONCURRENCY', '4'))
+# Content-addressed cache of Gemini extractions (markdown + sorted fields + model)
+SCRAPER_EXTRACTION_CACHE_ENABLED = os.getenv('SCRAPER_EXTRACTION_CACHE_ENABLED', 'True') == 'True'
+SCRAPER_EXTRACTION_CACHE_TTL = int(os.getenv('SCRAPER_EXTRACTION_CACHE_TTL', str(7 * 24 * 3600)))
+SCRAPER_EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv('SCRAPER_EXTRACTION_CACHE_MAX_ENTRIES', '2000'))
+SCRAPER_EXTRACTION_CACHE_MAX_BYTES = int(os.getenv('SCRAPER_EXTRACTION_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+# Concurrent fetches per domain across all scrapes in a worker process (override per host in the dict)
+SCRAPER_PER_DOMAIN_CONCURRENCY = int(os.getenv('SCRAPER_PER_DOMAIN_CONCURRENCY', '2'))
+SCRAPER_PER_DOMAIN_CONCURRENCY_OVERRIDES = {}
+# Per-domain token bucket shared by every fetch in a worker process: `rate` requests/second after a burst of `burst`
+SCRAPER_RATE_LIMIT_ENABLED = os.getenv('SCRAPER_RATE_LIMIT_ENABLED', 'True') == 'True'
+SCRAPER_RATE_LIMIT_PER_SECOND = float(os.getenv('SCRAPER_RATE_LIMIT_PER_SECOND', '1'))
+SCRAPER_RATE_LIMIT_BURST = int(os.getenv('SCRAPER_RATE_LIMIT_BURST', '3'))
+# Per-host overrides, e.g. {'shop.example.com': {'rate': 0.2, 'burst': 1}}
+SCRAPER_RATE_LIMIT_OVERRIDES = {}
+# Honour robots.txt Crawl-delay / Request-rate (fetched once per host and cached)
+SCRAPER_RESPECT_CRAWL_DELAY = os.getenv('SCRAPER_RESPECT_CRAWL_DELAY', 'True') == 'True'
+SCRAPER_ROBOTS_CACHE_TTL = int(os.getenv('SCRAPER_ROBOTS_CACHE_TTL', '3600'))
+SCRAPER_ROBOTS_TIMEOUT = int(os.getenv('SCRAPER_ROBOTS_TIMEOUT', '5'))
+# Workers publish rate-limit wait metrics here every JOB_QUEUE_RECOVERY_INTERVAL (served by api/web-scraper/metrics/)
+SCRAPER_METRICS_DIR = os.getenv('SCRAPER_METRICS_DIR', os.path.join(BASE_DIR, 'cache', 'metrics'))
+# Batch scraping: URL cap per batch and the size of the fetch / extract stage pools of one batch job
+SCRAPER_BATCH_MAX_URLS = int(os.getenv('SCRAPER_BATCH_MAX_URLS', '500'))
+SCRAPER_BATCH_FETCH_CONCURRENCY = int(os.getenv('SCRAPER_BATCH_FETCH_CONCURRENCY', '8'))
+SCRAPER_BATCH_EXTRACT_CONCURRENCY = int(os.getenv('SCRAPER_BATCH_EXTRACT_CONCURRENCY', '4'))
+# Pagination following: default page cap and wall-clock budget (seconds), plus the hard cap accepted from the API
+SCRAPER_PAGINATION_MAX_PAGES = int(os.getenv('SCRAPER_PAGINATION_MAX_PAGES', '10'))
+SCRAPER_PAGINATION_TIME_BUDGET = int(os.getenv('SCRAPER_PAGINATION_TIME_BUDGET', '300'))
+SCRAPER_PAGINATION_PAGE_LIMIT = int(os.getenv('SCRAPER_PAGINATION_PAGE_LIMIT', '100'))
+# Gemini pricing in USD per 1M tokens, merged over scraper_utils.PRICING, e.g. {'gemini-2.0-pro': {'input': 1.25, 'output': 10.0}}
+SCRAPER_MODEL_PRICING = {}
+# Pre-flight token counting: 'local' (chars / 4) or 'api' (Gemini count_tokens, falls back to local on error)
+SCRAPER_TOKEN_COUNT_MODE = os.getenv('SCRAPER_TOKEN_COUNT_MODE', 'local')
+# Estimated output tokens as a fraction of input tokens, used for the pre-flight cost estimate
+SCRAPER_ESTIMATED_OUTPUT_RATIO = float(os.getenv('SCRAPER_ESTIMATED_OUTPUT_RATIO', '0.25'))
+# Page content sent to Gemini per page is trimmed to this many tokens (0 = no limit)
+SCRAPER_MAX_INPUT_TOKENS_PER_TASK = int(os.getenv('SCRAPER_MAX_INPUT_TOKENS_PER_TASK', '200000'))
+# Monthly scraper spend cap per user in USD when Profile.scrape_monthly_cost_cap is empty (unset or 0 = unlimited)
+SCRAPER_DEFAULT_MONTHLY_COST_CAP = float(os.getenv('SCRAPER_DEFAULT_MONTHLY_COST_CAP', '0')) or None
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -10,6 +10,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const fileInfoContainer = document.getElementById('file-info-container');
 
     let attachedFiles = [];
+    // Streaming needs an ASGI server; the template sets data-streaming="false" under WSGI
+    const streamingEnabled = !chatForm || chatForm.dataset.streaming !== 'false';
 
     // --- Helpers ---
     function getCookie(name) {
@@ -122,20 +124,84 @@ document.addEventListener('DOMContentLoaded', () => {
         const thinkingIndicator = addMessageToUI({ role: 'assistant', content: 'Rita is thinking...', isThinking: true });
 
         try {
-            const response = await fetch('/api/chat/', {
+            if (!streamingEnabled) {
+                // Server is not running under ASGI: use the buffered JSON endpoint
+                const response = await fetch('/api/chat/', {
+                    method: 'POST',
+                    body: formData
+                });
+
+                const data = await response.json();
+
+                if (thinkingIndicator) thinkingIndicator.remove();
+
+                if (!response.ok || data.error) {
+                    throw new Error(data.error || 'An unknown server error occurred.');
+                }
+
+                addMessageToUI({role: 'assistant', content: data.answer || "Sorry, I couldn't get a response."});
+                return;
+            }
+
+            const response = await fetch('/api/chat/stream/', {
                 method: 'POST',
                 body: formData
             });
 
-            const data = await response.json();
-            
-            if (thinkingIndicator) thinkingIndicator.remove();
+            if (!response.ok || !response.body) {
+                let errorMessage = 'An unknown server error occurred.';
+                try {
+                    const data = await response.json();
+                    errorMessage = data.error || errorMessage;
+                } catch (e) { /* Non-JSON error body */ }
+                throw new Error(errorMessage);
+            }
 
-            if (!response.ok || data.error) {
-                throw new Error(data.error || 'An unknown server error occurred.');
+            // Read Server-Sent Events and render the answer as chunks arrive
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let answer = '';
+            let answerContent = null;
+
+            const handleEvent = (rawEvent) => {
+                let eventName = 'message';
+                let dataText = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+                });
+                if (!dataText || eventName !== 'message') return;
+
+                const data = JSON.parse(dataText);
+                if (!data.delta) return;
+                answer += data.delta;
+                if (!answerContent) {
+                    if (thinkingIndicator) thinkingIndicator.remove();
+                    const messageEl = addMessageToUI({ role: 'assistant', content: '' });
+                    answerContent = messageEl ? messageEl.querySelector('.message-content p') : null;
+                }
+                if (answerContent) {
+                    answerContent.innerHTML = answer.replace(/\n/g, '<br>');
+                    scrollToBottom();
+                }
+            };
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    handleEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                }
+            }
+
+            if (thinkingIndicator) thinkingIndicator.remove();
+            if (!answer) {
+                addMessageToUI({role: 'assistant', content: "Sorry, I couldn't get a response."});
             }
-            
-            addMessageToUI({role: 'assistant', content: data.answer || "Sorry, I couldn't get a response."});
 
         } catch (error) {
             console.error('Error sending message:', error);
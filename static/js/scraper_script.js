@@ -5,6 +5,8 @@ document.addEventListener('DOMContentLoaded', function () {
     const scrapeForm = document.getElementById('scrape-form');
     const urlInput = document.getElementById('url-input');
     const modelSelection = document.getElementById('model-selection');
+    const fetchModeSelection = document.getElementById('fetch-mode-selection');
+    const maxPagesInput = document.getElementById('max-pages-input');
     const startScrapeBtn = document.getElementById('start-scrape-btn');
     
     const resultsPlaceholder = document.getElementById('results-placeholder');
@@ -97,6 +99,9 @@ document.addEventListener('DOMContentLoaded', function () {
             
             const url = urlInput.value.trim();
             const model = modelSelection.value;
+            const fetch_mode = fetchModeSelection ? fetchModeSelection.value : 'auto';
+            const max_pages = maxPagesInput ? parseInt(maxPagesInput.value, 10) || 1 : 1;
+            const follow_pagination = max_pages > 1;
             const fields = tags.join(',');
 
             if (!url || !fields) {
@@ -119,7 +124,7 @@ document.addEventListener('DOMContentLoaded', function () {
                         'Content-Type': 'application/json',
                         'X-CSRFToken': getCookie('csrftoken')
                     },
-                    body: JSON.stringify({ url, fields, model })
+                    body: JSON.stringify({ url, fields, model, fetch_mode, follow_pagination, max_pages: follow_pagination ? max_pages : null })
                 });
                 
                 const data = await response.json();
@@ -170,7 +175,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
         inputTokensEl.textContent = taskData.input_tokens || 0;
         outputTokensEl.textContent = taskData.output_tokens || 0;
-        totalCostEl.textContent = `$${parseFloat(taskData.cost || 0).toFixed(4)}`;
+        totalCostEl.textContent = `$${parseFloat(taskData.cost || 0).toFixed(4)}` + (taskData.cache_hit ? ' (cache)' : '');
 
         downloadJsonBtn.onclick = () => window.location.href = `/download/scrape/${taskData.id}/json/`;
         downloadCsvBtn.onclick = () => window.location.href = `/download/scrape/${taskData.id}/csv/`;
@@ -242,6 +247,8 @@ document.addEventListener('DOMContentLoaded', function () {
                             ${isComplete ? `
                                 <a href="/download/scrape/${item.id}/json/" class="btn-secondary" style="font-size: 0.8rem; padding: 4px 8px;">JSON</a>
                                 <a href="/download/scrape/${item.id}/csv/" class="btn-secondary" style="font-size: 0.8rem; padding: 4px 8px;">CSV</a>
+                                ${item.has_ndjson ? `<a href="/download/scrape/${item.id}/ndjson.gz/" class="btn-secondary" style="font-size: 0.8rem; padding: 4px 8px;">NDJSON.gz</a>` : ''}
+                                ${item.has_parquet ? `<a href="/download/scrape/${item.id}/parquet/" class="btn-secondary" style="font-size: 0.8rem; padding: 4px 8px;">Parquet</a>` : ''}
                             ` : 'N/A'}
                         </td>
                     `;
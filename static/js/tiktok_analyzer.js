@@ -117,6 +117,7 @@ document.addEventListener('DOMContentLoaded', function () {
             `;
             historyList.prepend(card);
             card.addEventListener('click', handleCardClick);
+            return card;
         }
 
         async function handleAnalysis(event) {
@@ -144,7 +145,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
                 loadingIndicator.style.display = 'none';
 
-                if (response.ok && data.status === 'processing') {
+                if (response.ok && (data.status === 'processing' || data.status === 'complete')) {
                     const video = data.video;
                     
                     videoCover.src = video.cover_url || 'https://placehold.co/600x400/1e1e2f/e0e0e0?text=No+Cover';
@@ -165,7 +166,12 @@ document.addEventListener('DOMContentLoaded', function () {
                     analysisOutput.innerHTML = '<div class="spinner" style="width: 20px; height: 20px; border-width: 3px;"></div><p style="margin-top: 1rem;">Đang phân tích AI, vui lòng chờ...</p>';
                     resultsWrapper.style.display = 'block';
 
-                    pollForAnalysis(video.id);
+                    // Phân tích đã có sẵn (chỉ số gần như không đổi) thì hiển thị ngay, không cần polling
+                    if (data.status === 'complete') {
+                        displayAnalysis(data.analysis);
+                    } else {
+                        pollForAnalysis(video.id);
+                    }
                     addVideoToHistory(video, videoUrl);
 
                 } else {
@@ -180,6 +186,96 @@ document.addEventListener('DOMContentLoaded', function () {
             }
         }
         analyzeForm.addEventListener('submit', handleAnalysis);
+
+        // --- Phân tích hàng loạt: một vòng polling cho cả batch thay vì mỗi video một vòng ---
+        const bulkForm = document.getElementById('bulk-form');
+        if (bulkForm) {
+            const bulkUrlsInput = document.getElementById('bulk-urls-input');
+            const creatorInput = document.getElementById('creator-input');
+            const creatorMaxInput = document.getElementById('creator-max-input');
+            const bulkBtn = document.getElementById('bulk-btn');
+            const bulkProgress = document.getElementById('bulk-progress');
+            let batchPollingInterval;
+
+            function showBatchVideo(video) {
+                let card = historyList.querySelector(`.history-card[data-id="${video.id}"]`);
+                if (!card) card = addVideoToHistory(video, video.video_url);
+                card.dataset.status = video.status;
+            }
+
+            function updateBatchProgress(data) {
+                // Metadata vẫn đang được lấy ở background, chưa có video nào được tạo
+                if (data.status === 'PENDING') {
+                    bulkProgress.textContent = 'Đang lấy thông tin các video...';
+                    return;
+                }
+                data.existing_videos.forEach(showBatchVideo);
+                data.videos.forEach(showBatchVideo);
+                let text = `Hoàn tất ${data.completed}/${data.total} video`;
+                if (data.failed) text += ` · ${data.failed} lỗi`;
+                if (data.existing_videos.length) text += ` · ${data.existing_videos.length} video đã có`;
+                if (data.fetch_failed_count) text += ` · ${data.fetch_failed_count} liên kết không lấy được thông tin`;
+                bulkProgress.textContent = text;
+            }
+
+            function pollBatch(batchId) {
+                if (batchPollingInterval) clearInterval(batchPollingInterval);
+                batchPollingInterval = setInterval(async () => {
+                    try {
+                        const response = await fetch(`/api/tiktok-analyzer/batch/${batchId}/status/`);
+                        if (!response.ok) {
+                            clearInterval(batchPollingInterval);
+                            return;
+                        }
+                        const data = await response.json();
+                        updateBatchProgress(data);
+                        if (data.status === 'COMPLETE' || data.status === 'FAILED') {
+                            clearInterval(batchPollingInterval);
+                            if (data.fetch_errors.length) console.warn('Không lấy được thông tin:', data.fetch_errors);
+                        }
+                    } catch (error) {
+                        clearInterval(batchPollingInterval);
+                        console.error('Lỗi khi kiểm tra tiến độ batch:', error);
+                    }
+                }, 5000); // Kiểm tra mỗi 5 giây
+            }
+
+            async function handleBulkAnalysis(event) {
+                event.preventDefault();
+                const videoUrls = bulkUrlsInput.value.split(/\s+/).map(url => url.trim()).filter(Boolean);
+                const creator = creatorInput.value.trim();
+                if (videoUrls.length === 0 && !creator) {
+                    alert('Vui lòng nhập ít nhất một liên kết video hoặc tên creator.');
+                    return;
+                }
+
+                bulkBtn.disabled = true;
+                bulkProgress.textContent = 'Đang lấy thông tin các video...';
+                try {
+                    const response = await fetch('/api/tiktok-analyzer/bulk/submit/', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
+                        body: JSON.stringify({ video_urls: videoUrls, creator: creator, max_videos: parseInt(creatorMaxInput.value, 10) || null })
+                    });
+                    const data = await response.json();
+                    if (!response.ok) {
+                        bulkProgress.textContent = '';
+                        alert(data.error || 'Lỗi không xác định.');
+                        return;
+                    }
+
+                    bulkProgress.textContent = 'Đã nhận yêu cầu, đang lấy thông tin các video...';
+                    pollBatch(data.batch_id);
+                } catch (error) {
+                    console.error('Fetch Error:', error);
+                    bulkProgress.textContent = '';
+                    alert('Không thể kết nối đến server.');
+                } finally {
+                    bulkBtn.disabled = false;
+                }
+            }
+            bulkForm.addEventListener('submit', handleBulkAnalysis);
+        }
     }
 
     // --- Chức năng: Xóa Lịch sử ---